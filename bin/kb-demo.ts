@@ -28,10 +28,24 @@ const extractConfig = () => {
   }
   
 
+  // Optional Knowledge Base ingestion settings, see KBChunkingConfig and KBCrawlerConfig
+  const chunking = app.node.tryGetContext('chunking')
+  const crawler = app.node.tryGetContext('crawler')
+  const recrawlSchedule = app.node.tryGetContext('recrawlSchedule')
+  const indexProfile = app.node.tryGetContext('indexProfile')
+  const embeddingModel = app.node.tryGetContext('embeddingModel')
+  const embeddingDimensions = app.node.tryGetContext('embeddingDimensions')
+
   return {
     scrapeUrls,
     customerName,
-    customerIndustry
+    customerIndustry,
+    chunking,
+    crawler,
+    recrawlSchedule,
+    indexProfile,
+    embeddingModel,
+    embeddingDimensions
   }
 }
 
@@ -43,6 +57,12 @@ stackPrefix = "KB-" + stackPrefix.replace(/[^\w]/g, '');
 const kbStack = new KBStack(app, `${stackPrefix}-KBStack`, {
   scrapeUrls: (config.scrapeUrls + "").split(","),
   customerName: config.customerName,
+  chunking: config.chunking,
+  crawler: config.crawler,
+  recrawlSchedule: config.recrawlSchedule,
+  indexProfile: config.indexProfile,
+  embeddingModel: config.embeddingModel,
+  embeddingDimensions: config.embeddingDimensions,
 });
 
 const appStack = new AppStack(app, `${stackPrefix}-AppStack`, {
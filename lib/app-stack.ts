@@ -48,6 +48,12 @@ export class AppStack extends cdk.Stack {
           AWS_REGION: this.region,
           CUSTOMER_NAME: props.customerName,
           KNOWLEDGE_BASE_ID: props.knowledgeBaseId,
+          // One gunicorn gevent worker holds many concurrent SSE streams. Each extra worker repeats
+          // the startup build, thread pools, in-process caches and background threads, which a
+          // 256 CPU / 512 MiB task cannot afford; raise memory along with this count.
+          WEB_CONCURRENCY: '1',
+          GUNICORN_WORKER_CONNECTIONS: '500',
+          GUNICORN_GRACEFUL_TIMEOUT: '25',
         },
         taskRole,
       },
@@ -58,6 +64,9 @@ export class AppStack extends cdk.Stack {
       path: '/api/',
     });
 
+    // Give in-flight streams the same window to drain as gunicorn's graceful timeout
+    backendService.targetGroup.setAttribute('deregistration_delay.timeout_seconds', '30');
+
     const websiteBucket = new s3.Bucket(this, 'WebsiteBucket', {
       encryption: s3.BucketEncryption.S3_MANAGED,
       removalPolicy: cdk.RemovalPolicy.DESTROY, // Delete the bucket when the stack is destroyed
@@ -146,5 +155,35 @@ export class AppStack extends cdk.Stack {
       'PRODUCT_TABLE_NAME',
       productTable.tableName
     );
+
+    // Create DynamoDB table for warm-start snapshots of startup-time LLM calls
+    const warmStartTable = new dynamodb.Table(this, 'WarmStartTable', {
+      partitionKey: { name: 'key', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expires_at',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    warmStartTable.grantReadWriteData(taskRole);
+
+    backendService.taskDefinition.defaultContainer?.addEnvironment(
+      'WARM_START_TABLE',
+      warmStartTable.tableName
+    );
+
+    // Server-side chat memory, shared by every backend task
+    const conversationTable = new dynamodb.Table(this, 'ConversationTable', {
+      partitionKey: { name: 'conversation_id', type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expires_at',
+      removalPolicy: cdk.RemovalPolicy.DESTROY,
+    });
+
+    conversationTable.grantReadWriteData(taskRole);
+
+    backendService.taskDefinition.defaultContainer?.addEnvironment(
+      'CONVERSATION_TABLE',
+      conversationTable.tableName
+    );
   }
 }
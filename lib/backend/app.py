@@ -1,14 +1,31 @@
 from flask import Flask, request, Response, jsonify
 from flask_cors import CORS
 import os
-import boto3
 import json
 from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
-from botocore.config import Config
 import re
 from dotenv import load_dotenv
 from botocore.exceptions import ClientError
 import uuid
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import queue
+import threading
+import time
+from aws_clients import clients
+from caching import SemanticAnswerCache
+from telemetry import CONTEXT_TOKENS, WARM_START_FAILURES, InstrumentedBedrockClient, InstrumentedRetriever, in_current_context, recent_traces, registry, record_span, start_trace
+from kb_watcher import KnowledgeBaseWatcher
+from concurrency import AdaptiveLimiter, is_quota_error
+from dynamo_batch import BatchWriter
+from product_catalog import ProductCatalog
+from warm_start import WarmStartCache, FileSnapshotStore, DynamoDBSnapshotStore
+from retrieval_cache import CachingRetriever, cache_backend_from_url
+from reranking import RerankingRetriever
+from sse import SSEWriter, negotiate_encoding
+from conversations import Conversation, ConversationMemory, DynamoDBConversationStore
+from context_budget import ContextBudgeter, DEFAULT_CONTEXT_BUDGET
+from intent_router import IntentRouter, RouteDecision, RETRIEVE_INFORMATION, VISUALIZE_PRODUCTS
 
 # Check if any of the required environment variables are missing
 required_env_vars = ["AWS_REGION", "CUSTOMER_NAME", "KNOWLEDGE_BASE_ID"]
@@ -25,24 +42,67 @@ customer_name = os.environ["CUSTOMER_NAME"]
 knowledge_base_id = os.environ["KNOWLEDGE_BASE_ID"]
 
 # AWS setup
-config = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
-BEDROCK_CLIENT = boto3.client("bedrock-runtime", 'us-east-1', config=config)
-DYNAMODB_CLIENT = boto3.client('dynamodb', region_name=aws_region)
+# Clients are shared per process with connection pools sized to the server's concurrency.
+# BEDROCK_REGIONS lists the regions to fail over through for model calls, in order.
+bedrock_regions = [region.strip() for region in os.environ.get('BEDROCK_REGIONS', 'us-east-1').split(',') if region.strip()]
+BEDROCK_CLIENT = InstrumentedBedrockClient(clients.failover_client("bedrock-runtime", bedrock_regions))
+# For calls paced by an AdaptiveLimiter: botocore does not retry, so the limiter sees every
+# throttle and shrinks its concurrency instead of botocore backing off out of its sight
+BEDROCK_LIMITED_CLIENT = InstrumentedBedrockClient(
+    clients.failover_client("bedrock-runtime", bedrock_regions, max_attempts=0))
+DYNAMODB_CLIENT = clients.client('dynamodb', aws_region)
+BEDROCK_AGENT_CLIENT = clients.client('bedrock-agent', aws_region)
+BEDROCK_AGENT_RUNTIME_CLIENT = clients.client('bedrock-agent-runtime', aws_region)
 
 # Get the DynamoDB table name from environment variable
 PRODUCT_TABLE_NAME = os.environ.get('PRODUCT_TABLE_NAME', f"{customer_name}-kb-products")
 
+# Retrievers over-fetch RETRIEVAL_OVERFETCH times the documents they need and rerank them locally.
+# RETRIEVAL_SEARCH_TYPE=HYBRID combines keyword and vector search in the Knowledge Base itself.
+RETRIEVAL_OVERFETCH = int(os.environ.get('RETRIEVAL_OVERFETCH', 3))
+RETRIEVAL_SEARCH_TYPE = os.environ.get('RETRIEVAL_SEARCH_TYPE')
+RERANK_LEXICAL_WEIGHT = float(os.environ.get('RERANK_LEXICAL_WEIGHT', 0.4))
+
+def vector_search_configuration(number_of_results):
+    configuration = {"numberOfResults": number_of_results * RETRIEVAL_OVERFETCH}
+    if RETRIEVAL_SEARCH_TYPE:
+        configuration["overrideSearchType"] = RETRIEVAL_SEARCH_TYPE
+    return {"vectorSearchConfiguration": configuration}
+
 # Retriever setup
-retriever = AmazonKnowledgeBasesRetriever(
+retriever = InstrumentedRetriever(AmazonKnowledgeBasesRetriever(
     knowledge_base_id=knowledge_base_id,
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 5}},
-)
+    client=BEDROCK_AGENT_RUNTIME_CLIENT,
+    retrieval_config=vector_search_configuration(5),
+), "chat")
 
 # Products retriever setup
-products_retriever = AmazonKnowledgeBasesRetriever(
+products_retriever = InstrumentedRetriever(AmazonKnowledgeBasesRetriever(
     knowledge_base_id=knowledge_base_id,
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 10}},
+    client=BEDROCK_AGENT_RUNTIME_CLIENT,
+    retrieval_config=vector_search_configuration(10),
+), "products")
+
+# Watch for completed ingestion jobs so caches never serve answers from before a re-crawl
+kb_watcher = KnowledgeBaseWatcher(
+    BEDROCK_AGENT_CLIENT,
+    knowledge_base_id,
+    interval_seconds=int(os.environ.get('KB_SYNC_CHECK_INTERVAL', 300)),
 )
+kb_watcher.start()
+
+# Cache retrieval results; queries such as the product detail sections repeat across users.
+# RETRIEVAL_CACHE_BACKEND=sqlite:///path or redis://host:port/db shares hits between workers and containers.
+retrieval_cache_backend = cache_backend_from_url(os.environ.get('RETRIEVAL_CACHE_BACKEND'))
+retrieval_cache_ttl = int(os.environ.get('RETRIEVAL_CACHE_TTL_SECONDS', 3600))
+chat_retrieval_cache = CachingRetriever(retriever, ttl_seconds=retrieval_cache_ttl, backend=retrieval_cache_backend)
+products_retrieval_cache = CachingRetriever(products_retriever, ttl_seconds=retrieval_cache_ttl, backend=retrieval_cache_backend)
+kb_watcher.add_listener(chat_retrieval_cache.clear)
+kb_watcher.add_listener(products_retrieval_cache.clear)
+
+# Cached candidates are reranked on every call; only the top documents reach the prompts
+retriever = RerankingRetriever(chat_retrieval_cache, top_k=5, name="chat", lexical_weight=RERANK_LEXICAL_WEIGHT)
+products_retriever = RerankingRetriever(products_retrieval_cache, top_k=10, name="products", lexical_weight=RERANK_LEXICAL_WEIGHT)
 
 system_prompt = """
 You are a helpful assistant that works for {customer_name}. You are an expert at answering questions about {customer_name} and their products and services. 
@@ -83,11 +143,20 @@ A:
 response_cache = {}
 
 customer_info_cache_key = f"customer_info_response_{customer_name}"
-        
-if customer_info_cache_key in response_cache:
-    customer_info = response_cache[customer_info_cache_key]
-else:
-    customer_info_prompt = f"Who is {customer_name}? Provide a brief description of the company and its main business areas."
+chat_suggested_questions_cache_key = f"chat_suggested_questions_{customer_name}"
+
+customer_info_prompt = f"Who is {customer_name}? Provide a brief description of the company and its main business areas."
+
+chat_suggested_questions_template = """Based on this information about {customer_name}: {customer_info}, generate 3-5 very short questions about the company. 
+    Wrap your response in <question> tags. 
+
+    Example:
+
+    <question>What is {customer_name}'s primary business?</question>
+    <question>What are {customer_name}'s main products and services?</question>
+    """
+
+def build_startup_artifacts():
     customer_info_docs = products_retriever.get_relevant_documents(f"{customer_name} company and business areas")
     customer_info_context = "\n".join([doc.page_content for doc in customer_info_docs])
     
@@ -97,22 +166,8 @@ else:
         inferenceConfig={"maxTokens": 500, "temperature": 0, "topP": 1},
     )
     customer_info = customer_info_response["output"]["message"]["content"][0]["text"]
-    
-    response_cache[customer_info_cache_key] = customer_info
-
-chat_suggested_questions_cache_key = f"chat_suggested_questions_{customer_name}"
 
-if chat_suggested_questions_cache_key in response_cache:
-    chat_suggested_questions = response_cache[chat_suggested_questions_cache_key]
-else:
-    chat_suggested_questions_prompt = f"""Based on this information about {customer_name}: {customer_info}, generate 3-5 very short questions about the company. 
-    Wrap your response in <question> tags. 
-
-    Example:
-
-    <question>What is {customer_name}'s primary business?</question>
-    <question>What are {customer_name}'s main products and services?</question>
-    """
+    chat_suggested_questions_prompt = chat_suggested_questions_template.format(customer_name=customer_name, customer_info=customer_info)
     chat_suggested_questions = BEDROCK_CLIENT.converse(
         modelId="anthropic.claude-3-haiku-20240307-v1:0",
         messages=[{"role": "user", "content": [{"text": chat_suggested_questions_prompt}]}],
@@ -122,7 +177,85 @@ else:
     suggested_questions_text = chat_suggested_questions["output"]["message"]["content"][0]["text"]
     suggested_questions_list = re.findall(r'<question>(.*?)</question>', suggested_questions_text)
     print(f"Suggested questions: {suggested_questions_list}")
-    response_cache[chat_suggested_questions_cache_key] = suggested_questions_list
+    return {
+        customer_info_cache_key: customer_info,
+        chat_suggested_questions_cache_key: suggested_questions_list,
+    }
+
+def load_startup_artifacts(artifacts):
+    response_cache.update(artifacts)
+
+# Persist the startup artifacts so restarts and scale-out serve the previous snapshot
+# instead of blocking on model calls. The version changes with anything the prompts depend on.
+# WARM_START_TABLE stores snapshots in DynamoDB so every container shares them, otherwise
+# they are kept in WARM_START_DIR on local disk.
+warm_start_version = hashlib.sha256(json.dumps([
+    1, customer_name, knowledge_base_id, customer_info_prompt, chat_suggested_questions_template,
+]).encode('utf-8')).hexdigest()[:16]
+if os.environ.get('WARM_START_TABLE'):
+    warm_start_store = DynamoDBSnapshotStore(DYNAMODB_CLIENT, os.environ['WARM_START_TABLE'])
+else:
+    warm_start_store = FileSnapshotStore(os.environ.get('WARM_START_DIR', '/tmp/warm-start'))
+warm_start = WarmStartCache(
+    warm_start_store,
+    version=warm_start_version,
+    ttl_seconds=int(os.environ.get('WARM_START_TTL_SECONDS', 24 * 3600)),
+    refresh_mode=os.environ.get('WARM_START_REFRESH', 'background'),
+    on_failure=lambda key, error: WARM_START_FAILURES.inc(key=key),
+)
+startup_artifacts_key = f"startup-{customer_name}"
+warm_start.load(
+    startup_artifacts_key,
+    build_startup_artifacts,
+    load_startup_artifacts,
+    default={customer_info_cache_key: "", chat_suggested_questions_cache_key: []},
+)
+# Regenerate the company summary and suggested questions after a re-crawl
+kb_watcher.add_listener(lambda: warm_start.refresh(startup_artifacts_key, build_startup_artifacts, load_startup_artifacts))
+
+@app.before_request
+def start_request_trace():
+    # Bedrock and retrieval calls made while serving this request are recorded as spans of its trace
+    start_trace(f"{request.method} {request.path}")
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/traces', methods=['GET'])
+def get_traces():
+    limit = request.args.get('limit', default=50, type=int)
+    return jsonify([trace.to_dict() for trace in list(recent_traces)[-limit:]])
+
+# SSE responses must not be buffered by proxies or cached by browsers
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no',
+}
+
+# Text deltas are coalesced for SSE_COALESCE_MS or until SSE_MAX_BATCH_BYTES are pending, and a
+# comment is sent every SSE_HEARTBEAT_SECONDS while a stream is idle so proxies keep it open
+SSE_COALESCE_SECONDS = int(os.environ.get('SSE_COALESCE_MS', 50)) / 1000
+SSE_MAX_BATCH_BYTES = int(os.environ.get('SSE_MAX_BATCH_BYTES', 2048))
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+SSE_COMPRESSION = os.environ.get('SSE_COMPRESSION', 'true').lower() == 'true'
+
+def stream_response(events):
+    # `events` yields event dicts; each becomes a `data: {json}` frame
+    encoding = negotiate_encoding(request.headers.get('Accept-Encoding')) if SSE_COMPRESSION else None
+    headers = dict(SSE_HEADERS)
+    if encoding:
+        headers['Content-Encoding'] = encoding
+        headers['Vary'] = 'Accept-Encoding'
+    writer = SSEWriter(
+        events,
+        coalesce_seconds=SSE_COALESCE_SECONDS,
+        max_bytes=SSE_MAX_BATCH_BYTES,
+        heartbeat_seconds=SSE_HEARTBEAT_SECONDS,
+        encoding=encoding,
+        run=in_current_context,
+    )
+    return Response(writer, mimetype='text/event-stream', headers=headers)
 
 @app.route('/api/', methods=['GET'])
 def index():
@@ -177,10 +310,7 @@ TOOL_CONFIG = {
 # Add this function to generate the visualization data
 def visualize_products(question):
     # Fetch all products from DynamoDB
-    response = DYNAMODB_CLIENT.scan(
-        TableName=PRODUCT_TABLE_NAME
-    )
-    products = response['Items']
+    products = product_catalog.all(attributes=['display_name', 'description'])
 
     # Convert DynamoDB items to a list of dictionaries
     product_list = [
@@ -248,6 +378,277 @@ def visualize_products(question):
 
     return visualization_data
 
+def route_with_bedrock(question):
+    # Use tool calling to determine which tool to use
+    response = BEDROCK_CLIENT.converse(
+        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+        system=[{"text": system_prompt}],
+        messages=[
+            {"role": "user", "content": [{"text": f"Question: {question}"}]}
+        ],
+        inferenceConfig={"maxTokens": 512, "temperature": 0, "topP": 1},
+        toolConfig=TOOL_CONFIG
+    )
+    print(f"Response: {response}")
+    if response["stopReason"] == "tool_use":
+        tool_call = next(item["toolUse"] for item in response["output"]["message"]["content"] if "toolUse" in item)
+        return RouteDecision(tool_call["name"], tool_call["input"]["question"], 1.0, "model")
+    print("No tools called, using default behavior")
+    return RouteDecision(RETRIEVE_INFORMATION, question, 0.0, "model")
+
+# Classify intent locally and only pay for the Bedrock tool call when unsure.
+# Set INTENT_ROUTER=bedrock to always route through the model.
+intent_router = IntentRouter(
+    fallback=route_with_bedrock,
+    min_confidence=float(os.environ.get('INTENT_ROUTER_MIN_CONFIDENCE', 0.5)),
+    enabled=os.environ.get('INTENT_ROUTER', 'local') != 'bedrock',
+)
+
+@app.route('/api/router-stats', methods=['GET'])
+def get_router_stats():
+    return jsonify(intent_router.stats())
+
+def embed_question(text):
+    response = BEDROCK_CLIENT.invoke_model(
+        modelId="amazon.titan-embed-text-v1",
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps({"inputText": text}),
+    )
+    return json.loads(response["body"].read())["embedding"]
+
+# Semantic cache of complete chat answers, keyed by rewritten question and prompt modifier
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', 'true').lower() == 'true'
+answer_cache = SemanticAnswerCache(
+    embed=embed_question,
+    threshold=float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.95)),
+    max_entries=int(os.environ.get('ANSWER_CACHE_MAX_ENTRIES', 500)),
+    ttl_seconds=int(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 6 * 3600)),
+    max_bytes=int(os.environ.get('ANSWER_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+)
+kb_watcher.add_listener(answer_cache.clear)
+
+def lookup_cached_answer(question, prompt_modifier):
+    if not ANSWER_CACHE_ENABLED:
+        return None, None
+    try:
+        return answer_cache.lookup(question, prompt_modifier)
+    except Exception as e:
+        print(f"Error looking up answer cache: {e}")
+        return None, None
+
+def lookup_exact_answer(question, prompt_modifier):
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    try:
+        return answer_cache.lookup_exact(question, prompt_modifier)
+    except Exception as e:
+        print(f"Error looking up answer cache: {e}")
+        return None
+
+@app.route('/api/client-stats', methods=['GET'])
+def get_client_stats():
+    return jsonify({'pools': clients.pool_stats(), 'bedrock_regions': bedrock_regions})
+
+@app.route('/api/cache-stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({
+        'knowledge_base_version': kb_watcher.version,
+        'answers': answer_cache.stats(),
+        'retrieval': chat_retrieval_cache.stats(),
+        'products_retrieval': products_retrieval_cache.stats(),
+        'product_catalog': product_catalog.stats(),
+        'warm_start': warm_start.stats(),
+    })
+
+@app.route('/api/retrieval-stats', methods=['GET'])
+def get_retrieval_stats():
+    return jsonify({
+        'search_type': RETRIEVAL_SEARCH_TYPE or 'DEFAULT',
+        'overfetch': RETRIEVAL_OVERFETCH,
+        'chat': retriever.stats(),
+        'products': products_retriever.stats(),
+    })
+
+def rewrite_question(question_to_answer, conversation):
+    cached = conversation.cached_rewrite(question_to_answer)
+    if cached is not None:
+        print(f"Reusing rewrite for: {question_to_answer}")
+        return cached
+    rewrite_prompt = condense_question_template.format(chat_history=conversation.history_text(), question=question_to_answer)
+    try:
+        rewrite_response = BEDROCK_CLIENT.converse(
+            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+            system=[{"text": system_prompt}],
+            messages=[{"role": "user", "content": [{"text": rewrite_prompt}]}],
+            inferenceConfig={"maxTokens": 512, "temperature": 0, "topP": 1},
+        )
+        rewritten_question = rewrite_response["output"]["message"]["content"][0]["text"].strip()
+    except Exception as e:
+        print(f"Error in question rewriting: {e}")
+        return question_to_answer
+    conversation_memory.remember_rewrite(conversation, question_to_answer, rewritten_question)
+    return rewritten_question
+
+def summarize_turns(summary, turns):
+    # Folds older turns into the running conversation summary; Haiku keeps this cheap
+    transcript = "\n".join(f"Human: {question}\nAI: {answer}" for question, answer in turns)
+    prompt = (f"Summary so far: {summary or 'None'}\n\nNew conversation turns:\n{transcript}\n\n"
+              "Update the summary so far with the new turns in at most five sentences. Keep the products, "
+              "topics and facts the user asked about. Return only the summary.")
+    response = BEDROCK_CLIENT.converse(
+        modelId="anthropic.claude-3-haiku-20240307-v1:0",
+        messages=[{"role": "user", "content": [{"text": prompt}]}],
+        inferenceConfig={"maxTokens": 300, "temperature": 0},
+    )
+    return response["output"]["message"]["content"][0]["text"].strip()
+
+# Conversations are kept on the server by conversation_id, so clients do not resend the history.
+# CONVERSATION_TABLE shares them between workers and containers.
+conversation_ttl = int(os.environ.get('CONVERSATION_TTL_SECONDS', 6 * 3600))
+conversation_memory = ConversationMemory(
+    summarize=summarize_turns,
+    executor=ThreadPoolExecutor(max_workers=int(os.environ.get('CONVERSATION_SUMMARY_WORKERS', 4))),
+    store=DynamoDBConversationStore(DYNAMODB_CLIENT, os.environ['CONVERSATION_TABLE'], conversation_ttl)
+    if os.environ.get('CONVERSATION_TABLE') else None,
+    max_turns=int(os.environ.get('CONVERSATION_MAX_TURNS', 4)),
+    ttl_seconds=conversation_ttl,
+)
+
+@app.route('/api/conversation-stats', methods=['GET'])
+def get_conversation_stats():
+    return jsonify(conversation_memory.stats())
+
+def question_similarity(first, second):
+    # Jaccard overlap of the word sets of two questions
+    first_words = set(re.findall(r"[a-z0-9]+", first.lower()))
+    second_words = set(re.findall(r"[a-z0-9]+", second.lower()))
+    if not first_words or not second_words:
+        return 0.0
+    return len(first_words & second_words) / len(first_words | second_words)
+
+# Retrieved documents are trimmed to a per-model token budget before they go into a prompt.
+# CONTEXT_TOKEN_BUDGET overrides the budget for every model.
+context_budgeter = ContextBudgeter(
+    budgets={} if 'CONTEXT_TOKEN_BUDGET' in os.environ else None,
+    default_budget=int(os.environ.get('CONTEXT_TOKEN_BUDGET', DEFAULT_CONTEXT_BUDGET)),
+    duplicate_threshold=float(os.environ.get('CONTEXT_DUPLICATE_THRESHOLD', 0.8)),
+)
+
+def budget_context(query, docs, model_id):
+    # Returns the passages to put in the prompt, each paired with the document it came from
+    started_at = time.time()
+    start = time.perf_counter()
+    selection = context_budgeter.select(query, docs, model_id)
+    CONTEXT_TOKENS.observe(selection.tokens, model=model_id)
+    record_span("context.budget", started_at, time.perf_counter() - start,
+                documents=len(docs), included=len(selection.passages),
+                original_tokens=selection.original_tokens, tokens=selection.tokens)
+    if selection.tokens < selection.original_tokens:
+        print(f"Context trimmed from ~{selection.original_tokens} to ~{selection.tokens} tokens "
+              f"({len(selection.passages)} of {len(docs)} documents, {selection.dropped_duplicates} duplicates)")
+    return selection.passages
+
+# Threads for retrieval calls started ahead of the question rewrite
+RETRIEVAL_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('RETRIEVAL_WORKERS', 16)))
+# Minimum similarity between the raw and rewritten question to reuse the speculative retrieval
+SPECULATIVE_REUSE_THRESHOLD = float(os.environ.get('SPECULATIVE_REUSE_THRESHOLD', 0.7))
+ANSWER_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+def cached_answer_events(cached_events):
+    # Yields a cached answer's events and returns the answer text
+    for event in cached_events:
+        yield event
+    return "".join(event['content'] for event in cached_events if event.get('type') == 'content')
+
+def answer_question(question_to_answer, conversation, prompt_modifier):
+    # Yields the answer's events and returns the answer text
+    # An exact repeat is answered before any retrieval starts. Without history the raw question
+    # is the standalone one; with history only an already known rewrite can be looked up.
+    known_question = conversation.cached_rewrite(question_to_answer) if conversation.has_history else question_to_answer
+    if known_question is not None:
+        cached_events = lookup_exact_answer(known_question, prompt_modifier)
+        if cached_events is not None:
+            print(f"Answer cache hit for: {known_question}")
+            return (yield from cached_answer_events(cached_events))
+
+    # Start retrieval for the raw question right away. It overlaps the rewrite and the
+    # semantic answer cache lookup, and most follow-ups rewrite to nearly the same text anyway.
+    speculative_docs = RETRIEVAL_EXECUTOR.submit(in_current_context(retriever.get_relevant_documents), question_to_answer)
+    if conversation.has_history:
+        rewritten_question = rewrite_question(question_to_answer, conversation)
+    else:
+        print(f"No chat history, using original question: {question_to_answer}")
+        rewritten_question = question_to_answer
+    print(f"Rewritten question: {rewritten_question}")
+
+    cached_events, question_embedding = lookup_cached_answer(rewritten_question, prompt_modifier)
+    if cached_events is not None:
+        print(f"Answer cache hit for: {rewritten_question}")
+        # Usually already running, so this only saves the retrieval while it is still queued
+        speculative_docs.cancel()
+        return (yield from cached_answer_events(cached_events))
+
+    docs = None
+    similarity = question_similarity(question_to_answer, rewritten_question)
+    if similarity >= SPECULATIVE_REUSE_THRESHOLD:
+        try:
+            docs = speculative_docs.result()
+        except Exception as e:
+            print(f"Error in speculative retrieval: {e}")
+    else:
+        print(f"Rewrite diverged from the original question (similarity {similarity:.2f}), retrieving again")
+        speculative_docs.cancel()
+    if docs is None:
+        docs = retriever.get_relevant_documents(rewritten_question)
+
+    passages = budget_context(rewritten_question, docs, ANSWER_MODEL_ID)
+    context = "\n".join([passage.text for passage in passages])
+
+    # Extract sources from the documents that made it into the context
+    sources = []
+    for doc in [passage.document for passage in passages]:
+        if doc.metadata['location'] != "":
+            url = doc.metadata['location']['webLocation']['url']
+            if url not in sources:
+                sources.append(url)
+
+    # Yield the sources immediately
+    metadata_event = {'type': 'metadata', 'sources': sources}
+    yield metadata_event
+
+    # Construct the prompt
+    prompt = template.format(
+        customer_name=customer_name,
+        prompt_modifier=prompt_modifier,
+        context=context,
+        question=rewritten_question
+    )
+
+    # Generate the response
+    response = BEDROCK_CLIENT.converse_stream(
+        modelId=ANSWER_MODEL_ID,
+        system=[{"text": system_prompt}],
+        messages=[{"role": "user", "content": [{"text": prompt}]}],
+        inferenceConfig={
+            "temperature": 0,
+            "maxTokens": 1000,
+        }
+    )
+
+    answer = ""
+    for chunk in response["stream"]:
+        if "contentBlockDelta" in chunk:
+            text = chunk["contentBlockDelta"]["delta"]["text"]
+            answer += text
+            yield {'type': 'content', 'content': text}
+
+    # Only complete answers are cached, a client disconnect stops the generator before this point
+    if ANSWER_CACHE_ENABLED and question_embedding is not None:
+        answer_cache.store(rewritten_question, prompt_modifier,
+                           [metadata_event, {'type': 'content', 'content': answer}], question_embedding)
+    return answer
+
 @app.route('/api/chat', methods=['POST'])
 def chat():
     data = request.json
@@ -255,170 +656,48 @@ def chat():
     chat_history = data.get('chat_history', [])
     prompt_modifier = data.get('prompt_modifier', "Informative, empathetic, and friendly")
 
-    print(f"Chat history: {chat_history}")
+    # Clients that send a conversation_id only send chat_history to restore a conversation the
+    # server no longer has; older clients send the whole history with every question
+    conversation_id = data.get('conversation_id')
+    if conversation_id:
+        conversation = conversation_memory.get(conversation_id, chat_history)
+    else:
+        conversation = Conversation.from_history(None, chat_history)
+    print(f"Conversation {conversation_id}: {len(conversation.turns)} turns, summary {'yes' if conversation.summary else 'no'}")
+
     def generate():
-        question = data['question']
-        # Use tool calling to determine which tool to use
-        response = BEDROCK_CLIENT.converse(
-            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-            system=[{"text": system_prompt}],
-            messages=[
-                {"role": "user", "content": [{"text": f"Question: {question}"}]}
-            ],
-            inferenceConfig={"maxTokens": 512, "temperature": 0, "topP": 1},
-            toolConfig=TOOL_CONFIG
-        )
-        print(f"Response: {response}")
-        if response["stopReason"] == "tool_use":
-            tool_call = next(item["toolUse"] for item in response["output"]["message"]["content"] if "toolUse" in item)
-            if tool_call["name"] == "retrieve_information":
-                question_to_answer = tool_call["input"]["question"]
-                
-                # Rewrite question if there's chat history
-                if len(chat_history) >= 2:
-                    chat_history_str = "\n".join([f"Human: {chat_history[i]}\nAI: {chat_history[i+1]}" for i in range(0, len(chat_history) - 1, 2)])
-                    rewrite_prompt = condense_question_template.format(chat_history=chat_history_str, question=question_to_answer)
-                    try:
-                        rewrite_response = BEDROCK_CLIENT.converse(
-                            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                            system=[{"text": system_prompt}],
-                            messages=[{"role": "user", "content": [{"text": rewrite_prompt}]}],
-                            inferenceConfig={"maxTokens": 512, "temperature": 0, "topP": 1},
-                        )
-                        rewritten_question = rewrite_response["output"]["message"]["content"][0]["text"]
-                    except Exception as e:
-                        print(f"Error in question rewriting: {e}")
-                        rewritten_question = question_to_answer
-                else:
-                    print(f"No chat history, using original question: {question_to_answer}")
-                    rewritten_question = question_to_answer
-                print(f"Rewritten question: {rewritten_question}")
-
-                # Retrieve relevant documents
-                docs = retriever.get_relevant_documents(rewritten_question)
-                context = "\n".join([doc.page_content for doc in docs])
-
-                # Extract sources
-                sources = []
-                for doc in docs:
-                    if doc.metadata['location'] != "":
-                        url = doc.metadata['location']['webLocation']['url']
-                        if url not in sources:
-                            sources.append(url)
-
-                # Yield the sources immediately
-                yield f"data: {json.dumps({'type': 'metadata', 'sources': sources})}\n\n"
-
-                # Construct the prompt
-                prompt = template.format(
-                    customer_name=customer_name,
-                    prompt_modifier=prompt_modifier,
-                    context=context,
-                    question=rewritten_question
-                )
-
-                # Generate the response
-                response = BEDROCK_CLIENT.converse_stream(
-                    modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                    system=[{"text": system_prompt}],
-                    messages=[{"role": "user", "content": [{"text": prompt}]}],
-                    inferenceConfig={
-                        "temperature": 0,
-                        "maxTokens": 1000,
-                    }
-                )
-
-                for chunk in response["stream"]:
-                    if "contentBlockDelta" in chunk:
-                        text = chunk["contentBlockDelta"]["delta"]["text"]
-                        yield f"data: {json.dumps({'type': 'content', 'content': text})}\n\n"
-            elif tool_call["name"] == "visualize_products":
-                question = tool_call["input"]["question"]
-                visualization_data = visualize_products(question)
-                yield f"data: {json.dumps({'type': 'visualization', 'content': visualization_data})}\n\n"
-        
+        decision = intent_router.route(data['question'])
+        if decision.route == VISUALIZE_PRODUCTS:
+            visualization_data = visualize_products(decision.question)
+            yield {'type': 'visualization', 'content': visualization_data}
+            answer = f"(Showed a chart: {visualization_data.get('title', '')})" if isinstance(visualization_data, dict) else ""
         else:
-            print("No tools called, using default behavior")
-            # Default behavior (existing logic)
-            question_to_answer = question
-            
-            # Rewrite question if there's chat history
-            if len(chat_history) >= 2:
-                chat_history_str = "\n".join([f"Human: {chat_history[i]}\nAI: {chat_history[i+1]}" for i in range(0, len(chat_history) - 1, 2)])
-                rewrite_prompt = condense_question_template.format(chat_history=chat_history_str, question=question_to_answer)
-                try:
-                    rewrite_response = BEDROCK_CLIENT.converse(
-                        modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                        system=[{"text": system_prompt}],
-                        messages=[{"role": "user", "content": [{"text": rewrite_prompt}]}],
-                        inferenceConfig={"maxTokens": 512, "temperature": 0, "topP": 1},
-                    )
-                    rewritten_question = rewrite_response["output"]["message"]["content"][0]["text"]
-                except Exception as e:
-                    print(f"Error in question rewriting: {e}")
-                    rewritten_question = question_to_answer
-            else:
-                print(f"No chat history, using original question: {question_to_answer}")
-                rewritten_question = question_to_answer
-            print(f"Rewritten question: {rewritten_question}")
-
-            # Retrieve relevant documents
-            docs = retriever.get_relevant_documents(rewritten_question)
-            context = "\n".join([doc.page_content for doc in docs])
-
-            # Extract sources
-            sources = []
-            for doc in docs:
-                if doc.metadata['location'] != "":
-                    url = doc.metadata['location']['webLocation']['url']
-                    if url not in sources:
-                        sources.append(url)
-
-            # Yield the sources immediately
-            yield f"data: {json.dumps({'type': 'metadata', 'sources': sources})}\n\n"
-
-            # Construct the prompt
-            prompt = template.format(
-                customer_name=customer_name,
-                prompt_modifier=prompt_modifier,
-                context=context,
-                question=rewritten_question
-            )
+            answer = yield from answer_question(decision.question, conversation, prompt_modifier)
 
-            # Generate the response
-            response = BEDROCK_CLIENT.converse_stream(
-                modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                system=[{"text": system_prompt}],
-                messages=[{"role": "user", "content": [{"text": prompt}]}],
-                inferenceConfig={
-                    "temperature": 0,
-                    "maxTokens": 1000,
-                }
-            )
+        if conversation_id:
+            conversation_memory.add_turn(conversation, data['question'], answer)
+        yield {'type': 'stop'}
 
-            for chunk in response["stream"]:
-                if "contentBlockDelta" in chunk:
-                    text = chunk["contentBlockDelta"]["delta"]["text"]
-                    yield f"data: {json.dumps({'type': 'content', 'content': text})}\n\n"
-        
-            
-            
+    return stream_response(generate())
 
-        yield f"data: {json.dumps({'type': 'stop'})}\n\n"
+# Product list reads only fetch the attributes the catalog needs, never the large product_details
+PRODUCT_LIST_ATTRIBUTES = ['name', 'display_name', 'description', 'external_link', 'internal_link', 'icon']
 
-    return Response(generate(), mimetype='text/event-stream')
+product_catalog = ProductCatalog(
+    DYNAMODB_CLIENT,
+    PRODUCT_TABLE_NAME,
+    scan_segments=int(os.environ.get('CATALOG_SCAN_SEGMENTS', 4)),
+    cache_ttl_seconds=int(os.environ.get('CATALOG_CACHE_TTL_SECONDS', 300)),
+)
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
     limit = request.args.get('limit', default=12, type=int)
+    cursor = request.args.get('cursor')
     def generate():
         try:
-            # Scan the DynamoDB table to get all products
-            response = DYNAMODB_CLIENT.scan(
-                TableName=PRODUCT_TABLE_NAME,
-                Limit=limit
-            )
-            products = response.get('Items', [])
+            # Read one page of the catalog, the stop event carries the cursor of the next page
+            products, next_cursor = product_catalog.page(limit, cursor, attributes=PRODUCT_LIST_ATTRIBUTES)
 
             for product in products:
                 # Convert DynamoDB format to regular dictionary
@@ -430,151 +709,246 @@ def get_products():
                     'internal_link': product['internal_link']['S'],
                     'icon': product['icon']['S']
                 }
-                yield f"data: {json.dumps(product_dict)}\n\n"
+                yield product_dict
 
-            if not products:
+            if not products and not cursor:
                 # If no products in DynamoDB, generate them as before
                 for product in generate_products(limit):
-                    yield f"data: {json.dumps(product)}\n\n"
+                    yield product
 
-            yield f"data: {json.dumps({'type': 'stop'})}\n\n"
+            yield {'type': 'stop', 'next_cursor': next_cursor}
         except Exception as e:
             print(f"Error retrieving products: {str(e)}")
-            yield f"data: {json.dumps({'error': 'Failed to retrieve products'})}\n\n"
+            yield {'error': 'Failed to retrieve products'}
 
-    return Response(generate(), mimetype='text/event-stream')
+    return stream_response(generate())
 
 @app.route('/api/products', methods=['POST'])
 def add_product():
     try:
         new_product = request.json
-        new_product['name'] = new_product['name'].lower().replace(" ", "-").replace("/", "-").replace("&", "-")
+        if isinstance(new_product, list):
+            # Bulk import, written in batches of 25
+            writer = BatchWriter(DYNAMODB_CLIENT, PRODUCT_TABLE_NAME)
+            items = []
+            invalid = 0
+            for product in new_product:
+                try:
+                    items.append(product_item(product))
+                except ValueError as e:
+                    print(f"Skipping product: {str(e)}")
+                    invalid += 1
+            written = writer.write_all(items)
+            product_catalog.invalidate()
+            if writer.failed or invalid:
+                return jsonify({'error': 'Failed to add some products', 'added': written, 'failed': len(writer.failed) + invalid}), 500
+            return jsonify({'message': 'Products added successfully', 'added': written}), 201
 
         DYNAMODB_CLIENT.put_item(
             TableName=PRODUCT_TABLE_NAME,
-            Item={
-                'name': {'S': new_product['name']},
-                'display_name': {'S': new_product['display_name']},
-                'description': {'S': new_product['description']},
-                'external_link': {'S': new_product.get('external_link', '#')},
-                'internal_link': {'S': new_product['internal_link']},
-                'icon': {'S': new_product.get('icon', 'cube')}
-            }
+            Item=product_item(new_product)
         )
+        product_catalog.invalidate()
         return jsonify({'message': 'Product added successfully'}), 201
     except Exception as e:
         print(f"Error adding new product: {str(e)}")
         return jsonify({'error': 'Failed to add new product'}), 500
 
+def product_item(product):
+    # Convert a product dictionary to a DynamoDB item, raising ValueError if it cannot be stored
+    if not isinstance(product, dict):
+        raise ValueError(f"Product is not an object: {product!r}")
+    missing = [key for key in ('name', 'display_name', 'description')
+               if not isinstance(product.get(key), str) or not product[key].strip()]
+    if missing:
+        raise ValueError(f"Product is missing {', '.join(missing)}")
+    name = product['name'].lower().replace(" ", "-").replace("/", "-").replace("&", "-")
+    return {
+        'name': {'S': name},
+        'display_name': {'S': product['display_name']},
+        'description': {'S': product['description']},
+        'external_link': {'S': str(product.get('external_link') or '#')},
+        'internal_link': {'S': str(product.get('internal_link') or f"/product/{name}")},
+        'icon': {'S': str(product.get('icon') or 'cube')}
+    }
+
+# Bounds the per-document extraction calls and backs off when Bedrock throttles
+PRODUCT_EXTRACTION_CONCURRENCY = int(os.environ.get('PRODUCT_EXTRACTION_CONCURRENCY', 5))
+EXTRACTION_EXECUTOR = ThreadPoolExecutor(max_workers=PRODUCT_EXTRACTION_CONCURRENCY)
+extraction_limiter = AdaptiveLimiter(max_concurrency=PRODUCT_EXTRACTION_CONCURRENCY)
+
+def extract_products(question, doc, cancelled):
+    # Returns the products extracted from one document, or an empty list on failure
+    if cancelled.is_set():
+        return []
+
+    extraction_prompt = f"""
+    Extract structured product or service information from the following text, focusing on answering: {question}
+    
+    Return the result as a JSON array of objects with the following structure:
+    [
+        {{
+            "name": "Specific product or service name",
+            "description": "A brief, clear description of the product or service",
+            "link": "URL to the product or service page if available, otherwise null",
+            "icon": "An appropriate Font Awesome icon name (without the 'fa-' prefix) that represents this product or service"
+        }}
+    ]
+    If no clear products or services are identified, return an empty array.
+
+    Text: {doc.page_content}
+    """
+    
+    json_str = None
+    try:
+        extraction_response = extraction_limiter.call(
+            BEDROCK_LIMITED_CLIENT.converse,
+            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
+            system=[{"text": system_prompt}],
+            messages=[{"role": "user", "content": [{"text": extraction_prompt}]}],
+            inferenceConfig={"maxTokens": 1000, "temperature": 0, "topP": 1},
+        )
+        response_content = extraction_response["output"]["message"]["content"][0]["text"]
+        
+        # Use regex to find the JSON array in the response
+        json_match = re.search(r'\[.*?\]', response_content, re.DOTALL)
+        if json_match:
+            json_str = json_match.group()
+            # Keep only objects with a name; the loop in generate_products relies on both
+            return [product for product in json.loads(json_str)
+                    if isinstance(product, dict) and isinstance(product.get("name"), str)]
+        print(f"No JSON array found in the response for question: {question}")
+    except json.JSONDecodeError as e:
+        print(f"JSON decode error for question '{question}': {str(e)}")
+        print(f"Problematic JSON string: {json_str if json_str else 'Not available'}")
+    except Exception as e:
+        if is_quota_error(e):
+            # Every other extraction would hit the same limit, so fail the whole request
+            print(f"Bedrock quota exceeded while extracting products: {str(e)}")
+            raise
+        print(f"Error extracting product information for question '{question}': {str(e)}")
+        print(f"Document content: {doc.page_content}")
+    return []
+
 def generate_products(limit):
-    print(f"Customer Info: {customer_info}")
+    print(f"Customer Info: {response_cache.get(customer_info_cache_key)}")
 
     # Step 3: Retrieve documents and extract product information
     products = []
     processed_products = set()  # Set to keep track of processed product names
     product_questions = [f"What are the main products and services offered by {customer_name}?"]
 
-    for question in product_questions:
-        print(f"Question: {question}")
-        if len(products) >= limit:
-            break  # Stop processing if we've reached the limit
-
-        docs = products_retriever.get_relevant_documents(question)
-        
-        for doc in docs:
+    # Products are written to DynamoDB in batches while extraction is still running
+    product_writer = BatchWriter(DYNAMODB_CLIENT, PRODUCT_TABLE_NAME)
+    try:
+        for question in product_questions:
+            print(f"Question: {question}")
             if len(products) >= limit:
                 break  # Stop processing if we've reached the limit
 
-            extraction_prompt = f"""
-            Extract structured product or service information from the following text, focusing on answering: {question}
-            
-            Return the result as a JSON array of objects with the following structure:
-            [
-                {{
-                    "name": "Specific product or service name",
-                    "description": "A brief, clear description of the product or service",
-                    "link": "URL to the product or service page if available, otherwise null",
-                    "icon": "An appropriate Font Awesome icon name (without the 'fa-' prefix) that represents this product or service"
-                }}
-            ]
-            If no clear products or services are identified, return an empty array.
-
-            Text: {doc.page_content}
-            """
-            
+            docs = products_retriever.get_relevant_documents(question)
+
+            # Extract from every document concurrently and yield products in completion order.
+            # Deduplication happens here in the consuming generator, so it needs no locking.
+            cancelled = threading.Event()
+            futures = {EXTRACTION_EXECUTOR.submit(in_current_context(extract_products), question, doc, cancelled): doc for doc in docs}
             try:
-                extraction_response = BEDROCK_CLIENT.converse(
-                    modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                    system=[{"text": system_prompt}],
-                    messages=[{"role": "user", "content": [{"text": extraction_prompt}]}],
-                    inferenceConfig={"maxTokens": 1000, "temperature": 0, "topP": 1},
-                )
-                response_content = extraction_response["output"]["message"]["content"][0]["text"]
-                
-                # Use regex to find the JSON array in the response
-                json_match = re.search(r'\[.*?\]', response_content, re.DOTALL)
-                if json_match:
-                    json_str = json_match.group()
-                    extracted_info = json.loads(json_str)
-                else:
-                    print(f"No JSON array found in the response for question: {question}")
-                    continue
-                
-                for product in extracted_info:
-                    if len(products) >= limit:
-                        break  # Stop processing if we've reached the limit
-
-                    if product.get("name") and product.get("name") != "Unknown Product":
-                        display_name = product["name"]  # Keep the original name as display name
-                        product_name = display_name.lower().strip().replace(" ", "-").replace("/", "-").replace("&", "-")
-                        if product_name not in processed_products:
-                            # Extract link from metadata
-                            metadata_link = doc.metadata.get('location', {}).get('webLocation', {}).get('url')
+                for future in as_completed(futures):
+                    doc = futures[future]
+                    for product in future.result():
+                        if len(products) >= limit:
+                            break  # Stop processing if we've reached the limit
+
+                        if product.get("name") and product.get("name") != "Unknown Product":
+                            display_name = product["name"]  # Keep the original name as display name
+                            product_name = display_name.lower().strip().replace(" ", "-").replace("/", "-").replace("&", "-")
+                            if product_name not in processed_products:
+                                # Extract link from metadata
+                                metadata_link = doc.metadata.get('location', {}).get('webLocation', {}).get('url')
                             
-                            # Use metadata link if available, otherwise use extracted link or default to "#"
-                            product["external_link"] = metadata_link or product.get("link") or "#"
-                            product["internal_link"] = f"/product/{product_name}"
-                            # Ensure there's an icon, default to 'cube' if not provided
-                            if not product.get("icon"):
-                                product["icon"] = "cube"
+                                # Use metadata link if available, otherwise use extracted link or default to "#"
+                                product["external_link"] = metadata_link or product.get("link") or "#"
+                                product["internal_link"] = f"/product/{product_name}"
+                                # Ensure there's an icon, default to 'cube' if not provided
+                                if not product.get("icon"):
+                                    product["icon"] = "cube"
                             
-                            # Add display_name to the product dictionary
-                            product["display_name"] = display_name
-                            product["name"] = product_name  # This is now the URL-friendly name
+                                # Add display_name to the product dictionary
+                                product["display_name"] = display_name
+                                product["name"] = product_name  # This is now the URL-friendly name
                             
-                            products.append(product)
-                            processed_products.add(product_name)
-                            print(f"Product: {json.dumps(product, indent=2)}")
+                                products.append(product)
+                                processed_products.add(product_name)
+                                print(f"Product: {json.dumps(product, indent=2)}")
                             
-                            # Yield the product immediately
-                            yield product
-                        else:
-                            print(f"Skipping duplicate product: {product_name}")
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error for question '{question}': {str(e)}")
-                print(f"Problematic JSON string: {json_str if 'json_str' in locals() else 'Not available'}")
-            except Exception as e:
-                print(f"Error extracting product information for question '{question}': {str(e)}")
-                print(f"Document content: {doc.page_content}")
-            
+                                # Store in the background and yield the product immediately. A product
+                                # that cannot be stored is still shown, as before batching.
+                                try:
+                                    product_writer.put(product_item(product))
+                                except ValueError as e:
+                                    print(f"Error storing product in DynamoDB: {str(e)}")
+                                yield product
+                            else:
+                                print(f"Skipping duplicate product: {product_name}")
+
+                    if len(products) >= limit:
+                        break  # Stop waiting on the remaining documents
+            finally:
+                # Drop queued extractions and skip the model call for any that have not started yet
+                cancelled.set()
+                for future in futures:
+                    future.cancel()
+    finally:
+        product_writer.close()
+        product_catalog.invalidate()
+
     print(f"Total unique products extracted: {len(products)}")
 
-    # Store the generated products in DynamoDB
-    for product in products:
-        try:
-            DYNAMODB_CLIENT.put_item(
-                TableName=PRODUCT_TABLE_NAME,
-                Item={
-                    'name': {'S': product['name']},
-                    'display_name': {'S': product['display_name']},
-                    'description': {'S': product['description']},
-                    'external_link': {'S': product['external_link']},
-                    'internal_link': {'S': product['internal_link']},
-                    'icon': {'S': product['icon']}
-                }
-            )
-        except Exception as e:
-            print(f"Error storing product in DynamoDB: {str(e)}")
+# Threads for product detail sections, four per uncached product page
+SECTION_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.environ.get('PRODUCT_DETAIL_WORKERS', 16)))
+SECTION_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+def generate_section(display_name, section, events, cancelled):
+    # Streams one product detail section into the shared events queue and returns its content.
+    # A None sentinel is always queued last so the consumer knows the section is finished.
+    try:
+        query = f"{display_name} {customer_name} {section['type']}"
+        docs = products_retriever.get_relevant_documents(query)
+        passages = budget_context(query, docs, SECTION_MODEL_ID)
+        context = "\n\n".join([passage.document.metadata['location']['webLocation']['url'] + "\n\n" + passage.text for passage in passages])
+
+        section_prompt = f"""
+        Based on the following information about {display_name}, {section['prompt']}
+        Use markdown formatting for better readability.
+        If the information is not available in the context, state that it's not available.
+        
+        Context: {context}
+
+        Do not include any framing language such as "According to the context" or "Here is an overview of" in your responses, just get straight to the point!
+        """
+
+        events.put({'type': 'section_start', 'section': section['type']})
+
+        response = BEDROCK_CLIENT.converse_stream(
+            modelId=SECTION_MODEL_ID,
+            system=[{"text": system_prompt}],
+            messages=[{"role": "user", "content": [{"text": section_prompt}]}],
+            inferenceConfig={"maxTokens": 500, "temperature": 0, "topP": 1},
+        )
+
+        section_content = ""
+        for chunk in response["stream"]:
+            if cancelled.is_set():
+                raise RuntimeError("Product details stream closed by the client")
+            if "contentBlockDelta" in chunk:
+                text = chunk["contentBlockDelta"]["delta"]["text"]
+                section_content += text
+                events.put({'type': 'content', 'section': section['type'], 'content': text})
+
+        events.put({'type': 'section_end', 'section': section['type']})
+        return section_content
+    finally:
+        events.put(None)
 
 @app.route('/api/product-details/<product_name>', methods=['GET'])
 def get_product_details(product_name):
@@ -602,71 +976,68 @@ def get_product_details(product_name):
                         {"type": "pricing", "prompt": f"Explain the pricing structure or plans for {display_name}, if available."}
                     ]
 
-                    for section in sections:
-                        docs = products_retriever.get_relevant_documents(f"{display_name} {customer_name} {section['type']}")
-                        context = "\n\n".join([doc.metadata['location']['webLocation']['url'] + "\n\n" + doc.page_content for doc in docs])
-
-                        section_prompt = f"""
-                        Based on the following information about {display_name}, {section['prompt']}
-                        Use markdown formatting for better readability.
-                        If the information is not available in the context, state that it's not available.
-                        
-                        Context: {context}
-
-                        Do not include any framing language such as "According to the context" or "Here is an overview of" in your responses, just get straight to the point!
-                        """
-
-                        yield f"data: {json.dumps({'type': 'section_start', 'section': section['type']})}\n\n"
-
-                        response = BEDROCK_CLIENT.converse_stream(
-                            modelId="anthropic.claude-3-sonnet-20240229-v1:0",
-                            system=[{"text": system_prompt}],
-                            messages=[{"role": "user", "content": [{"text": section_prompt}]}],
-                            inferenceConfig={"maxTokens": 500, "temperature": 0, "topP": 1},
-                        )
-
-                        section_content = ""
-                        for chunk in response["stream"]:
-                            if "contentBlockDelta" in chunk:
-                                text = chunk["contentBlockDelta"]["delta"]["text"]
-                                section_content += text
-                                yield f"data: {json.dumps({'type': 'content', 'section': section['type'], 'content': text})}\n\n"
-
-                        product_details[section['type']] = section_content
-                        yield f"data: {json.dumps({'type': 'section_end', 'section': section['type']})}\n\n"
-
-                    # Update only the product_details field in DynamoDB
+                    # Retrieve and generate all sections concurrently, multiplexing their
+                    # events into this stream as they arrive
+                    events = queue.Queue()
+                    cancelled = threading.Event()
+                    futures = [SECTION_EXECUTOR.submit(in_current_context(generate_section), display_name, section, events, cancelled)
+                               for section in sections]
                     try:
-                        DYNAMODB_CLIENT.update_item(
-                            TableName=PRODUCT_TABLE_NAME,
-                            Key={'name': {'S': product_name}},
-                            UpdateExpression="SET product_details = :details",
-                            ExpressionAttributeValues={
-                                ':details': {'S': json.dumps(product_details)}
-                            },
-                            # Add this condition to ensure we don't create a new item if it doesn't exist
-                            ConditionExpression="attribute_exists(#name)",
-                            ExpressionAttributeNames={
-                                "#name": "name"
-                            }
-                        )
-                    except ClientError as e:
-                        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
-                            print(f"Product {product_name} does not exist in DynamoDB. Cannot update product_details.")
-                        else:
-                            print(f"Error updating product details in DynamoDB: {str(e)}")
+                        remaining = len(futures)
+                        while remaining:
+                            event = events.get()
+                            if event is None:
+                                remaining -= 1
+                                continue
+                            yield event
+                    finally:
+                        # Stops the remaining section streams if the client disconnects
+                        cancelled.set()
+
+                    sections_complete = True
+                    for section, future in zip(sections, futures):
+                        try:
+                            product_details[section['type']] = future.result()
+                        except Exception as e:
+                            print(f"Error generating {section['type']} section for {display_name}: {str(e)}")
+                            product_details[section['type']] = ""
+                            sections_complete = False
+
+                    # Incomplete details are not stored so they are regenerated next time
+                    if sections_complete:
+                        # Update only the product_details field in DynamoDB
+                        try:
+                            DYNAMODB_CLIENT.update_item(
+                                TableName=PRODUCT_TABLE_NAME,
+                                Key={'name': {'S': product_name}},
+                                UpdateExpression="SET product_details = :details",
+                                ExpressionAttributeValues={
+                                    ':details': {'S': json.dumps(product_details)}
+                                },
+                                # Add this condition to ensure we don't create a new item if it doesn't exist
+                                ConditionExpression="attribute_exists(#name)",
+                                ExpressionAttributeNames={
+                                    "#name": "name"
+                                }
+                            )
+                        except ClientError as e:
+                            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                                print(f"Product {product_name} does not exist in DynamoDB. Cannot update product_details.")
+                            else:
+                                print(f"Error updating product details in DynamoDB: {str(e)}")
 
                 # Yield the product details
-                yield f"data: {json.dumps(product_details)}\n\n"
-                yield f"data: {json.dumps({'type': 'stop'})}\n\n"
+                yield product_details
+                yield {'type': 'stop'}
             else:
                 print(f"Product {product_name} not found in DynamoDB.")
-                yield f"data: {json.dumps({'error': 'Product not found'})}\n\n"
+                yield {'error': 'Product not found'}
         except ClientError as e:
             print(f"Error retrieving product from DynamoDB: {str(e)}")
-            yield f"data: {json.dumps({'error': 'Failed to retrieve product details'})}\n\n"
+            yield {'error': 'Failed to retrieve product details'}
 
-    return Response(generate(), mimetype='text/event-stream')
+    return stream_response(generate())
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('DEBUG', False))
+    # Local development server only; the container runs gunicorn (see gunicorn.conf.py)
+    app.run(host='0.0.0.0', port=5000, debug=os.environ.get('DEBUG', False), threaded=True)
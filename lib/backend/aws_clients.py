@@ -0,0 +1,149 @@
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import ClientError, ConnectionError, ReadTimeoutError
+
+# The default botocore pool of 10 connections caps concurrent Bedrock streams per process.
+# Size it to the number of connections a worker serves.
+MAX_POOL_CONNECTIONS = int(os.environ.get(
+    'AWS_MAX_POOL_CONNECTIONS', os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100)))
+
+# Errors worth retrying in another region
+FAILOVER_ERROR_CODES = {
+    'ThrottlingException',
+    'ServiceUnavailableException',
+    'InternalServerException',
+    'ModelNotReadyException',
+    'ModelTimeoutException',
+}
+
+
+# Retries botocore makes itself on clients behind a FailoverClient. Kept low so a throttled or
+# failing region hands over to the next one instead of being retried ten times first.
+FAILOVER_MAX_ATTEMPTS = int(os.environ.get('AWS_FAILOVER_MAX_ATTEMPTS', 2))
+
+
+def client_config(**overrides):
+    settings = dict(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=10,
+        read_timeout=120,
+        retries={'max_attempts': 10, 'mode': 'adaptive'},
+    )
+    settings.update(overrides)
+    return Config(**settings)
+
+
+class FailoverClient:
+    """Calls a service in the first region and moves on to the next on throttling or outages.
+
+    Exposes the same methods as a boto3 client, e.g. `converse` or
+    `converse_stream`. Only the initial call fails over; an error while
+    reading a response stream is raised to the caller.
+    """
+
+    def __init__(self, clients):
+        self.clients = clients
+        # gevent patches threading.local to be per greenlet, so this is per request
+        self._served = threading.local()
+
+    @property
+    def served_region(self):
+        """Region of the client that answered this thread's most recent call."""
+        return getattr(self._served, 'region', self.clients[0].meta.region_name)
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            for index, client in enumerate(self.clients):
+                try:
+                    response = getattr(client, name)(*args, **kwargs)
+                    self._served.region = client.meta.region_name
+                    return response
+                except (ClientError, ConnectionError, ReadTimeoutError) as e:
+                    code = e.response['Error']['Code'] if isinstance(e, ClientError) else type(e).__name__
+                    retryable = not isinstance(e, ClientError) or code in FAILOVER_ERROR_CODES
+                    if not retryable or index == len(self.clients) - 1:
+                        raise
+                    next_region = self.clients[index + 1].meta.region_name
+                    print(f"{name} failed in {client.meta.region_name} ({code}), failing over to {next_region}")
+        return call
+
+    @property
+    def meta(self):
+        return self.clients[0].meta
+
+
+class ClientManager:
+    """Creates each boto3 client once per (service, region) with a tuned connection pool and shares it.
+
+    boto3 clients are thread-safe, so one client per process is enough and
+    keeps connections (and their TLS sessions) alive across requests.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or client_config()
+        self._session = boto3.session.Session()
+        self._clients = {}
+        self._registered = {}
+        self._lock = threading.Lock()
+
+    def client(self, service, region_name=None, max_attempts=None):
+        """Shared client for (service, region); `max_attempts` overrides how often botocore retries."""
+        key = (service, region_name, max_attempts)
+        with self._lock:
+            if (service, region_name) in self._registered:
+                return self._registered[(service, region_name)]
+            if key not in self._clients:
+                config = self.config
+                if max_attempts is not None:
+                    config = config.merge(Config(retries={'max_attempts': max_attempts, 'mode': 'standard'}))
+                self._clients[key] = self._session.client(service, region_name=region_name, config=config)
+            return self._clients[key]
+
+    def register(self, service, region_name, client):
+        """Use `client` for (service, region), e.g. a local stand-in when benchmarking without AWS."""
+        with self._lock:
+            self._registered[(service, region_name)] = client
+
+    def failover_client(self, service, regions, max_attempts=None):
+        """Client for `service` that tries `regions` in order; a plain client when there is only one.
+
+        The clients behind a failover retry at most FAILOVER_MAX_ATTEMPTS
+        times, so throttling reaches the failover instead of being absorbed by
+        botocore. An explicit `max_attempts` applies with any number of regions.
+        """
+        if len(regions) == 1:
+            return self.client(service, regions[0], max_attempts)
+        if max_attempts is None:
+            max_attempts = FAILOVER_MAX_ATTEMPTS
+        return FailoverClient([self.client(service, region, max_attempts) for region in regions])
+
+    def pool_stats(self):
+        # Reads the urllib3 pools behind each client; in use = pool size minus idle slots
+        stats = []
+        with self._lock:
+            clients = list(self._clients.items())
+        for (service, region_name, _), client in clients:
+            in_use = 0
+            try:
+                manager = client._endpoint.http_session._manager
+                for pool_key in manager.pools.keys():
+                    pool = manager.pools[pool_key]
+                    in_use += pool.pool.maxsize - pool.pool.qsize()
+            except (AttributeError, KeyError, TypeError):
+                pass
+            max_connections = client.meta.config.max_pool_connections
+            stats.append({
+                'service': service,
+                'region': client.meta.region_name,
+                'in_use': in_use,
+                'max_pool_connections': max_connections,
+                'saturation': round(in_use / max_connections, 3) if max_connections else None,
+            })
+        return stats
+
+
+clients = ClientManager()
@@ -0,0 +1 @@
+"""Offline load-testing harness for the backend, see benchmarks/run.py."""
@@ -0,0 +1,127 @@
+"""Local stand-ins for Bedrock runtime and the Knowledge Base used by the benchmark harness."""
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import time
+from types import SimpleNamespace
+
+WORDS = ("cloud platform analytics service secure scalable customers data integration support "
+         "pricing enterprise team workflow automation reliable insights storage network").split()
+
+
+def _meta(region_name):
+    return SimpleNamespace(region_name=region_name, endpoint_url=f"https://local-{region_name}",
+                           config=SimpleNamespace(max_pool_connections=None))
+
+
+class FakeBedrockRuntime:
+    """Answers converse, converse_stream and invoke_model with canned text after configurable delays.
+
+    `converse_latency` is the duration of a non-streaming call,
+    `first_token_latency` the delay before the first streamed delta and
+    `token_latency` the delay between deltas.
+    """
+
+    def __init__(self, converse_latency=0.6, first_token_latency=0.4, token_latency=0.02, tokens=150,
+                 embedding_latency=0.05, region_name="us-east-1", seed=0):
+        self.converse_latency = converse_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.embedding_latency = embedding_latency
+        self.meta = _meta(region_name)
+        self._random = random.Random(seed)
+
+    def _prompt(self, messages):
+        return " ".join(block.get("text", "") for message in messages for block in message["content"])
+
+    def _reply(self, prompt, tool_config):
+        if tool_config:
+            return None
+        if "JSON array of objects" in prompt:
+            count = self._random.randint(1, 4)
+            return json.dumps([{"name": f"Product {self._random.randint(0, 10_000)}",
+                                "description": "A local stand-in product", "link": None, "icon": "cube"}
+                               for _ in range(count)])
+        if '"chart_type"' in prompt:
+            return json.dumps({"chart_type": "bar", "title": "Products", "description": "Stand-in",
+                               "data": [{"category": "A", "value": 1}, {"category": "B", "value": 2}]})
+        if "<question>" in prompt:
+            return "<question>What do you do?</question><question>What are your products?</question>"
+        if "Standalone question" in prompt:
+            return re.sub(r"(?s).*Follow Up Input: (.*?)\n.*", r"\1", prompt)
+        return " ".join(self._random.choice(WORDS) for _ in range(40))
+
+    def converse(self, modelId, messages, toolConfig=None, **kwargs):
+        time.sleep(self.converse_latency)
+        text = self._reply(self._prompt(messages), toolConfig)
+        usage = {"inputTokens": len(self._prompt(messages)) // 4, "outputTokens": 40}
+        if text is None:
+            question = self._prompt(messages).replace("Question: ", "")
+            return {
+                "stopReason": "tool_use",
+                "output": {"message": {"content": [{"toolUse": {
+                    "toolUseId": "tool-1", "name": "retrieve_information", "input": {"question": question}}}]}},
+                "usage": usage,
+            }
+        return {"stopReason": "end_turn", "output": {"message": {"content": [{"text": text}]}}, "usage": usage}
+
+    def converse_stream(self, modelId, messages, **kwargs):
+        input_tokens = len(self._prompt(messages)) // 4
+
+        def stream():
+            yield {"messageStart": {"role": "assistant"}}
+            time.sleep(self.first_token_latency)
+            for index in range(self.tokens):
+                if index:
+                    time.sleep(self.token_latency)
+                yield {"contentBlockDelta": {"delta": {"text": self._random.choice(WORDS) + " "}, "contentBlockIndex": 0}}
+            yield {"contentBlockStop": {"contentBlockIndex": 0}}
+            yield {"messageStop": {"stopReason": "end_turn"}}
+            yield {"metadata": {"usage": {"inputTokens": input_tokens, "outputTokens": self.tokens},
+                                "metrics": {"latencyMs": 0}}}
+
+        return {"stream": stream()}
+
+    def invoke_model(self, modelId, body, **kwargs):
+        time.sleep(self.embedding_latency)
+        text = json.loads(body).get("inputText", "")
+        # Deterministic bag-of-words embedding so similar questions land close together
+        vector = [0.0] * 64
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return {"body": io.BytesIO(json.dumps({"embedding": [v / norm for v in vector]}).encode())}
+
+
+class FakeKnowledgeBaseRuntime:
+    """Stand-in for the bedrock-agent-runtime client behind AmazonKnowledgeBasesRetriever."""
+
+    def __init__(self, latency=0.15, chunk_words=300, region_name="us-east-1", seed=0):
+        self.latency = latency
+        self.chunk_words = chunk_words
+        self.meta = _meta(region_name)
+        self._random = random.Random(seed)
+
+    def retrieve(self, retrievalQuery, knowledgeBaseId, retrievalConfiguration, **kwargs):
+        time.sleep(self.latency)
+        count = retrievalConfiguration["vectorSearchConfiguration"].get("numberOfResults", 5)
+        return {"retrievalResults": [{
+            "content": {"text": " ".join(self._random.choice(WORDS) for _ in range(self.chunk_words))},
+            "location": {"type": "WEB", "webLocation": {"url": f"https://example.com/page-{index}"}},
+            "score": 1.0 - index / (count + 1),
+            "metadata": {},
+        } for index in range(count)]}
+
+
+class FakeBedrockAgent:
+    """Stand-in for the bedrock-agent client; reports no data sources so caches are never invalidated."""
+
+    def __init__(self, region_name="us-east-1"):
+        self.meta = _meta(region_name)
+
+    def list_data_sources(self, **kwargs):
+        return {"dataSourceSummaries": []}
@@ -0,0 +1,13 @@
+"""Entry point for `python -m benchmarks.run --server gunicorn`.
+
+gunicorn imports this in every worker, after gevent has patched the standard
+library, so the stand-ins are registered before app.py builds its clients.
+"""
+import json
+import os
+
+from benchmarks.run import register_fakes
+
+register_fakes(json.loads(os.environ["BENCHMARK_FAKES"]))
+
+from app import app  # noqa: E402
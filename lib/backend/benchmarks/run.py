@@ -0,0 +1,313 @@
+"""Benchmark the backend endpoints without AWS.
+
+Bedrock runtime and the Knowledge Base are replaced by the stand-ins in
+benchmarks/fakes.py and DynamoDB by moto. The real Flask app is served
+on a local port and driven at increasing concurrency levels, reporting
+time-to-first-byte percentiles, streamed tokens per second and requests
+per second for each endpoint.
+
+By default the app runs in this process under werkzeug's threaded server.
+With `--server gunicorn` it runs the way the container does, under gunicorn
+with gunicorn.conf.py and gevent workers; the stand-ins are then registered
+in each worker by benchmarks/gunicorn_app.py and DynamoDB is a moto server.
+
+Usage, from lib/backend:
+    pip install -r requirements.txt -r benchmarks/requirements.txt
+    python -m benchmarks.run --concurrency 1 8 32 --requests 64
+    python -m benchmarks.run --server gunicorn --workers 1
+"""
+import argparse
+import http.client
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+REGION = "us-east-1"
+TABLE_NAME = "benchmark-kb-products"
+
+Result = namedtuple("Result", ["ttfb", "duration", "tokens", "ok"])
+
+
+def configure_environment(args, work_dir):
+    os.environ.update({
+        "AWS_REGION": REGION,
+        "AWS_DEFAULT_REGION": REGION,
+        "AWS_ACCESS_KEY_ID": "testing",
+        "AWS_SECRET_ACCESS_KEY": "testing",
+        "CUSTOMER_NAME": "Example Corp",
+        "KNOWLEDGE_BASE_ID": "BENCHMARKKB",
+        "PRODUCT_TABLE_NAME": TABLE_NAME,
+        "BEDROCK_REGIONS": REGION,
+        "KB_SYNC_CHECK_INTERVAL": "0",
+        "WARM_START_DIR": work_dir,
+        "WARM_START_REFRESH": "blocking",
+        "ANSWER_CACHE_ENABLED": "true" if args.answer_cache else "false",
+        # Read by benchmarks/gunicorn_app.py in every gunicorn worker
+        "BENCHMARK_FAKES": json.dumps(fake_settings(args)),
+    })
+    os.environ.pop("WARM_START_TABLE", None)
+
+
+def fake_settings(args):
+    return {
+        "converse_latency": args.converse_latency,
+        "first_token_latency": args.first_token_latency,
+        "token_latency": args.token_latency,
+        "tokens": args.tokens,
+        "retrieval_latency": args.retrieval_latency,
+    }
+
+
+def register_fakes(settings):
+    from aws_clients import clients
+    from benchmarks.fakes import FakeBedrockAgent, FakeBedrockRuntime, FakeKnowledgeBaseRuntime
+
+    clients.register("bedrock-runtime", REGION, FakeBedrockRuntime(
+        converse_latency=settings["converse_latency"],
+        first_token_latency=settings["first_token_latency"],
+        token_latency=settings["token_latency"],
+        tokens=settings["tokens"],
+    ))
+    clients.register("bedrock-agent-runtime", REGION, FakeKnowledgeBaseRuntime(latency=settings["retrieval_latency"]))
+    clients.register("bedrock-agent", REGION, FakeBedrockAgent())
+
+
+def product_count(args):
+    return max(args.requests * len(args.concurrency) * len(args.scenarios), 12)
+
+
+def seed_products(count):
+    import boto3
+
+    dynamodb = boto3.client("dynamodb", region_name=REGION)
+    dynamodb.create_table(
+        TableName=TABLE_NAME,
+        KeySchema=[{"AttributeName": "name", "KeyType": "HASH"}],
+        AttributeDefinitions=[{"AttributeName": "name", "AttributeType": "S"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    for index in range(count):
+        dynamodb.put_item(TableName=TABLE_NAME, Item={
+            "name": {"S": f"product-{index}"},
+            "display_name": {"S": f"Product {index}"},
+            "description": {"S": "A product seeded for benchmarking"},
+            "external_link": {"S": "#"},
+            "internal_link": {"S": f"/product/product-{index}"},
+            "icon": {"S": "cube"},
+        })
+
+
+def start_backend(args):
+    """Serve the app in this process under werkzeug; returns (port, stop)."""
+    from moto import mock_aws
+    from werkzeug.serving import make_server
+
+    mock = mock_aws()
+    mock.start()
+    seed_products(product_count(args))
+    register_fakes(fake_settings(args))
+
+    import app as backend
+
+    server = make_server("127.0.0.1", 0, backend.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def stop():
+        server.shutdown()
+        mock.stop()
+
+    return server.server_port, stop
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_serving(port, process, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/metrics")
+            connection.getresponse().read()
+            connection.close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"gunicorn was not serving on port {port} after {timeout} seconds")
+
+
+def start_gunicorn(args):
+    """Serve the app under gunicorn with the production gunicorn.conf.py; returns (port, stop)."""
+    from moto.server import ThreadedMotoServer
+
+    # Workers are separate processes, so DynamoDB is a moto server they all reach over HTTP
+    moto_port = free_port()
+    moto_server = ThreadedMotoServer(ip_address="127.0.0.1", port=moto_port)
+    moto_server.start()
+    os.environ["AWS_ENDPOINT_URL_DYNAMODB"] = f"http://127.0.0.1:{moto_port}"
+    seed_products(product_count(args))
+
+    port = free_port()
+    environment = dict(os.environ, PORT=str(port))
+    if args.workers:
+        environment["WEB_CONCURRENCY"] = str(args.workers)
+    # The same command as the Dockerfile, with an entry point that registers the stand-ins first.
+    # gunicorn.conf.py binds to 0.0.0.0; the benchmark only connects through loopback.
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+         "--access-logfile", "/dev/null", "benchmarks.gunicorn_app:app"],
+        env=environment,
+    )
+    try:
+        wait_until_serving(port, process, args.startup_timeout)
+    except Exception:
+        process.kill()
+        moto_server.stop()
+        raise
+
+    def stop():
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        moto_server.stop()
+
+    return port, stop
+
+
+def stream_request(port, method, path, body=None):
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+    start = time.perf_counter()
+    ttfb = None
+    tokens = 0
+    ok = True
+    try:
+        connection.request(method, path, body=json.dumps(body) if body is not None else None,
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        ok = response.status == 200
+        buffer = b""
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+            buffer += chunk
+            while b"\n\n" in buffer:
+                frame, buffer = buffer.split(b"\n\n", 1)
+                if not frame.startswith(b"data: "):
+                    continue
+                event = json.loads(frame[len(b"data: "):])
+                if "error" in event:
+                    ok = False
+                if event.get("type") == "content":
+                    # Stand-in tokens are single words, so this holds even when deltas are coalesced
+                    tokens += len(event["content"].split())
+    except Exception as e:
+        print(f"Request to {path} failed: {e}", file=sys.stderr)
+        ok = False
+    finally:
+        connection.close()
+    duration = time.perf_counter() - start
+    return Result(ttfb if ttfb is not None else duration, duration, tokens, ok)
+
+
+SCENARIOS = {
+    "chat": lambda port, index: stream_request(port, "POST", "/api/chat", {
+        "question": f"What does the platform offer for team number {index}?",
+        "chat_history": [],
+    }),
+    "products": lambda port, index: stream_request(port, "GET", "/api/products?limit=12"),
+    "product-details": lambda port, index: stream_request(port, "GET", f"/api/product-details/product-{index}"),
+}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def run_level(port, scenario, concurrency, requests, offset):
+    request = SCENARIOS[scenario]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda index: request(port, offset + index), range(requests)))
+    wall = time.perf_counter() - start
+    ttfbs = [result.ttfb * 1000 for result in results]
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": requests,
+        "errors": sum(1 for result in results if not result.ok),
+        "ttfb_p50_ms": round(percentile(ttfbs, 0.50), 1),
+        "ttfb_p95_ms": round(percentile(ttfbs, 0.95), 1),
+        "ttfb_p99_ms": round(percentile(ttfbs, 0.99), 1),
+        "mean_duration_ms": round(sum(result.duration for result in results) * 1000 / len(results), 1),
+        "tokens_per_second": round(sum(result.tokens for result in results) / wall, 1),
+        "requests_per_second": round(requests / wall, 2),
+    }
+
+
+def print_report(rows):
+    columns = ["scenario", "concurrency", "requests", "errors", "ttfb_p50_ms", "ttfb_p95_ms", "ttfb_p99_ms",
+               "mean_duration_ms", "tokens_per_second", "requests_per_second"]
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).rjust(widths[column]) for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the backend against local stand-ins for AWS")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=32, help="Requests per scenario and concurrency level")
+    parser.add_argument("--converse-latency", type=float, default=0.6, help="Seconds per non-streaming model call")
+    parser.add_argument("--first-token-latency", type=float, default=0.4, help="Seconds before the first streamed token")
+    parser.add_argument("--token-latency", type=float, default=0.02, help="Seconds between streamed tokens")
+    parser.add_argument("--tokens", type=int, default=150, help="Tokens per streamed answer")
+    parser.add_argument("--retrieval-latency", type=float, default=0.15, help="Seconds per Knowledge Base retrieval")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache enabled")
+    parser.add_argument("--server", choices=["werkzeug", "gunicorn"], default="werkzeug",
+                        help="werkzeug in this process, or gunicorn with gevent workers as in production")
+    parser.add_argument("--workers", type=int,
+                        help="gunicorn worker processes; defaults to WEB_CONCURRENCY as in gunicorn.conf.py")
+    parser.add_argument("--startup-timeout", type=float, default=60, help="Seconds to wait for gunicorn to serve")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        configure_environment(args, work_dir)
+        port, stop = start_gunicorn(args) if args.server == "gunicorn" else start_backend(args)
+        try:
+            rows = []
+            offset = 0
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    rows.append(run_level(port, scenario, concurrency, args.requests, offset))
+                    # Fresh indexes per level keep product pages and chat questions cold
+                    offset += args.requests
+            print_report(rows)
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump(rows, f, indent=2)
+        finally:
+            stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and optional memory budget.
+
+    `sizeof` returns the approximate size in bytes of a value; entries are
+    evicted least recently used first until both `max_entries` and
+    `max_bytes` are satisfied.
+    """
+
+    def __init__(self, max_entries=1000, ttl_seconds=3600, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, _ = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes is not None and self._bytes > self.max_bytes)):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def items(self):
+        # Snapshot of the live entries, most recently used last
+        now = time.monotonic()
+        with self._lock:
+            return [(key, value) for key, (value, expires_at, _) in self._entries.items() if expires_at >= now]
+
+    def touch(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+def unit_vector(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class SemanticAnswerCache:
+    """Caches the SSE events of chat answers, matched by question embedding.
+
+    Entries are scoped by prompt modifier; a lookup hits when a cached
+    question with the same modifier has cosine similarity of at least
+    `threshold` with the new one. Embeddings are stored normalized, so the
+    similarities against all candidates are one matrix-vector product.
+    """
+
+    def __init__(self, embed, threshold=0.95, max_entries=500, ttl_seconds=6 * 3600, max_bytes=32 * 1024 * 1024):
+        self.embed = embed
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._cache = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds, max_bytes=max_bytes,
+                               sizeof=self._sizeof)
+
+    @staticmethod
+    def _sizeof(value):
+        embedding, events = value
+        return embedding.nbytes + sum(len(str(event)) for event in events)
+
+    @staticmethod
+    def _key(question, prompt_modifier):
+        return (prompt_modifier.strip().lower(), " ".join(question.lower().split()))
+
+    def lookup(self, question, prompt_modifier):
+        """Return (events, embedding); events is None on a miss.
+
+        The embedding of the question is returned so a following `store`
+        does not have to compute it again.
+        """
+        key = self._key(question, prompt_modifier)
+        candidates = [(cached_key, value) for cached_key, value in self._cache.items() if cached_key[0] == key[0]]
+        for cached_key, (cached_embedding, events) in candidates:
+            # Exact repeats, e.g. the suggested questions, skip the embedding call
+            if cached_key == key:
+                self._cache.touch(key)
+                self.hits += 1
+                return events, cached_embedding
+
+        embedding = unit_vector(self.embed(question))
+        if candidates:
+            similarities = np.stack([cached_embedding for _, (cached_embedding, _) in candidates]) @ embedding
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                best_key, (_, best_events) = candidates[best]
+                self._cache.touch(best_key)
+                self.hits += 1
+                return best_events, embedding
+        self.misses += 1
+        return None, embedding
+
+    def lookup_exact(self, question, prompt_modifier):
+        """Return the events cached for exactly this question, or None, without an embedding call.
+
+        A None result is not counted as a miss; follow it with `lookup`.
+        """
+        value = self._cache.get(self._key(question, prompt_modifier))
+        if value is None:
+            return None
+        self.hits += 1
+        return value[1]
+
+    def store(self, question, prompt_modifier, events, embedding=None):
+        embedding = unit_vector(self.embed(question) if embedding is None else embedding)
+        self._cache.set(self._key(question, prompt_modifier), (embedding, list(events)))
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self):
+        stats = self._cache.stats()
+        stats.update(hits=self.hits, misses=self.misses, threshold=self.threshold)
+        return stats
@@ -0,0 +1,81 @@
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ProvisionedThroughputExceededException",
+}
+
+# Hard limits that backing off does not lift, e.g. a model without enough provisioned quota
+QUOTA_ERROR_CODES = {
+    "ServiceQuotaExceededException",
+}
+
+
+def _error_code(error):
+    return error.response.get("Error", {}).get("Code") if isinstance(error, ClientError) else None
+
+
+def is_throttling_error(error):
+    return _error_code(error) in THROTTLING_ERROR_CODES
+
+
+def is_quota_error(error):
+    return _error_code(error) in QUOTA_ERROR_CODES
+
+
+class AdaptiveLimiter:
+    """Caps concurrent calls to a throttled API, adapting the cap with AIMD.
+
+    Every throttling error halves the allowed concurrency and backs off
+    exponentially with jitter before retrying; every success grows the
+    limit again by roughly one slot per window of successful calls.
+    """
+
+    def __init__(self, max_concurrency, min_concurrency=1, base_delay=0.5, max_delay=20.0, max_attempts=6):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.limit = float(max_concurrency)
+        self.throttled = 0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    def _acquire(self):
+        with self._condition:
+            while self._in_flight >= max(self.min_concurrency, int(self.limit)):
+                self._condition.wait()
+            self._in_flight += 1
+
+    def _release(self, throttled):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limit = max(float(self.min_concurrency), self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def call(self, fn, *args, **kwargs):
+        for attempt in range(self.max_attempts):
+            self._acquire()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttling_error(e)
+                self._release(throttled)
+                if not throttled or attempt == self.max_attempts - 1:
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"Throttled, retrying in {delay:.1f}s (concurrency limit now {int(self.limit)})")
+                time.sleep(delay)
+            else:
+                self._release(False)
+                return result
@@ -0,0 +1,141 @@
+import math
+import re
+from collections import Counter, namedtuple
+
+# Tokens of retrieved context allowed in a prompt, per model. The rest of the
+# model's window is left for the instructions, the question and the answer.
+MODEL_CONTEXT_BUDGETS = {
+    "anthropic.claude-3-sonnet-20240229-v1:0": 6000,
+    "anthropic.claude-3-haiku-20240307-v1:0": 6000,
+}
+DEFAULT_CONTEXT_BUDGET = 4000
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it its of on or our
+that the their them there these they this to was we what when where which who why will with
+you your about into more than then so if not no all any also
+""".split())
+
+Passage = namedtuple("Passage", ["document", "text"])
+ContextSelection = namedtuple("ContextSelection", ["passages", "tokens", "original_tokens", "dropped_duplicates"])
+
+_WORD = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def estimate_tokens(text):
+    # Claude tokenizers average about four characters per token on English web text
+    return (len(text) + 3) // 4
+
+
+def _terms(text):
+    return [word for word in _WORD.findall(text.lower()) if word not in STOPWORDS]
+
+
+def _shingles(text, size=5):
+    words = _WORD.findall(text.lower())
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[index:index + size]) for index in range(len(words) - size + 1)}
+
+
+def _jaccard(first, second):
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def split_sentences(text, max_words=80):
+    # Crawled pages often have long runs without punctuation (menus, tables); those are cut into
+    # windows of `max_words` so a single run cannot take the whole budget or be dropped whole
+    sentences = []
+    for sentence in _SENTENCE_END.split(text):
+        words = sentence.split() if sentence else []
+        for index in range(0, len(words), max_words):
+            sentences.append(" ".join(words[index:index + max_words]))
+    return sentences
+
+
+class ContextBudgeter:
+    """Fits retrieved documents into a per-model token budget before they go into a prompt.
+
+    Near-duplicate documents (web pages that share most of their text, like
+    the same article under two URLs) are dropped first. If the rest still
+    does not fit, sentences are ranked by overlap with the query and the best
+    ones are kept, in their original order, until the budget is spent.
+    Documents left with no sentences are dropped, so sources built from the
+    returned passages only list what the model actually saw.
+    """
+
+    def __init__(self, budgets=None, default_budget=DEFAULT_CONTEXT_BUDGET, duplicate_threshold=0.8):
+        self.budgets = dict(MODEL_CONTEXT_BUDGETS if budgets is None else budgets)
+        self.default_budget = default_budget
+        self.duplicate_threshold = duplicate_threshold
+
+    def budget_for(self, model_id):
+        return self.budgets.get(model_id, self.default_budget)
+
+    def select(self, query, docs, model_id, budget=None):
+        budget = self.budget_for(model_id) if budget is None else budget
+        original_tokens = sum(estimate_tokens(doc.page_content) for doc in docs)
+
+        # Retrievers return documents best first, so the first copy of a duplicate is kept
+        unique_docs = []
+        seen_shingles = []
+        for doc in docs:
+            shingles = _shingles(doc.page_content)
+            if any(_jaccard(shingles, seen) >= self.duplicate_threshold for seen in seen_shingles):
+                continue
+            unique_docs.append(doc)
+            seen_shingles.append(shingles)
+        dropped_duplicates = len(docs) - len(unique_docs)
+
+        passages = [Passage(doc, doc.page_content) for doc in unique_docs if doc.page_content.strip()]
+        tokens = sum(estimate_tokens(passage.text) for passage in passages)
+        if tokens <= budget:
+            return ContextSelection(passages, tokens, original_tokens, dropped_duplicates)
+
+        passages, tokens = self._rank_sentences(query, unique_docs, budget)
+        return ContextSelection(passages, tokens, original_tokens, dropped_duplicates)
+
+    def _rank_sentences(self, query, docs, budget):
+        query_terms = set(_terms(query))
+        doc_sentences = [split_sentences(doc.page_content) for doc in docs]
+
+        # Terms that appear in every sentence say little about relevance
+        document_frequency = Counter()
+        sentence_count = 0
+        for sentences in doc_sentences:
+            for sentence in sentences:
+                document_frequency.update(set(_terms(sentence)))
+                sentence_count += 1
+
+        candidates = []
+        seen = set()
+        for doc_index, sentences in enumerate(doc_sentences):
+            for sentence_index, sentence in enumerate(sentences):
+                normalized = " ".join(_WORD.findall(sentence.lower()))
+                if not normalized or normalized in seen:
+                    continue
+                seen.add(normalized)
+                terms = set(_terms(sentence))
+                overlap = sum(math.log(1 + sentence_count / document_frequency[term]) for term in terms & query_terms)
+                # Prefer higher ranked documents and earlier sentences when overlap ties
+                score = overlap / math.sqrt(len(terms) or 1) - 0.01 * doc_index - 0.001 * sentence_index
+                candidates.append((score, doc_index, sentence_index, sentence))
+
+        selected = []
+        tokens = 0
+        for score, doc_index, sentence_index, sentence in sorted(candidates, reverse=True):
+            sentence_tokens = estimate_tokens(sentence) + 1
+            if tokens + sentence_tokens > budget:
+                continue
+            selected.append((doc_index, sentence_index, sentence))
+            tokens += sentence_tokens
+
+        passages = []
+        for doc_index, doc in enumerate(docs):
+            kept = [sentence for index, sentence_index, sentence in sorted(selected) if index == doc_index]
+            if kept:
+                passages.append(Passage(doc, " ".join(kept)))
+        return passages, tokens
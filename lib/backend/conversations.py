@@ -0,0 +1,237 @@
+import json
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+from caching import LRUCache
+
+
+class Conversation:
+    """Chat state kept on the server: a running summary, the recent turns and the last rewrite."""
+
+    def __init__(self, conversation_id, summary="", turns=None, rewrite=None, version=0):
+        self.conversation_id = conversation_id
+        # Version of the stored copy this state was read from; 0 when it has never been stored
+        self.version = version
+        self.summary = summary
+        self.turns = [list(turn) for turn in turns or []]
+        # {"question", "turns", "rewritten"}: reused while the same question is asked again
+        # before the conversation has moved on
+        self.rewrite = rewrite
+
+    @classmethod
+    def from_history(cls, conversation_id, chat_history):
+        # The client's chat_history alternates Human and AI messages
+        turns = [[chat_history[i], chat_history[i + 1]] for i in range(0, len(chat_history) - 1, 2)]
+        return cls(conversation_id, turns=turns)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["conversation_id"], data.get("summary", ""), data.get("turns"), data.get("rewrite"),
+                   data.get("version", 0))
+
+    def to_dict(self):
+        return {"conversation_id": self.conversation_id, "summary": self.summary,
+                "turns": self.turns, "rewrite": self.rewrite}
+
+    @property
+    def has_history(self):
+        return bool(self.summary or self.turns)
+
+    def history_text(self, max_answer_chars=600):
+        # Long answers are clipped; the rewrite only needs to know what was being discussed
+        lines = []
+        if self.summary:
+            lines.append(f"Summary of the earlier conversation: {self.summary}")
+        for question, answer in self.turns:
+            if len(answer) > max_answer_chars:
+                answer = answer[:max_answer_chars] + "..."
+            lines.append(f"Human: {question}\nAI: {answer}")
+        return "\n".join(lines)
+
+    def cached_rewrite(self, question):
+        if self.rewrite and self.rewrite["question"] == question and self.rewrite["turns"] == len(self.turns):
+            return self.rewrite["rewritten"]
+        return None
+
+
+class DynamoDBConversationStore:
+    """Keeps conversations in a DynamoDB table with a string partition key named `conversation_id`.
+
+    Items carry an `expires_at` epoch attribute for the table's TTL and a
+    `version` number that every save increments, so a worker holding an
+    outdated copy cannot overwrite turns another worker saved.
+    """
+
+    def __init__(self, client, table_name, ttl_seconds):
+        self.client = client
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+
+    def load(self, conversation_id):
+        response = self.client.get_item(TableName=self.table_name, Key={"conversation_id": {"S": conversation_id}},
+                                        ConsistentRead=True)
+        item = response.get("Item")
+        if not item:
+            return None
+        state = json.loads(item["state"]["S"])
+        state["version"] = int(item["version"]["N"]) if "version" in item else 0
+        return state
+
+    def save(self, conversation_id, state, version):
+        """Store `state` as `version` + 1; False if the stored copy is no longer at `version`."""
+        if version:
+            condition = {"ConditionExpression": "version = :version",
+                         "ExpressionAttributeValues": {":version": {"N": str(version)}}}
+        else:
+            condition = {"ConditionExpression": "attribute_not_exists(conversation_id)"}
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item={
+                    "conversation_id": {"S": conversation_id},
+                    "state": {"S": json.dumps(state)},
+                    "version": {"N": str(version + 1)},
+                    "expires_at": {"N": str(int(time.time() + self.ttl_seconds))},
+                },
+                **condition,
+            )
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            raise
+        return True
+
+
+class ConversationMemory:
+    """Server-side chat memory keyed by conversation id.
+
+    Without a `store`, conversations live in a process-local LRU. With one,
+    the store is the only copy: every request reads the conversation from it
+    and saves are conditional on the version that was read, re-applying the
+    change to the newer copy on a conflict, so any worker can continue a
+    conversation. Only the last `max_turns` turns are kept verbatim; once
+    there are more, the oldest are folded into the running summary by
+    `summarize(summary, turns)` on the `executor`, so the rewrite prompt stays
+    the same size however long the conversation runs.
+    """
+
+    def __init__(self, summarize, executor, store=None, max_turns=4, max_entries=5000, ttl_seconds=6 * 3600,
+                 max_save_attempts=3):
+        self.summarize = summarize
+        self.executor = executor
+        self.store = store
+        self.max_turns = max_turns
+        self.max_save_attempts = max_save_attempts
+        self._local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self._summarizing = set()
+        self.conflicts = 0
+
+    def get(self, conversation_id, chat_history=None):
+        """The conversation, starting from `chat_history` when it is unknown.
+
+        The client sends a chat_history to restore a conversation the server
+        no longer has, e.g. after its TTL expired.
+        """
+        if self.store is None:
+            conversation = self._local.get(conversation_id)
+            if conversation is None:
+                conversation = Conversation.from_history(conversation_id, chat_history or [])
+                self._local.set(conversation_id, conversation)
+            return conversation
+        conversation = self._load(conversation_id)
+        if conversation is None:
+            conversation = Conversation.from_history(conversation_id, chat_history or [])
+        return conversation
+
+    def _load(self, conversation_id):
+        try:
+            state = self.store.load(conversation_id)
+        except Exception as e:
+            print(f"Error loading conversation {conversation_id}: {e}")
+            return None
+        return Conversation.from_dict(state) if state is not None else None
+
+    def _update(self, conversation, change):
+        """Apply `change` to the conversation and save it; returns the conversation as saved.
+
+        When another worker saved first, `change` is applied again to the
+        stored copy, so `change` must work from whatever state it is given.
+        """
+        if conversation.conversation_id is None:
+            # Legacy requests without a conversation id are never stored
+            change(conversation)
+            return conversation
+        for _ in range(self.max_save_attempts):
+            with self._lock:
+                change(conversation)
+                state = conversation.to_dict()
+            if self.store is None:
+                self._local.set(conversation.conversation_id, conversation)
+                return conversation
+            try:
+                saved = self.store.save(conversation.conversation_id, state, conversation.version)
+            except Exception as e:
+                print(f"Error saving conversation {conversation.conversation_id}: {e}")
+                return conversation
+            if saved:
+                conversation.version += 1
+                return conversation
+            self.conflicts += 1
+            latest = self._load(conversation.conversation_id)
+            if latest is None:
+                return conversation
+            conversation = latest
+        print(f"Gave up saving conversation {conversation.conversation_id} after {self.max_save_attempts} conflicts")
+        return conversation
+
+    def remember_rewrite(self, conversation, question, rewritten):
+        def change(current):
+            current.rewrite = {"question": question, "turns": len(current.turns), "rewritten": rewritten}
+        self._update(conversation, change)
+
+    def add_turn(self, conversation, question, answer):
+        def change(current):
+            current.turns.append([question, answer])
+            # The cached rewrite was made against the history before this turn
+            current.rewrite = None
+        conversation = self._update(conversation, change)
+        if len(conversation.turns) > self.max_turns:
+            self._schedule_summary(conversation)
+
+    def _schedule_summary(self, conversation):
+        with self._lock:
+            if conversation.conversation_id in self._summarizing:
+                return
+            self._summarizing.add(conversation.conversation_id)
+        self.executor.submit(self._fold_turns, conversation)
+
+    def _fold_turns(self, conversation):
+        try:
+            if self.store is not None:
+                conversation = self._load(conversation.conversation_id) or conversation
+            with self._lock:
+                folded = [list(turn) for turn in conversation.turns[:len(conversation.turns) - self.max_turns]]
+                summary = conversation.summary
+            if not folded:
+                return
+            new_summary = self.summarize(summary, folded)
+
+            def change(current):
+                # Turns added while summarizing stay; only the folded ones are replaced
+                if current.turns[:len(folded)] == folded:
+                    current.summary = new_summary
+                    current.turns = current.turns[len(folded):]
+            self._update(conversation, change)
+        except Exception as e:
+            print(f"Error summarizing conversation {conversation.conversation_id}: {e}")
+        finally:
+            with self._lock:
+                self._summarizing.discard(conversation.conversation_id)
+
+    def stats(self):
+        local = self._local.stats()
+        return {"conversations": local["entries"], "hits": local["hits"], "misses": local["misses"],
+                "shared_store": self.store is not None, "max_turns": self.max_turns, "save_conflicts": self.conflicts}
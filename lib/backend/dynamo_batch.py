@@ -0,0 +1,142 @@
+import queue
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError, ParamValidationError
+
+# batch_write_item accepts at most 25 put or delete requests per call
+MAX_BATCH_SIZE = 25
+
+# Errors worth retrying; anything else (e.g. ValidationException, ResourceNotFoundException)
+# fails the batch at once instead of stalling the caller through every backoff
+RETRYABLE_ERROR_CODES = frozenset([
+    "ProvisionedThroughputExceededException", "ThrottlingException", "RequestLimitExceeded",
+    "InternalServerError", "ServiceUnavailable",
+])
+# Errors one malformed item causes for the whole batch it is in
+ITEM_ERROR_CODES = frozenset(["ValidationException"])
+
+
+class BatchWriter:
+    """Write-behind batching of DynamoDB puts with batch_write_item.
+
+    Items queued with `put` are written by a background thread in batches
+    of up to 25, as soon as a batch fills or `flush_interval` seconds after
+    the first pending item. UnprocessedItems are retried with exponential
+    backoff. A batch rejected because of a malformed item is written again
+    item by item, so only the bad items end up in `failed`. Use as a context
+    manager, or call `close` to flush what is left.
+
+    Example:
+        with BatchWriter(dynamodb_client, "my-table", key_attributes=["name"]) as writer:
+            for item in items:
+                writer.put(item)
+    """
+
+    def __init__(self, client, table_name, key_attributes=("name",), flush_interval=0.5,
+                 max_retries=8, base_delay=0.05, max_delay=5.0):
+        self.client = client
+        self.table_name = table_name
+        self.key_attributes = tuple(key_attributes)
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.written = 0
+        self.failed = []
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def put(self, item):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"batch-writer-{self.table_name}", daemon=True)
+            self._thread.start()
+        self._queue.put(item)
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def write_all(self, items):
+        """Write `items` synchronously in batches of 25 and return the number written."""
+        # A batch may not contain the same key twice, the latest item wins
+        items = list({self._key(item): item for item in items}.values())
+        for start in range(0, len(items), MAX_BATCH_SIZE):
+            self._write_batch(items[start:start + MAX_BATCH_SIZE])
+        return self.written
+
+    def _run(self):
+        pending = {}
+        deadline = None
+        closing = False
+        while not closing:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                closing = True
+            elif item is not False:
+                # A batch may not contain the same key twice, the latest put wins
+                pending[self._key(item)] = item
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if pending and (closing or len(pending) >= MAX_BATCH_SIZE or time.monotonic() >= deadline):
+                self._write_batch(list(pending.values()))
+                pending = {}
+                deadline = None
+
+    def _key(self, item):
+        return tuple(str(item.get(attribute)) for attribute in self.key_attributes)
+
+    def _write_batch(self, items):
+        requests = [{'PutRequest': {'Item': item}} for item in items]
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+            except Exception as e:
+                print(f"Error writing batch to DynamoDB: {str(e)}")
+                if len(requests) > 1 and self._item_error(e):
+                    # Find the bad items instead of losing the good ones with them
+                    for request in requests:
+                        self._write_batch([request['PutRequest']['Item']])
+                    return
+                if not self._retryable(e):
+                    break
+                response = {'UnprocessedItems': {self.table_name: requests}}
+            unprocessed = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            self.written += len(requests) - len(unprocessed)
+            if not unprocessed:
+                return
+            requests = unprocessed
+            if attempt < self.max_retries:
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+                print(f"{len(unprocessed)} items unprocessed, retrying in {delay:.2f}s")
+                time.sleep(delay)
+        else:
+            print(f"Giving up on {len(requests)} items after {self.max_retries} retries")
+        self.failed.extend(request['PutRequest']['Item'] for request in requests)
+
+    @staticmethod
+    def _retryable(error):
+        if isinstance(error, ClientError):
+            code = error.response.get('Error', {}).get('Code', '')
+            status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+            return code in RETRYABLE_ERROR_CODES or status >= 500
+        return isinstance(error, (ConnectionError, HTTPClientError))
+
+    @staticmethod
+    def _item_error(error):
+        if isinstance(error, ClientError):
+            return error.response.get('Error', {}).get('Code', '') in ITEM_ERROR_CODES
+        return isinstance(error, ParamValidationError)
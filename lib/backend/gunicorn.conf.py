@@ -0,0 +1,48 @@
+# Production server settings for the backend.
+#
+# The /api/chat, /api/products and /api/product-details endpoints stream
+# Server-Sent Events for as long as Bedrock keeps producing tokens, so a
+# synchronous worker would be pinned for the whole answer. gevent workers
+# cooperatively yield on every socket read (boto3 included, thanks to the
+# monkey patching gunicorn applies before loading app.py), which lets a single
+# worker hold hundreds of open streams.
+#
+# Every setting can be overridden from the environment:
+#   WEB_CONCURRENCY              number of worker processes
+#   GUNICORN_WORKER_CONNECTIONS  concurrent connections per worker
+#   GUNICORN_GRACEFUL_TIMEOUT    seconds in-flight streams get to finish on shutdown
+#   GUNICORN_TIMEOUT             seconds before a silent worker is restarted
+#   GUNICORN_KEEPALIVE           seconds to keep idle client connections open
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+
+worker_class = "gevent"
+workers = int(os.environ.get("WEB_CONCURRENCY", max(2, multiprocessing.cpu_count())))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 500))
+
+# SSE streams are long-lived; the ALB idle timeout is 60 seconds by default.
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 75))
+
+# On SIGTERM (ECS task stop, scale-in, deploy) stop accepting new connections
+# and give open streams time to finish. Keep this below the ECS stopTimeout
+# (30 seconds by default) so workers exit before SIGKILL.
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 25))
+
+# Each worker builds its own boto3 clients after gevent has patched the
+# standard library, so the application must not be preloaded in the master.
+preload_app = False
+
+accesslog = "-"
+errorlog = "-"
+loglevel = os.environ.get("GUNICORN_LOG_LEVEL", "info")
+
+
+def worker_int(worker):
+    print(f"Worker {worker.pid} interrupted, draining open streams")
+
+
+def worker_exit(server, worker):
+    print(f"Worker {worker.pid} exited")
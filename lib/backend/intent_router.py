@@ -0,0 +1,210 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, namedtuple
+
+RETRIEVE_INFORMATION = "retrieve_information"
+VISUALIZE_PRODUCTS = "visualize_products"
+
+# Outcome of routing a question. `source` is one of "keyword", "classifier" or "model".
+RouteDecision = namedtuple("RouteDecision", ["route", "question", "confidence", "source"])
+
+# Whole words that settle the route on their own. Matched as tokens, so "graph" does not catch
+# "photography"; plurals are listed explicitly. Nouns that are also ordinary product words
+# ("pie", "radar", "plot") are left out; "pie chart" and the like still match on "chart".
+KEYWORD_RULES = {
+    VISUALIZE_PRODUCTS: frozenset([
+        "visualize", "visualise", "visualization", "visualisation", "chart", "charts", "graph",
+        "graphs", "diagram", "diagrams", "histogram", "histograms", "infographic", "infographics",
+    ]),
+}
+
+# The classifier only routes locally to a route listed here when the question also holds one
+# of its terms; without one the question goes to the model. Requests such as "show me the
+# pricing page" share most of their words with chart requests and must not become charts.
+ROUTE_TERMS = {
+    VISUALIZE_PRODUCTS: frozenset([
+        "draw", "visual", "visually", "breakdown", "distribution", "distributed", "proportion",
+        "proportions", "pie", "radar", "plot", "plots", "bar", "bars",
+    ]),
+}
+
+# Words that say nothing about the intent, left out of the classifier's vectors
+STOPWORDS = frozenset([
+    "a", "an", "the", "and", "or", "of", "to", "in", "on", "for", "by", "with", "at", "from",
+    "as", "is", "are", "was", "be", "do", "does", "i", "me", "my", "we", "our", "you", "your",
+    "it", "its", "this", "that", "these", "those", "there", "can", "could", "would", "please",
+    "show", "give", "tell", "let", "see", "all", "each", "some", "any", "about",
+])
+
+# Small labelled set used to train the local classifier
+LABELLED_QUESTIONS = {
+    VISUALIZE_PRODUCTS: [
+        "Show me a breakdown of your products",
+        "Compare all of your products side by side",
+        "How are the products distributed across categories?",
+        "Rank the products by popularity",
+        "Give me an overview of the product catalog by category",
+        "Which product categories have the most offerings?",
+        "Break down the services by type",
+        "Draw the product lineup",
+        "Show the share of each product line",
+        "Compare the number of features per product",
+        "Display the products grouped by category",
+        "Show the catalog as a comparison",
+    ],
+    RETRIEVE_INFORMATION: [
+        "What does the company do?",
+        "Show me the pricing page",
+        "Which products are most popular?",
+        "Give me an overview of your products",
+        "Show me your products",
+        "List the products you offer",
+        "Which product is the best seller?",
+        "Compare the premium and basic plans",
+        "Tell me about the product catalog",
+        "Show me the documentation",
+        "Which services do you recommend for a small business?",
+        "Do you sell gift cards?",
+        "What are your main products and services?",
+        "How much does the premium plan cost?",
+        "Where are you headquartered?",
+        "How do I contact customer support?",
+        "Tell me about your history",
+        "Who is the CEO?",
+        "What industries do you serve?",
+        "How do I sign up for an account?",
+        "What is your return policy?",
+        "Do you offer a free trial?",
+        "What are the benefits of your service?",
+        "How does the product work?",
+        "Is there an API available?",
+        "What security certifications do you have?",
+        "Can you explain the pricing plans?",
+        "What are the key features of this product?",
+        "How can I get started?",
+    ],
+}
+
+# Used to estimate saved latency until the first model-routed request has been timed
+DEFAULT_FALLBACK_LATENCY_MS = 1500.0
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+
+def content_tokens(text):
+    return [token for token in tokenize(text) if token not in STOPWORDS]
+
+
+class TfidfClassifier:
+    """Nearest-centroid classifier over TF-IDF vectors of the labelled questions."""
+
+    def __init__(self, labelled_questions):
+        documents = [(label, content_tokens(question))
+                     for label, questions in labelled_questions.items()
+                     for question in questions]
+        document_frequency = Counter(token for _, tokens in documents for token in set(tokens))
+        self.idf = {token: math.log((1 + len(documents)) / (1 + df)) + 1
+                    for token, df in document_frequency.items()}
+
+        self.centroids = {}
+        for label in labelled_questions:
+            centroid = Counter()
+            for doc_label, tokens in documents:
+                if doc_label == label:
+                    centroid.update(self._vectorize(tokens))
+            self.centroids[label] = self._normalize(centroid)
+
+    def _vectorize(self, tokens):
+        counts = Counter(token for token in tokens if token in self.idf)
+        return self._normalize({token: count * self.idf[token] for token, count in counts.items()})
+
+    @staticmethod
+    def _normalize(vector):
+        norm = math.sqrt(sum(value * value for value in vector.values()))
+        return {token: value / norm for token, value in vector.items()} if norm else {}
+
+    def scores(self, text):
+        vector = self._vectorize(content_tokens(text))
+        return {label: sum(weight * centroid.get(token, 0.0) for token, weight in vector.items())
+                for label, centroid in self.centroids.items()}
+
+
+class IntentRouter:
+    """Routes chat questions to a tool locally, falling back to a model call when unsure.
+
+    `fallback` is called with the question and must return a RouteDecision; it is
+    only used when neither the keyword rules nor the classifier are confident.
+    """
+
+    def __init__(self, fallback, labelled_questions=LABELLED_QUESTIONS, keyword_rules=KEYWORD_RULES,
+                 route_terms=ROUTE_TERMS, min_confidence=0.5, min_similarity=0.25, enabled=True):
+        self.fallback = fallback
+        self.keyword_rules = keyword_rules
+        self.route_terms = route_terms
+        self.classifier = TfidfClassifier(labelled_questions)
+        self.min_confidence = min_confidence
+        self.min_similarity = min_similarity
+        self.enabled = enabled
+
+        self._lock = threading.Lock()
+        self._decisions = Counter()
+        self._fallback_calls = 0
+        self._fallback_latency_ms = 0.0
+        self._saved_latency_ms = 0.0
+
+    def route(self, question):
+        decision = self._route_locally(question) if self.enabled else None
+        if decision is None:
+            start = time.perf_counter()
+            decision = self.fallback(question)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                self._fallback_calls += 1
+                self._fallback_latency_ms += elapsed_ms
+        else:
+            with self._lock:
+                self._saved_latency_ms += self._average_fallback_latency_ms()
+
+        with self._lock:
+            self._decisions[(decision.source, decision.route)] += 1
+        print(f"Routed question to {decision.route} via {decision.source} (confidence {decision.confidence:.2f})")
+        return decision
+
+    def _route_locally(self, question):
+        tokens = set(tokenize(question))
+        for route, keywords in self.keyword_rules.items():
+            if tokens & set(keywords):
+                return RouteDecision(route, question, 1.0, "keyword")
+
+        ranked = sorted(self.classifier.scores(question).items(), key=lambda item: item[1], reverse=True)
+        (best_route, best_score), (_, runner_up_score) = ranked[0], ranked[1]
+        if best_score < self.min_similarity:
+            return None
+        confidence = (best_score - runner_up_score) / best_score
+        if confidence < self.min_confidence:
+            return None
+        if best_route in self.route_terms and not tokens & self.route_terms[best_route]:
+            return None
+        return RouteDecision(best_route, question, confidence, "classifier")
+
+    def _average_fallback_latency_ms(self):
+        if self._fallback_calls:
+            return self._fallback_latency_ms / self._fallback_calls
+        return DEFAULT_FALLBACK_LATENCY_MS
+
+    def stats(self):
+        with self._lock:
+            decisions = {}
+            for (source, route), count in self._decisions.items():
+                decisions.setdefault(route, {})[source] = count
+            return {
+                "enabled": self.enabled,
+                "decisions": decisions,
+                "fallback_calls": self._fallback_calls,
+                "average_fallback_latency_ms": round(self._average_fallback_latency_ms(), 1),
+                "estimated_saved_latency_ms": round(self._saved_latency_ms, 1),
+            }
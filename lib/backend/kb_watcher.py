@@ -0,0 +1,82 @@
+import threading
+import time
+
+
+class KnowledgeBaseWatcher:
+    """Polls the Knowledge Base ingestion jobs and notifies listeners when new data lands.
+
+    The version of the Knowledge Base is the id and completion time of the
+    most recent COMPLETE ingestion job across its data sources. Listeners are
+    called with no arguments whenever that version changes, which is how
+    response caches drop answers built from stale documents.
+    """
+
+    def __init__(self, bedrock_agent_client, knowledge_base_id, interval_seconds=300):
+        self.client = bedrock_agent_client
+        self.knowledge_base_id = knowledge_base_id
+        self.interval_seconds = interval_seconds
+        self.version = None
+        # Distinguishes "never checked" from "checked, but no ingestion job has completed yet"
+        self.checked = False
+        self.last_checked = None
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def current_version(self):
+        latest = None
+        data_sources = self.client.list_data_sources(knowledgeBaseId=self.knowledge_base_id)
+        for data_source in data_sources.get('dataSourceSummaries', []):
+            jobs = self.client.list_ingestion_jobs(
+                knowledgeBaseId=self.knowledge_base_id,
+                dataSourceId=data_source['dataSourceId'],
+                filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': ['COMPLETE']}],
+                sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+                maxResults=1,
+            )
+            for job in jobs.get('ingestionJobSummaries', []):
+                if latest is None or job['updatedAt'] > latest['updatedAt']:
+                    latest = job
+        if latest is None:
+            return None
+        return f"{latest['ingestionJobId']}:{latest['updatedAt'].isoformat()}"
+
+    def check(self):
+        try:
+            version = self.current_version()
+        except Exception as e:
+            print(f"Error checking Knowledge Base ingestion jobs: {e}")
+            return
+        self.last_checked = time.time()
+        # The first check only records the version. After that any change notifies, including
+        # the first crawl completing when the backend started against an empty Knowledge Base.
+        if self.checked and version != self.version:
+            print(f"Knowledge Base {self.knowledge_base_id} changed ({self.version} -> {version}), invalidating caches")
+            self.notify()
+        self.version = version
+        self.checked = True
+
+    def notify(self):
+        for listener in self._listeners:
+            try:
+                listener()
+            except Exception as e:
+                print(f"Error in Knowledge Base change listener: {e}")
+
+    def start(self):
+        if self._thread is not None or self.interval_seconds <= 0:
+            return
+
+        def run():
+            while not self._stop.is_set():
+                self.check()
+                self._stop.wait(self.interval_seconds)
+
+        self._thread = threading.Thread(target=run, name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
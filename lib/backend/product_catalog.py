@@ -0,0 +1,100 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from caching import LRUCache
+
+
+def encode_cursor(last_evaluated_key):
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return None
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def projection_arguments(attributes):
+    # Attribute names such as "name" are DynamoDB reserved words, so always use placeholders
+    if not attributes:
+        return {}
+    names = {f"#a{i}": attribute for i, attribute in enumerate(attributes)}
+    return {
+        "ProjectionExpression": ", ".join(names),
+        "ExpressionAttributeNames": names,
+    }
+
+
+class ProductCatalog:
+    """Read path for the products table: paginated pages, full-catalog scans and a read-through cache.
+
+    Cached pages and catalogs must be dropped with `invalidate` whenever the
+    table is written to.
+    """
+
+    def __init__(self, client, table_name, scan_segments=4, cache_ttl_seconds=300, cache_max_entries=256):
+        self.client = client
+        self.table_name = table_name
+        self.scan_segments = scan_segments
+        self._cache = LRUCache(max_entries=cache_max_entries, ttl_seconds=cache_ttl_seconds)
+
+    def page(self, limit, cursor=None, attributes=None):
+        """Return (items, next_cursor) for up to `limit` items starting after `cursor`."""
+        cache_key = ("page", limit, cursor, tuple(attributes or ()))
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        items = []
+        start_key = decode_cursor(cursor)
+        # A single Scan page stops at 1 MB, keep reading until the page is full
+        while len(items) < limit:
+            arguments = dict(TableName=self.table_name, Limit=limit - len(items), **projection_arguments(attributes))
+            if start_key:
+                arguments["ExclusiveStartKey"] = start_key
+            response = self.client.scan(**arguments)
+            items.extend(response.get("Items", []))
+            start_key = response.get("LastEvaluatedKey")
+            if not start_key:
+                break
+
+        result = (items, encode_cursor(start_key))
+        self._cache.set(cache_key, result)
+        return result
+
+    def all(self, attributes=None):
+        """Return every item, scanning `scan_segments` segments of the table in parallel."""
+        cache_key = ("all", tuple(attributes or ()))
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        with ThreadPoolExecutor(max_workers=self.scan_segments) as executor:
+            segments = executor.map(lambda segment: self._scan_segment(segment, attributes), range(self.scan_segments))
+            items = [item for segment_items in segments for item in segment_items]
+
+        self._cache.set(cache_key, items)
+        return items
+
+    def _scan_segment(self, segment, attributes):
+        items = []
+        arguments = dict(TableName=self.table_name, Segment=segment, TotalSegments=self.scan_segments,
+                         **projection_arguments(attributes))
+        while True:
+            response = self.client.scan(**arguments)
+            items.extend(response.get("Items", []))
+            if "LastEvaluatedKey" not in response:
+                return items
+            arguments["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def invalidate(self):
+        self._cache.clear()
+
+    def stats(self):
+        return self._cache.stats()
@@ -0,0 +1,113 @@
+import math
+import re
+import threading
+import time
+from collections import Counter
+
+from telemetry import RETRIEVAL_STAGE_DURATION, record_span
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i in is it its of on or our
+that the their them there these they this to was we what when where which who why will with
+you your
+""".split())
+
+
+def tokenize(text):
+    return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in STOPWORDS]
+
+
+def bm25_scores(query, texts, k1=1.2, b=0.75):
+    """BM25 score of each text for `query`, with term statistics taken from `texts` themselves."""
+    documents = [Counter(tokenize(text)) for text in texts]
+    if not documents:
+        return []
+    lengths = [sum(document.values()) for document in documents]
+    average_length = sum(lengths) / len(lengths) or 1
+    document_frequency = Counter(term for document in documents for term in document)
+    count = len(documents)
+
+    scores = []
+    for document, length in zip(documents, lengths):
+        score = 0.0
+        for term in set(tokenize(query)):
+            frequency = document.get(term, 0)
+            if not frequency:
+                continue
+            idf = math.log(1 + (count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            score += idf * frequency * (k1 + 1) / (frequency + k1 * (1 - b + b * length / average_length))
+        scores.append(score)
+    return scores
+
+
+def _normalize(values):
+    low, high = min(values), max(values)
+    if high == low:
+        return [1.0 if high > 0 else 0.0 for _ in values]
+    return [(value - low) / (high - low) for value in values]
+
+
+class RerankingRetriever:
+    """Over-fetches from a Knowledge Base retriever and keeps the `top_k` best documents.
+
+    The wrapped retriever should return several times `top_k` candidates.
+    Each candidate is scored by a blend of BM25 over the candidates and the
+    similarity score the Knowledge Base returned, both scaled to 0..1, with
+    `lexical_weight` on the BM25 side. Fetch and rerank timings are recorded
+    per call.
+    """
+
+    def __init__(self, retriever, top_k, name, lexical_weight=0.4):
+        self.retriever = retriever
+        self.top_k = top_k
+        self.name = name
+        self.lexical_weight = lexical_weight
+        self.calls = 0
+        self.candidates = 0
+        self.fetch_seconds = 0.0
+        self.rerank_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def get_relevant_documents(self, query):
+        started_at = time.time()
+        start = time.perf_counter()
+        candidates = self.retriever.get_relevant_documents(query)
+        fetched = time.perf_counter()
+        docs = self.rerank(query, candidates)
+        reranked = time.perf_counter()
+
+        fetch_seconds = fetched - start
+        rerank_seconds = reranked - fetched
+        RETRIEVAL_STAGE_DURATION.observe(fetch_seconds, retriever=self.name, stage="fetch")
+        RETRIEVAL_STAGE_DURATION.observe(rerank_seconds, retriever=self.name, stage="rerank")
+        record_span(f"rerank.{self.name}", started_at, reranked - start, candidates=len(candidates),
+                    kept=len(docs), fetch_ms=round(fetch_seconds * 1000, 1), rerank_ms=round(rerank_seconds * 1000, 1))
+        with self._lock:
+            self.calls += 1
+            self.candidates += len(candidates)
+            self.fetch_seconds += fetch_seconds
+            self.rerank_seconds += rerank_seconds
+        return docs
+
+    def rerank(self, query, candidates):
+        if len(candidates) <= 1:
+            return list(candidates[:self.top_k])
+        lexical = _normalize(bm25_scores(query, [doc.page_content for doc in candidates]))
+        vector = _normalize([float(doc.metadata.get('score') or 0) for doc in candidates])
+        # Ties keep the Knowledge Base order
+        ranked = sorted(
+            range(len(candidates)),
+            key=lambda index: (-(self.lexical_weight * lexical[index] + (1 - self.lexical_weight) * vector[index]), index),
+        )
+        return [candidates[index] for index in ranked[:self.top_k]]
+
+    def stats(self):
+        with self._lock:
+            calls = self.calls or 1
+            return {
+                "calls": self.calls,
+                "top_k": self.top_k,
+                "mean_candidates": round(self.candidates / calls, 1),
+                "mean_fetch_ms": round(self.fetch_seconds * 1000 / calls, 1),
+                "mean_rerank_ms": round(self.rerank_seconds * 1000 / calls, 2),
+            }
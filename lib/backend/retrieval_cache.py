@@ -0,0 +1,168 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from langchain_core.documents import Document
+
+from caching import LRUCache
+
+
+class SQLiteCacheBackend:
+    """Shared cache tier in a local SQLite file.
+
+    Shares hits between the gunicorn workers of one container, or between
+    containers when the file lives on a shared volume such as EFS.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS retrieval_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute(
+                "SELECT value FROM retrieval_cache WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, value, ttl_seconds):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO retrieval_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl_seconds),
+            )
+            connection.execute("DELETE FROM retrieval_cache WHERE expires_at <= ?", (time.time(),))
+
+    def clear(self):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM retrieval_cache")
+
+
+class RedisCacheBackend:
+    """Shared cache tier in Redis or any server speaking the Redis protocol (ElastiCache, Valkey)."""
+
+    def __init__(self, url, prefix="retrieval-cache:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key, value, ttl_seconds):
+        self.client.setex(self.prefix + key, int(ttl_seconds), value)
+
+    def clear(self):
+        for key in self.client.scan_iter(match=self.prefix + "*"):
+            self.client.delete(key)
+
+
+def cache_backend_from_url(url):
+    """Build a shared backend from sqlite:///path/to/file.db or redis://host:port/db; None if unset."""
+    if not url:
+        return None
+    if url.startswith("sqlite:///"):
+        return SQLiteCacheBackend(url[len("sqlite:///"):])
+    if url.startswith(("redis://", "rediss://")):
+        return RedisCacheBackend(url)
+    raise ValueError(f"Unsupported retrieval cache backend: {url}")
+
+
+class CachingRetriever:
+    """Caches Knowledge Base retrieval results in front of an AmazonKnowledgeBasesRetriever.
+
+    Results are keyed on (knowledge base id, normalized query, numberOfResults, search type)
+    and kept in a process-local LRU, backed by an optional shared tier.
+    """
+
+    def __init__(self, retriever, ttl_seconds=3600, max_entries=2000, backend=None):
+        self.retriever = retriever
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.shared_hits = 0
+        self.backend_errors = 0
+        self._local = LRUCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+
+    @property
+    def knowledge_base_id(self):
+        return self.retriever.knowledge_base_id
+
+    @property
+    def number_of_results(self):
+        return self.retriever.retrieval_config.vectorSearchConfiguration.numberOfResults
+
+    @property
+    def search_type(self):
+        return getattr(self.retriever.retrieval_config.vectorSearchConfiguration, "overrideSearchType", None)
+
+    def cache_key(self, query):
+        normalized_query = " ".join(query.lower().split())
+        raw_key = json.dumps([self.knowledge_base_id, normalized_query, self.number_of_results, self.search_type])
+        return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+    def get_relevant_documents(self, query):
+        key = self.cache_key(query)
+        docs = self._local.get(key)
+        if docs is not None:
+            return docs
+
+        if self.backend is not None:
+            try:
+                cached = self.backend.get(key)
+            except Exception as e:
+                print(f"Error reading retrieval cache backend: {e}")
+                cached = None
+                with self._lock:
+                    self.backend_errors += 1
+            if cached is not None:
+                docs = [Document(page_content=doc["page_content"], metadata=doc["metadata"])
+                        for doc in json.loads(cached)]
+                self._local.set(key, docs)
+                with self._lock:
+                    self.shared_hits += 1
+                return docs
+
+        docs = self.retriever.get_relevant_documents(query)
+        self._local.set(key, docs)
+        if self.backend is not None:
+            try:
+                self.backend.set(key, json.dumps([{"page_content": doc.page_content, "metadata": doc.metadata}
+                                                  for doc in docs]), self.ttl_seconds)
+            except Exception as e:
+                print(f"Error writing retrieval cache backend: {e}")
+                with self._lock:
+                    self.backend_errors += 1
+        return docs
+
+    def clear(self):
+        self._local.clear()
+        if self.backend is not None:
+            try:
+                self.backend.clear()
+            except Exception as e:
+                print(f"Error clearing retrieval cache backend: {e}")
+
+    def stats(self):
+        local = self._local.stats()
+        with self._lock:
+            return {
+                "entries": local["entries"],
+                "hits": local["hits"],
+                "shared_hits": self.shared_hits,
+                "misses": local["misses"] - self.shared_hits,
+                "evictions": local["evictions"],
+                "backend": type(self.backend).__name__ if self.backend is not None else None,
+                "backend_errors": self.backend_errors,
+            }
@@ -0,0 +1,170 @@
+import json
+import queue
+import threading
+import time
+import zlib
+
+try:
+    import gevent
+    from gevent import monkey
+    _PRODUCER_KILLED = (gevent.GreenletExit,)
+except ImportError:
+    gevent = None
+    _PRODUCER_KILLED = ()
+
+# json.dumps({'type': 'content', 'content': text}) split around the text, so a delta only
+# needs its string escaped instead of a whole dict serialized
+_CONTENT_PREFIX = b'data: {"type": "content", "content": '
+_SECTION_CONTENT_PREFIX = b'data: {"type": "content", "section": '
+_FRAME_SUFFIX = b'}\n\n'
+HEARTBEAT_FRAME = b": keep-alive\n\n"
+
+_DONE = object()
+
+
+def encode_event(event):
+    """Encode an event dict as one SSE frame, byte-for-byte what json.dumps would produce."""
+    if event.get('type') == 'content' and isinstance(event.get('content'), str):
+        keys = list(event)
+        if keys == ['type', 'content']:
+            return _CONTENT_PREFIX + json.dumps(event['content']).encode() + _FRAME_SUFFIX
+        if keys == ['type', 'section', 'content']:
+            return (_SECTION_CONTENT_PREFIX + json.dumps(event['section']).encode() + b', "content": '
+                    + json.dumps(event['content']).encode() + _FRAME_SUFFIX)
+    return b"data: " + json.dumps(event).encode() + b"\n\n"
+
+
+def _can_merge(pending, event):
+    # Consecutive text deltas of the same stream (and product detail section) join into one event
+    return (pending is not None and event.get('type') == 'content'
+            and isinstance(event.get('content'), str)
+            and list(event) == list(pending) and event.get('section') == pending.get('section'))
+
+
+def negotiate_encoding(accept_encoding):
+    accepted = {part.split(';')[0].strip().lower() for part in (accept_encoding or '').split(',')}
+    for encoding in ('gzip', 'deflate'):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+class SSEWriter:
+    """Turns a generator of event dicts into coalesced, optionally compressed SSE bytes.
+
+    The events are pulled on a separate thread so the writer can flush on
+    time and send heartbeat comments while the source is blocked, e.g. on a
+    model call. The first event is written at once; after that, text deltas
+    arriving within `coalesce_seconds` of each other are merged into one
+    frame, and a write happens once that window closes or `max_bytes` are
+    pending. With `encoding` set to gzip or deflate each
+    write is compressed and sync-flushed so the client can decode it at once.
+    """
+
+    def __init__(self, events, coalesce_seconds=0.05, max_bytes=2048, heartbeat_seconds=15, encoding=None,
+                 run=None):
+        self.events = events
+        self.coalesce_seconds = coalesce_seconds
+        self.max_bytes = max_bytes
+        self.heartbeat_seconds = heartbeat_seconds
+        self.encoding = encoding
+        # `run` wraps the producer, e.g. to carry the request's trace context into its thread
+        self._target = run(self._produce) if run else self._produce
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._producer = None
+        if encoding == 'gzip':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        elif encoding == 'deflate':
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, 15)
+        else:
+            self._compressor = None
+
+    def _produce(self):
+        if gevent is not None and monkey.is_module_patched('threading'):
+            # Under gevent this thread is a greenlet, which close() can kill while it waits on a socket
+            self._producer = gevent.getcurrent()
+        try:
+            events = iter(self.events)
+            while not self._stopped.is_set():
+                try:
+                    event = next(events)
+                except StopIteration:
+                    break
+                self._queue.put(event)
+        except _PRODUCER_KILLED:
+            pass
+        except Exception as e:
+            self._queue.put(e)
+        finally:
+            # Runs the source's own cleanup (e.g. cancelling section streams) on this thread
+            close = getattr(self.events, 'close', None)
+            if close:
+                close()
+            self._queue.put(_DONE)
+
+    def _output(self, data, final=False):
+        if self._compressor is None:
+            return data
+        compressed = self._compressor.compress(data)
+        return compressed + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+    def __iter__(self):
+        return self._stream()
+
+    def close(self):
+        # Called by the WSGI server when the client goes away. Without gevent the producer stops
+        # after its current event; with gevent it is killed even while blocked on the upstream call.
+        self._stopped.set()
+        producer = self._producer
+        if producer is not None and producer is not gevent.getcurrent() and not producer.dead:
+            producer.kill(block=False)
+
+    def _stream(self):
+        threading.Thread(target=self._target, name="sse-producer", daemon=True).start()
+        frames = []
+        pending = None
+        size = 0
+        deadline = None
+        first = True
+        try:
+            while True:
+                if deadline is not None:
+                    timeout = max(0.0, deadline - time.monotonic())
+                else:
+                    timeout = self.heartbeat_seconds
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    if deadline is None:
+                        yield self._output(HEARTBEAT_FRAME)
+                        continue
+                    item = None
+
+                finished = item is _DONE
+                if isinstance(item, Exception):
+                    raise item
+                if item is not None and not finished:
+                    if _can_merge(pending, item):
+                        pending = dict(pending, content=pending['content'] + item['content'])
+                        size += len(item['content'])
+                    else:
+                        if pending is not None:
+                            frames.append(encode_event(pending))
+                        pending = item
+                        size += len(item.get('content', '')) if isinstance(item.get('content'), str) else 64
+                    if deadline is None:
+                        # Nothing to merge the first event (e.g. the metadata) with, so it goes out at once
+                        deadline = time.monotonic() + (0 if first else self.coalesce_seconds)
+                        first = False
+
+                if finished or size >= self.max_bytes or time.monotonic() >= deadline:
+                    if pending is not None:
+                        frames.append(encode_event(pending))
+                    if frames or finished:
+                        yield self._output(b"".join(frames), final=finished)
+                    frames, pending, size, deadline = [], None, 0, None
+                if finished:
+                    return
+        finally:
+            self._stopped.set()
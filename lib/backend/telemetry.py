@@ -0,0 +1,257 @@
+import bisect
+import contextvars
+import threading
+import time
+import uuid
+from collections import deque
+
+# Seconds; covers sub-100ms retrievals up to long streamed answers
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 21, 34, 60)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items(), key=lambda item: str(item[0])):
+                lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._series.items(), key=lambda item: str(item[0])):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def counter(self, name, documentation):
+        metric = Counter(name, documentation)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+BEDROCK_DURATION = registry.histogram(
+    "bedrock_request_duration_seconds", "Total duration of Bedrock runtime calls, including the full stream")
+BEDROCK_TTFT = registry.histogram(
+    "bedrock_time_to_first_token_seconds", "Time from a converse_stream call to its first content delta")
+BEDROCK_INPUT_TOKENS = registry.counter("bedrock_input_tokens_total", "Input tokens reported by Bedrock")
+BEDROCK_OUTPUT_TOKENS = registry.counter("bedrock_output_tokens_total", "Output tokens reported by Bedrock")
+BEDROCK_ERRORS = registry.counter("bedrock_errors_total", "Failed Bedrock runtime calls")
+RETRIEVAL_DURATION = registry.histogram(
+    "retrieval_duration_seconds", "Duration of Knowledge Base retrieval calls")
+RETRIEVAL_DOCUMENTS = registry.counter("retrieval_documents_total", "Documents returned by retrieval calls")
+RETRIEVAL_ERRORS = registry.counter("retrieval_errors_total", "Failed Knowledge Base retrieval calls")
+RETRIEVAL_STAGE_DURATION = registry.histogram(
+    "retrieval_stage_duration_seconds", "Duration of each retrieval pipeline stage (fetch, rerank)",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2, 5))
+WARM_START_FAILURES = registry.counter(
+    "warm_start_build_failures_total", "Failed builds of warm start snapshots, each retried with backoff")
+CONTEXT_TOKENS = registry.histogram(
+    "prompt_context_tokens", "Estimated tokens of retrieved context placed in a prompt",
+    buckets=(250, 500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000))
+
+
+class Trace:
+    def __init__(self, name):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.spans = []
+
+    def add_span(self, name, started_at, duration, **attributes):
+        self.spans.append({
+            "name": name,
+            "offset_ms": round((started_at - self.started_at) * 1000, 1),
+            "duration_ms": round(duration * 1000, 1),
+            **attributes,
+        })
+
+    def to_dict(self):
+        return {"trace_id": self.trace_id, "name": self.name, "started_at": self.started_at, "spans": list(self.spans)}
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+recent_traces = deque(maxlen=200)
+
+
+def start_trace(name):
+    trace = Trace(name)
+    _current_trace.set(trace)
+    recent_traces.append(trace)
+    return trace
+
+
+def record_span(name, started_at, duration, **attributes):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, started_at, duration, **attributes)
+
+
+def in_current_context(fn):
+    """Wrap `fn` so it runs with the caller's trace when submitted to a thread pool."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+def _error_code(error):
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):
+        return response.get("Error", {}).get("Code", type(error).__name__)
+    return type(error).__name__
+
+
+class InstrumentedBedrockClient:
+    """Records latency, time to first token and token usage for Bedrock runtime calls."""
+
+    def __init__(self, client):
+        self.client = client
+        self.region = client.meta.region_name
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _served_region(self):
+        # A FailoverClient reports the region that actually answered; plain clients have one region
+        return getattr(self.client, "served_region", None) or self.region
+
+    def _record(self, operation, model_id, started_at, duration, usage=None, ttft=None, region=None):
+        region = region or self.region
+        labels = {"model": model_id, "operation": operation, "region": region}
+        BEDROCK_DURATION.observe(duration, **labels)
+        attributes = {"model": model_id, "region": region}
+        if ttft is not None:
+            BEDROCK_TTFT.observe(ttft, model=model_id, region=region)
+            attributes["ttft_ms"] = round(ttft * 1000, 1)
+        if usage:
+            BEDROCK_INPUT_TOKENS.inc(usage.get("inputTokens", 0), model=model_id)
+            BEDROCK_OUTPUT_TOKENS.inc(usage.get("outputTokens", 0), model=model_id)
+            attributes["input_tokens"] = usage.get("inputTokens", 0)
+            attributes["output_tokens"] = usage.get("outputTokens", 0)
+        record_span(f"bedrock.{operation}", started_at, duration, **attributes)
+
+    def _call(self, operation, kwargs):
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            response = getattr(self.client, operation)(**kwargs)
+            return response, started_at, start, self._served_region()
+        except Exception as e:
+            BEDROCK_ERRORS.inc(model=kwargs.get("modelId"), operation=operation, code=_error_code(e))
+            raise
+
+    def converse(self, **kwargs):
+        response, started_at, start, region = self._call("converse", kwargs)
+        self._record("converse", kwargs.get("modelId"), started_at, time.perf_counter() - start,
+                     usage=response.get("usage"), region=region)
+        return response
+
+    def invoke_model(self, **kwargs):
+        response, started_at, start, region = self._call("invoke_model", kwargs)
+        self._record("invoke_model", kwargs.get("modelId"), started_at, time.perf_counter() - start,
+                     region=region)
+        return response
+
+    def converse_stream(self, **kwargs):
+        response, started_at, start, region = self._call("converse_stream", kwargs)
+        model_id = kwargs.get("modelId")
+
+        def stream():
+            ttft = None
+            usage = None
+            try:
+                for chunk in response["stream"]:
+                    if ttft is None and "contentBlockDelta" in chunk:
+                        ttft = time.perf_counter() - start
+                    if "metadata" in chunk:
+                        usage = chunk["metadata"].get("usage")
+                    yield chunk
+            except Exception as e:
+                BEDROCK_ERRORS.inc(model=model_id, operation="converse_stream", code=_error_code(e))
+                raise
+            finally:
+                self._record("converse_stream", model_id, started_at, time.perf_counter() - start,
+                             usage=usage, ttft=ttft, region=region)
+
+        return dict(response, stream=stream())
+
+
+class InstrumentedRetriever:
+    """Records the latency and result count of every call to a Knowledge Base retriever."""
+
+    def __init__(self, retriever, name):
+        self.retriever = retriever
+        self.name = name
+
+    def __getattr__(self, name):
+        return getattr(self.retriever, name)
+
+    def get_relevant_documents(self, query):
+        started_at = time.time()
+        start = time.perf_counter()
+        try:
+            docs = self.retriever.get_relevant_documents(query)
+        except Exception as e:
+            RETRIEVAL_ERRORS.inc(retriever=self.name, code=_error_code(e))
+            raise
+        duration = time.perf_counter() - start
+        RETRIEVAL_DURATION.observe(duration, retriever=self.name)
+        RETRIEVAL_DOCUMENTS.inc(len(docs), retriever=self.name)
+        record_span(f"retrieval.{self.name}", started_at, duration, documents=len(docs))
+        return docs
@@ -0,0 +1,164 @@
+import json
+import os
+import threading
+import time
+
+
+class FileSnapshotStore:
+    """Keeps snapshots as JSON files in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        safe_key = "".join(c if c.isalnum() or c in "-_" else "_" for c in key)
+        return os.path.join(self.directory, f"{safe_key}.json")
+
+    def load(self, key):
+        try:
+            with open(self._path(key), "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, key, snapshot):
+        # Write to a temporary file first so concurrent workers never read a partial snapshot
+        path = self._path(key)
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(snapshot, f)
+        os.replace(temporary_path, path)
+
+
+class DynamoDBSnapshotStore:
+    """Keeps snapshots in a DynamoDB table with a string partition key named `key`.
+
+    Items carry an `expires_at` epoch attribute so the table's TTL removes
+    snapshots nobody has refreshed for `retention_seconds`.
+    """
+
+    def __init__(self, client, table_name, retention_seconds=30 * 24 * 3600):
+        self.client = client
+        self.table_name = table_name
+        self.retention_seconds = retention_seconds
+
+    def load(self, key):
+        response = self.client.get_item(TableName=self.table_name, Key={"key": {"S": key}})
+        item = response.get("Item")
+        return json.loads(item["snapshot"]["S"]) if item else None
+
+    def save(self, key, snapshot):
+        self.client.put_item(
+            TableName=self.table_name,
+            Item={
+                "key": {"S": key},
+                "snapshot": {"S": json.dumps(snapshot)},
+                "expires_at": {"N": str(int(time.time() + self.retention_seconds))},
+            },
+        )
+
+
+class WarmStartCache:
+    """Persists expensive startup artifacts so restarts do not have to rebuild them.
+
+    A snapshot is usable when it was built with the same `version`. It is
+    fresh for `ttl_seconds`; after that it is rebuilt. With
+    `refresh_mode="background"` a stale snapshot keeps being served while a
+    thread rebuilds it, and when there is no snapshot at all `default` is
+    served until the first build finishes, so startup never blocks on
+    model calls. A failed background build is retried with exponential
+    backoff, from `retry_delay` up to `max_retry_delay` seconds, until one
+    succeeds; `on_failure(key, error)` is called for every failed attempt.
+    With `refresh_mode="blocking"` builds run inline.
+    """
+
+    def __init__(self, store, version, ttl_seconds=24 * 3600, refresh_mode="background",
+                 retry_delay=30, max_retry_delay=600, on_failure=None):
+        self.store = store
+        self.version = version
+        self.ttl_seconds = ttl_seconds
+        self.refresh_mode = refresh_mode
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.on_failure = on_failure
+        self.failures = 0
+        self._refreshing = set()
+        self._serving_default = set()
+        self._lock = threading.Lock()
+
+    def load(self, key, builder, on_ready, default=None):
+        """Call `on_ready(value)` with the best available value now, and again after any rebuild."""
+        try:
+            snapshot = self.store.load(key)
+        except Exception as e:
+            print(f"Error loading warm start snapshot {key}: {e}")
+            snapshot = None
+
+        if snapshot is not None and snapshot.get("version") == self.version:
+            on_ready(snapshot["value"])
+            age = time.time() - snapshot.get("created_at", 0)
+            if age < self.ttl_seconds:
+                print(f"Loaded warm start snapshot {key} ({int(age)}s old)")
+                return
+            print(f"Warm start snapshot {key} is stale ({int(age)}s old), refreshing")
+        elif self.refresh_mode == "background":
+            print(f"No warm start snapshot {key}, serving defaults until it is built")
+            with self._lock:
+                self._serving_default.add(key)
+            on_ready(default)
+
+        self.refresh(key, builder, on_ready)
+
+    def refresh(self, key, builder, on_ready):
+        if self.refresh_mode != "background":
+            self._build(key, builder, on_ready)
+            return
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def run():
+            delay = self.retry_delay
+            try:
+                while True:
+                    try:
+                        self._build(key, builder, on_ready)
+                        return
+                    except Exception as e:
+                        with self._lock:
+                            self.failures += 1
+                            fallback = "defaults" if key in self._serving_default else "the stale snapshot"
+                        print(f"Error refreshing warm start snapshot {key}, serving {fallback} "
+                              f"and retrying in {delay}s: {e}")
+                        if self.on_failure is not None:
+                            self.on_failure(key, e)
+                    time.sleep(delay)
+                    delay = min(delay * 2, self.max_retry_delay)
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, name=f"warm-start-{key}", daemon=True).start()
+
+    def _build(self, key, builder, on_ready):
+        start = time.time()
+        value = builder()
+        on_ready(value)
+        with self._lock:
+            self._serving_default.discard(key)
+        try:
+            self.store.save(key, {"version": self.version, "created_at": time.time(), "value": value})
+        except Exception as e:
+            print(f"Error saving warm start snapshot {key}: {e}")
+        print(f"Built warm start snapshot {key} in {time.time() - start:.1f}s")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "refreshing": sorted(self._refreshing),
+                "serving_default": sorted(self._serving_default),
+                "failures": self.failures,
+            }
@@ -53,6 +53,8 @@ const theme = createTheme({
 });
 
 
+const RESTORE_HISTORY_MESSAGES = 8;
+
 const ChatBot: React.FC<ChatBotProps> = ({ backendUrl, customerName }) => {
   const [messages, setMessages] = useState<Message[]>([{
     text: `Hello! I am the ${customerName} AI assistant. I can help you with information about ${customerName}'s products and services and create visualizations. How can I help you today?`,
@@ -64,6 +66,9 @@ const ChatBot: React.FC<ChatBotProps> = ({ backendUrl, customerName }) => {
   const [isLoading, setIsLoading] = useState(false);
   const [suggestedQuestions, setSuggestedQuestions] = useState<string[]>([]);
   const messagesEndRef = useRef<null | HTMLDivElement>(null);
+  // The backend keeps the conversation under this id, so only recent messages are sent along
+  // (they let the backend restore the conversation if it no longer has it)
+  const conversationId = useRef(`${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`);
 
   useEffect(() => {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
@@ -102,21 +107,25 @@ const ChatBot: React.FC<ChatBotProps> = ({ backendUrl, customerName }) => {
         },
         body: JSON.stringify({
           question: questionToSend,
-          chat_history: messages.map(m => m.text),
+          conversation_id: conversationId.current,
+          chat_history: messages.slice(-RESTORE_HISTORY_MESSAGES).map(m => m.text),
           prompt_modifier: promptModifier
         }),
       });
 
       const reader = response.body!.getReader();
       const decoder = new TextDecoder();
+      // Frames can span reads; keep the unfinished tail for the next one
+      let buffer = '';
       let botMessage: Message = { text: '', isUser: false };
 
       while (true) {
         const { done, value } = await reader.read();
         if (done) break;
 
-        const chunk = decoder.decode(value);
-        const lines = chunk.split('\n\n');
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n\n');
+        buffer = lines.pop() || '';
         for (const line of lines) {
           if (line.startsWith('data: ')) {
             try {
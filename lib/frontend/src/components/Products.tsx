@@ -48,6 +48,8 @@ const ProductGrid: React.FC<ProductGridProps> = ({ backendUrl }) => {
         }
         const reader = response.body!.getReader();
         const decoder = new TextDecoder();
+        // Frames can span reads; keep the unfinished tail for the next one
+        let buffer = '';
 
         let fetchedProducts: Product[] = [];
 
@@ -55,8 +57,9 @@ const ProductGrid: React.FC<ProductGridProps> = ({ backendUrl }) => {
           const { done, value } = await reader.read();
           if (done) break;
 
-          const chunk = decoder.decode(value);
-          const lines = chunk.split('\n\n');
+          buffer += decoder.decode(value, { stream: true });
+          const lines = buffer.split('\n\n');
+          buffer = lines.pop() || '';
           
           for (const line of lines) {
             if (line.startsWith('data: ')) {
@@ -0,0 +1,111 @@
+"""Measure recall and query latency of each vector index HNSW profile.
+
+Builds a FAISS HNSW index, the engine OpenSearch Serverless uses for the
+Knowledge Base, with the parameters of every profile in
+initialize-index-lambda/hnsw_profiles.py, and compares its results to an
+exact search on the same corpus.
+
+The corpus is either synthetic (clustered unit vectors shaped like text
+embeddings) or a .npy file of real embeddings, e.g. exported from the
+collection. Usage, from lib/kb-stack:
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/hnsw_recall.py --documents 20000 --dimension 1536
+    python benchmarks/hnsw_recall.py --corpus embeddings.npy
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import faiss
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'initialize-index-lambda'))
+from hnsw_profiles import HNSW_PROFILES
+
+
+def synthetic_corpus(documents, dimension, clusters, seed):
+    # Chunks of one web site cluster around a handful of topics
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype('float32')
+    assignments = rng.integers(0, clusters, size=documents)
+    vectors = centers[assignments] + 0.6 * rng.normal(size=(documents, dimension)).astype('float32')
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def sample_queries(corpus, count, seed):
+    # Questions land near, but not on, the chunks that answer them
+    rng = np.random.default_rng(seed + 1)
+    queries = corpus[rng.integers(0, len(corpus), size=count)]
+    queries = queries + 0.3 * rng.normal(size=queries.shape).astype('float32') / np.sqrt(corpus.shape[1])
+    return (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype('float32')
+
+
+def benchmark_profile(name, parameters, corpus, queries, truth, k):
+    index = faiss.IndexHNSWFlat(corpus.shape[1], parameters['m'])
+    index.hnsw.efConstruction = parameters['ef_construction']
+    start = time.perf_counter()
+    index.add(corpus)
+    build_seconds = time.perf_counter() - start
+    index.hnsw.efSearch = parameters['ef_search']
+
+    # One query at a time, like a Knowledge Base retrieval
+    latencies = []
+    found = np.empty((len(queries), k), dtype='int64')
+    for row, query in enumerate(queries):
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[row] = ids[0]
+
+    recall = np.mean([len(set(found[row]) & set(truth[row])) / k for row in range(len(queries))])
+    return {
+        'profile': name,
+        **parameters,
+        f'recall_at_{k}': round(float(recall), 4),
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)), 3),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)), 3),
+        'build_seconds': round(build_seconds, 2),
+        'index_mb': round(len(faiss.serialize_index(index)) / 1024 / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall versus latency of the vector index HNSW profiles")
+    parser.add_argument('--corpus', help="Optional .npy file of embeddings to index instead of a synthetic corpus")
+    parser.add_argument('--documents', type=int, default=20000, help="Synthetic corpus size")
+    parser.add_argument('--dimension', type=int, default=1536, help="Synthetic embedding dimension")
+    parser.add_argument('--clusters', type=int, default=50, help="Synthetic topics")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--k', type=int, default=5, help="Results per query; the backend retrievers ask for 5 or 10")
+    parser.add_argument('--profiles', nargs='+', choices=sorted(HNSW_PROFILES), default=list(HNSW_PROFILES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Also write the results to this file")
+    args = parser.parse_args()
+
+    faiss.omp_set_num_threads(1)
+    if args.corpus:
+        corpus = np.load(args.corpus).astype('float32')
+    else:
+        corpus = synthetic_corpus(args.documents, args.dimension, args.clusters, args.seed)
+    queries = sample_queries(corpus, args.queries, args.seed)
+
+    exact = faiss.IndexFlatL2(corpus.shape[1])
+    exact.add(corpus)
+    _, truth = exact.search(queries, args.k)
+    print(f"{len(corpus)} vectors of dimension {corpus.shape[1]}, {len(queries)} queries, k={args.k}")
+
+    rows = [benchmark_profile(name, HNSW_PROFILES[name], corpus, queries, truth, args.k) for name in args.profiles]
+    columns = list(rows[0])
+    widths = {column: max(len(column), *(len(str(row[column])) for row in rows)) for column in columns}
+    print("  ".join(column.rjust(widths[column]) for column in columns))
+    for row in rows:
+        print("  ".join(str(row[column]).rjust(widths[column]) for column in columns))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
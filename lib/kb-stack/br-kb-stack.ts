@@ -7,10 +7,47 @@ import * as cr from 'aws-cdk-lib/custom-resources';
 import * as path from 'path';
 import * as opensearchserverless from 'aws-cdk-lib/aws-opensearchserverless';
 import * as logs from 'aws-cdk-lib/aws-logs';
+import * as events from 'aws-cdk-lib/aws-events';
+import * as targets from 'aws-cdk-lib/aws-events-targets';
+
+// Chunking applied when the web crawler data source is created. Bedrock cannot change chunking
+// in place, so changing any of these replaces the data source and re-ingests the site.
+export interface KBChunkingConfig {
+    strategy?: 'NONE' | 'FIXED_SIZE' | 'HIERARCHICAL' | 'SEMANTIC';
+    // FIXED_SIZE and SEMANTIC
+    maxTokens?: number;
+    // FIXED_SIZE
+    overlapPercentage?: number;
+    // HIERARCHICAL
+    parentMaxTokens?: number;
+    childMaxTokens?: number;
+    overlapTokens?: number;
+    // SEMANTIC
+    bufferSize?: number;
+    breakpointPercentileThreshold?: number;
+}
+
+export interface KBCrawlerConfig {
+    rateLimit?: number;
+    maxPages?: number;
+    scope?: 'HOST_ONLY' | 'SUBDOMAINS';
+    inclusionFilters?: string[];
+    exclusionFilters?: string[];
+}
 
 interface KBStackProps extends cdk.StackProps {
     customerName: string;
     scrapeUrls?: string[];
+    chunking?: KBChunkingConfig;
+    crawler?: KBCrawlerConfig;
+    // EventBridge schedule expression for incremental re-crawls, e.g. 'rate(7 days)'. 'off' disables them.
+    recrawlSchedule?: string;
+    // HNSW parameter profile of the vector index, see initialize-index-lambda/hnsw_profiles.py.
+    // Left unset, new indexes use 'latency' and existing ones keep whatever they were created with.
+    indexProfile?: 'latency' | 'recall' | 'memory' | 'legacy';
+    // Embedding model and, for models that support it, a shorter vector dimension
+    embeddingModel?: string;
+    embeddingDimensions?: number;
 }
 
 export class KBStack extends cdk.Stack {
@@ -117,6 +154,9 @@ export class KBStack extends cdk.Stack {
             resources: [ossCollection.attrArn],
         }));
 
+        // The index dimension and the Knowledge Base embedding model must agree
+        const embeddingModel = props.embeddingModel ?? 'amazon.titan-embed-text-v1';
+
         // Create a Lambda function to initialize the index
         const initializeIndexLambda = new lambdaPython.PythonFunction(this, 'InitializeIndexLambda', {
             entry: path.join(__dirname, 'initialize-index-lambda'),
@@ -141,6 +181,9 @@ export class KBStack extends cdk.Stack {
             serviceToken: initializeIndexProvider.serviceToken,
             properties: {
                 CollectionEndpoint: ossCollection.attrCollectionEndpoint,
+                IndexProfile: props.indexProfile,
+                EmbeddingModelId: embeddingModel,
+                EmbeddingDimension: props.embeddingDimensions,
             },
         });
 
@@ -157,7 +200,7 @@ export class KBStack extends cdk.Stack {
             knowledgeBaseConfiguration: {
                 type: 'VECTOR',
                 vectorKnowledgeBaseConfiguration: {
-                    embeddingModelArn: 'arn:aws:bedrock:us-east-1::foundation-model/amazon.titan-embed-text-v1',
+                    embeddingModelArn: `arn:aws:bedrock:us-east-1::foundation-model/${embeddingModel}`,
                 },
             },
             storageConfiguration: {
@@ -175,6 +218,12 @@ export class KBStack extends cdk.Stack {
             description: 'Bedrock Knowledge Base',
         });
         knowledgeBase.node.addDependency(ossIndexResource);
+        if (props.embeddingDimensions !== undefined) {
+            knowledgeBase.addPropertyOverride(
+                'KnowledgeBaseConfiguration.VectorKnowledgeBaseConfiguration.EmbeddingModelConfiguration.BedrockEmbeddingModelConfiguration.Dimensions',
+                props.embeddingDimensions,
+            );
+        }
 
         // Create a new role for the Lambda function
         const dataSourceLambdaRole = new iam.Role(this, 'DataSourceLambdaRole', {
@@ -227,7 +276,8 @@ export class KBStack extends cdk.Stack {
             properties: {
                 urls: props?.scrapeUrls,
                 knowledgeBaseId: knowledgeBase.attrKnowledgeBaseId,
-                
+                chunking: { strategy: 'FIXED_SIZE', ...props.chunking },
+                crawler: props.crawler ?? {},
             },
         });
 
@@ -244,7 +294,8 @@ export class KBStack extends cdk.Stack {
             actions: [
                 'bedrock:StartIngestionJob',
                 'bedrock:GetIngestionJob',
-                'bedrock:ListIngestionJobs'
+                'bedrock:ListIngestionJobs',
+                'bedrock:StopIngestionJob'
             ],
             resources: ['*'],
         }));
@@ -255,6 +306,8 @@ export class KBStack extends cdk.Stack {
             handler: 'index.lambda_handler',
             code: lambda.Code.fromAsset(path.join(__dirname, 'start-ingestion-job')),
             role: ingestionJobLambdaRole,
+            // Re-ingestion waits for a running crawl to stop first
+            timeout: cdk.Duration.seconds(300),
         });
 
         // Create a provider for the ingestion job custom resource
@@ -268,11 +321,49 @@ export class KBStack extends cdk.Stack {
             serviceToken: ingestionJobProvider.serviceToken,
             properties: {
                 knowledgeBaseId: knowledgeBase.attrKnowledgeBaseId,
-                dataSourceId: brDataSourceResource.getAtt('dataSourceId')
+                dataSourceId: brDataSourceResource.getAtt('dataSourceId'),
+                configHash: brDataSourceResource.getAtt('configHash'),
             },
         });
 
         brIngestionJobResource.node.addDependency(brDataSourceResource);
+
+        // Ingestion monitor: starts incremental re-crawls on a schedule (never overlapping a running
+        // job) and logs each job's statistics and throughput. `start.py ingest` uses the same logic.
+        const ingestionMonitorLambda = new lambda.Function(this, 'IngestionMonitorLambda', {
+            runtime: lambda.Runtime.PYTHON_3_9,
+            handler: 'index.lambda_handler',
+            code: lambda.Code.fromAsset(path.join(__dirname, 'ingestion-monitor')),
+            role: ingestionJobLambdaRole,
+            timeout: cdk.Duration.minutes(15),
+            environment: {
+                KNOWLEDGE_BASE_ID: knowledgeBase.attrKnowledgeBaseId,
+                DATA_SOURCE_ID: brDataSourceResource.getAtt('dataSourceId').toString(),
+            },
+            logRetention: logs.RetentionDays.ONE_MONTH,
+        });
+
+        const recrawlSchedule = props.recrawlSchedule ?? 'rate(1 day)';
+        if (recrawlSchedule !== 'off') {
+            new events.Rule(this, 'RecrawlSchedule', {
+                schedule: events.Schedule.expression(recrawlSchedule),
+                targets: [new targets.LambdaFunction(ingestionMonitorLambda)],
+            });
+        }
+
+        new cdk.CfnOutput(this, 'KnowledgeBaseId', {
+            value: knowledgeBase.attrKnowledgeBaseId,
+            description: 'Bedrock Knowledge Base ID',
+        });
+        new cdk.CfnOutput(this, 'DataSourceId', {
+            value: brDataSourceResource.getAtt('dataSourceId').toString(),
+            description: 'Web crawler data source ID',
+        });
+        new cdk.CfnOutput(this, 'IngestionMonitorFunctionName', {
+            value: ingestionMonitorLambda.functionName,
+            description: 'Lambda that starts and monitors re-crawls',
+        });
+
         this.knowledgeBaseId = knowledgeBase.attrKnowledgeBaseId;
     }
 }
\ No newline at end of file
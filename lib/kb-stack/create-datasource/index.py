@@ -1,8 +1,27 @@
 import boto3
+import hashlib
+import json
 import time
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
-bedrock_agent = boto3.client('bedrock-agent')
+# Created once per Lambda container and reused across invocations
+bedrock_agent = boto3.client('bedrock-agent', config=Config(
+    tcp_keepalive=True,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+))
+
+DATA_SOURCE_NAME = 'WebCrawlerDataSource'
+DATA_SOURCE_DESCRIPTION = 'Web crawler data source for Bedrock Knowledge Base'
+
+# Defaults per chunking strategy. Custom resource properties arrive as strings,
+# so numeric settings are converted before they are sent to Bedrock.
+CHUNKING_DEFAULTS = {
+    'NONE': {},
+    'FIXED_SIZE': {'maxTokens': 300, 'overlapPercentage': 20},
+    'HIERARCHICAL': {'parentMaxTokens': 1500, 'childMaxTokens': 300, 'overlapTokens': 60},
+    'SEMANTIC': {'maxTokens': 300, 'bufferSize': 0, 'breakpointPercentileThreshold': 95},
+}
 
 def lambda_handler(event, context):
     if event['RequestType'] == 'Create':
@@ -12,44 +31,103 @@ def lambda_handler(event, context):
     elif event['RequestType'] == 'Delete':
         return delete_data_source(event, context)
 
+def chunking_settings(props):
+    # Resources created before chunking was configurable have no 'chunking' property and use NONE
+    chunking = props.get('chunking') or {'strategy': 'NONE'}
+    strategy = chunking.get('strategy', 'FIXED_SIZE').upper()
+    if strategy not in CHUNKING_DEFAULTS:
+        raise ValueError(f"Unsupported chunking strategy {strategy}, expected one of {', '.join(CHUNKING_DEFAULTS)}")
+    settings = {'strategy': strategy}
+    for key, default in CHUNKING_DEFAULTS[strategy].items():
+        settings[key] = int(chunking.get(key, default))
+    return settings
+
+def vector_ingestion_configuration(props):
+    settings = chunking_settings(props)
+    strategy = settings['strategy']
+    chunking = {'chunkingStrategy': strategy}
+    if strategy == 'FIXED_SIZE':
+        chunking['fixedSizeChunkingConfiguration'] = {
+            'maxTokens': settings['maxTokens'],
+            'overlapPercentage': settings['overlapPercentage'],
+        }
+    elif strategy == 'HIERARCHICAL':
+        chunking['hierarchicalChunkingConfiguration'] = {
+            'levelConfigurations': [
+                {'maxTokens': settings['parentMaxTokens']},
+                {'maxTokens': settings['childMaxTokens']},
+            ],
+            'overlapTokens': settings['overlapTokens'],
+        }
+    elif strategy == 'SEMANTIC':
+        chunking['semanticChunkingConfiguration'] = {
+            'maxTokens': settings['maxTokens'],
+            'bufferSize': settings['bufferSize'],
+            'breakpointPercentileThreshold': settings['breakpointPercentileThreshold'],
+        }
+    return {'chunkingConfiguration': chunking}
+
+def crawler_configuration(props):
+    crawler = props.get('crawler') or {}
+    limits = {'rateLimit': int(crawler.get('rateLimit', 300))}
+    if crawler.get('maxPages'):
+        limits['maxPages'] = int(crawler['maxPages'])
+    configuration = {
+        'crawlerLimits': limits,
+        'scope': crawler.get('scope', 'SUBDOMAINS'),
+    }
+    if crawler.get('inclusionFilters'):
+        configuration['inclusionFilters'] = list(crawler['inclusionFilters'])
+    if crawler.get('exclusionFilters'):
+        configuration['exclusionFilters'] = list(crawler['exclusionFilters'])
+    return configuration
+
+def data_source_configuration(props):
+    return {
+        'type': 'WEB',
+        'webConfiguration': {
+            'crawlerConfiguration': crawler_configuration(props),
+            'sourceConfiguration': {
+                'urlConfiguration': {
+                    'seedUrls': [{"url": url} for url in props['urls']]
+                }
+            }
+        }
+    }
+
+def config_hash(value):
+    return hashlib.sha256(json.dumps(value, sort_keys=True).encode()).hexdigest()[:16]
+
+def resource_data(data_source_id, props):
+    # configHash changes whenever the crawl or chunking settings do, so the ingestion job
+    # resource that depends on it is updated and re-ingests the data source
+    return {
+        'dataSourceId': data_source_id,
+        'configHash': config_hash([data_source_configuration(props), vector_ingestion_configuration(props)]),
+    }
+
 def create_data_source(event, context):
     try:
         props = event['ResourceProperties']
         knowledge_base_id = props['knowledgeBaseId']
-        urls = [{"url": url} for url in props['urls']]
-        print(urls)
+        vector_configuration = vector_ingestion_configuration(props)
+        print(f"Creating data source for {props['urls']} with {vector_configuration}")
+        # Chunking cannot be changed after creation, so each chunking configuration gets its own
+        # name and a replacement can be created before the old data source is deleted
         response = bedrock_agent.create_data_source(
             knowledgeBaseId=knowledge_base_id,
-            name='WebCrawlerDataSource',
-            description='Web crawler data source for Bedrock Knowledge Base',
-            dataDeletionPolicy='RETAIN',  # Add this line
-            dataSourceConfiguration={
-                'type': 'WEB',
-                'webConfiguration': {
-                    'crawlerConfiguration': {
-                        'crawlerLimits': {
-                            'rateLimit': 300  # Max rate, adjust as needed
-                        },
-                        'scope': 'SUBDOMAINS'  # Adjust scope as needed
-                    },
-                    'sourceConfiguration': {
-                        'urlConfiguration': {
-                            'seedUrls': urls
-                        }
-                    }
-                }
-            },
-            vectorIngestionConfiguration={
-                'chunkingConfiguration': {
-                    'chunkingStrategy': 'NONE',
-                }
-            }
+            name=f"{DATA_SOURCE_NAME}-{config_hash(vector_configuration)[:8]}",
+            description=DATA_SOURCE_DESCRIPTION,
+            # Deleting a replaced data source must also remove its chunks from the index
+            dataDeletionPolicy='DELETE',
+            dataSourceConfiguration=data_source_configuration(props),
+            vectorIngestionConfiguration=vector_configuration,
         )
 
         data_source_id = response['dataSource']['dataSourceId']
         status = response['dataSource']['status']
         print(response)
-        
+
         if status != 'AVAILABLE':
             failure_reasons = response['dataSource'].get('failureReasons', [])
             if failure_reasons:
@@ -58,17 +136,39 @@ def create_data_source(event, context):
         return {
             'Status': 'SUCCESS',
             'PhysicalResourceId': data_source_id,
-            'Data': {
-                'dataSourceId': data_source_id
-            }
+            'Data': resource_data(data_source_id, props)
         }
     except Exception as e:
         print(f"Error: {str(e)}")
         raise e
+
+def retire_data_source(knowledge_base_id, data_source_id):
+    # Data sources created before chunking was configurable use the RETAIN policy, which would
+    # leave their whole-page chunks in the index next to the replacement's chunks
+    data_source = bedrock_agent.get_data_source(knowledgeBaseId=knowledge_base_id, dataSourceId=data_source_id)['dataSource']
+    if data_source.get('dataDeletionPolicy') == 'DELETE':
+        return
+    print(f"Switching data source {data_source_id} to the DELETE data deletion policy")
+    bedrock_agent.update_data_source(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        name=data_source['name'],
+        description=data_source.get('description', DATA_SOURCE_DESCRIPTION),
+        dataDeletionPolicy='DELETE',
+        dataSourceConfiguration=data_source['dataSourceConfiguration'],
+        vectorIngestionConfiguration=data_source.get('vectorIngestionConfiguration', {}),
+    )
+
 def delete_data_source(event, context):
+    knowledge_base_id = event['ResourceProperties']['knowledgeBaseId']
+    data_source_id = event['PhysicalResourceId']
     try:
-        knowledge_base_id = event['ResourceProperties']['knowledgeBaseId']
-        data_source_id = event['PhysicalResourceId']
+        try:
+            retire_data_source(knowledge_base_id, data_source_id)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                raise
+            print(f"Could not change the data deletion policy, deleting anyway: {e}")
         bedrock_agent.delete_data_source(knowledgeBaseId=knowledge_base_id, dataSourceId=data_source_id)
         max_retries = 30
         retry_delay = 5  # seconds
@@ -91,7 +191,7 @@ def delete_data_source(event, context):
 
         print(f"Data source not deleted after {max_retries} attempts")
         raise Exception("Failed to confirm data source deletion")
-    except Exception as e:
+    except ClientError as e:
         if e.response['Error']['Code'] == 'ResourceNotFoundException':
             print("Data source successfully deleted")
             return {
@@ -101,38 +201,37 @@ def delete_data_source(event, context):
         else:
             print(f"Unexpected error: {e}")
             raise e
+
 def update_data_source(event, context):
     try:
         props = event['ResourceProperties']
+        old_props = event.get('OldResourceProperties', {})
         knowledge_base_id = props['knowledgeBaseId']
-        data_source_id = props['dataSourceId']
-        urls = [{"url": url} for url in props['urls']]
+        data_source_id = event['PhysicalResourceId']
+
+        # Chunking is fixed when a data source is created. A new chunking configuration (or
+        # knowledge base) needs a replacement data source; returning its id makes CloudFormation
+        # delete the old one once the update succeeds.
+        if (knowledge_base_id != old_props.get('knowledgeBaseId')
+                or vector_ingestion_configuration(props) != vector_ingestion_configuration(old_props)):
+            print(f"Chunking changed from {chunking_settings(old_props)} to {chunking_settings(props)}, replacing data source {data_source_id}")
+            return create_data_source(event, context)
+
+        data_source = bedrock_agent.get_data_source(knowledgeBaseId=knowledge_base_id, dataSourceId=data_source_id)['dataSource']
         bedrock_agent.update_data_source(
-            knowledgeBaseId=knowledge_base_id, 
-            dataSourceId=data_source_id, 
-            name='WebCrawlerDataSource', 
-            description='Web crawler data source for Bedrock Knowledge Base',
-            dataSourceConfiguration={
-                'type': 'WEB',
-                'webConfiguration': {
-                    'crawlerConfiguration': {
-                        'crawlerLimits': {
-                            'rateLimit': 300  # Max rate, adjust as needed
-                        },
-                        'scope': 'DEFAULT'  # Adjust scope as needed
-                    },
-                    'sourceConfiguration': {
-                        'urlConfiguration': {
-                            'seedUrls': urls
-                        }
-                    }
-                }
-            }
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            name=data_source['name'],
+            description=DATA_SOURCE_DESCRIPTION,
+            dataDeletionPolicy=data_source.get('dataDeletionPolicy', 'RETAIN'),
+            dataSourceConfiguration=data_source_configuration(props),
+            vectorIngestionConfiguration=vector_ingestion_configuration(props),
         )
         return {
             'Status': 'SUCCESS',
-            'Data': {}
+            'PhysicalResourceId': data_source_id,
+            'Data': resource_data(data_source_id, props)
         }
     except Exception as e:
         print(f"Error: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
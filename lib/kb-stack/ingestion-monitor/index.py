@@ -0,0 +1,38 @@
+import boto3
+import json
+import os
+from botocore.config import Config
+
+from ingestion import format_summary, latest_job, start_if_idle, summarize, wait_for_job
+
+# Created once per Lambda container and reused across invocations
+bedrock_agent = boto3.client('bedrock-agent', config=Config(
+    tcp_keepalive=True,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+))
+
+KNOWLEDGE_BASE_ID = os.environ['KNOWLEDGE_BASE_ID']
+DATA_SOURCE_ID = os.environ['DATA_SOURCE_ID']
+
+def lambda_handler(event, context):
+    # Scheduled re-crawls arrive from EventBridge; {"action": "status"} only reports the latest job
+    action = event.get('action', 'sync')
+    try:
+        if action == 'status':
+            job = latest_job(bedrock_agent, KNOWLEDGE_BASE_ID, DATA_SOURCE_ID)
+        else:
+            job, started = start_if_idle(bedrock_agent, KNOWLEDGE_BASE_ID, DATA_SOURCE_ID,
+                                         'Scheduled incremental re-crawl' if event.get('source') == 'aws.events' else 'Re-crawl started by the ingestion monitor')
+            # Leave time to log the result before the Lambda times out
+            timeout = max(0, context.get_remaining_time_in_millis() / 1000 - 30)
+            job = wait_for_job(bedrock_agent, KNOWLEDGE_BASE_ID, DATA_SOURCE_ID, job['ingestionJobId'],
+                               timeout_seconds=timeout, on_progress=lambda summary: print(format_summary(summary)))
+        if job is None:
+            return {'status': 'NONE'}
+        summary = summarize(job)
+        # One JSON line per run so the history can be queried with CloudWatch Logs Insights
+        print(json.dumps({'ingestionSummary': summary}))
+        return summary
+    except Exception as e:
+        print(f"Error: {str(e)}")
+        raise e
@@ -0,0 +1,142 @@
+"""Start and monitor Knowledge Base ingestion jobs.
+
+Shared by the ingestion monitor Lambda and `start.py ingest`.
+"""
+import time
+from datetime import datetime, timezone
+
+ACTIVE_STATUSES = ['STARTING', 'IN_PROGRESS', 'STOPPING']
+FINAL_STATUSES = ['COMPLETE', 'FAILED', 'STOPPED']
+
+STATISTIC_LABELS = [
+    ('numberOfDocumentsScanned', 'scanned'),
+    ('numberOfNewDocumentsIndexed', 'new'),
+    ('numberOfModifiedDocumentsIndexed', 'modified'),
+    ('numberOfDocumentsDeleted', 'deleted'),
+    ('numberOfDocumentsFailed', 'failed'),
+]
+
+
+def active_job(bedrock_agent, knowledge_base_id, data_source_id):
+    """The most recent job that has not finished yet, or None."""
+    jobs = bedrock_agent.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+        maxResults=5,
+    )['ingestionJobSummaries']
+    for job in jobs:
+        if job['status'] in ACTIVE_STATUSES:
+            return job
+    return None
+
+
+def latest_job(bedrock_agent, knowledge_base_id, data_source_id):
+    jobs = bedrock_agent.list_ingestion_jobs(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+        maxResults=1,
+    )['ingestionJobSummaries']
+    if not jobs:
+        return None
+    return get_job(bedrock_agent, knowledge_base_id, data_source_id, jobs[0]['ingestionJobId'])
+
+
+def get_job(bedrock_agent, knowledge_base_id, data_source_id, job_id):
+    return bedrock_agent.get_ingestion_job(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        ingestionJobId=job_id,
+    )['ingestionJob']
+
+
+def start_if_idle(bedrock_agent, knowledge_base_id, data_source_id, description):
+    """Start an ingestion job unless one is already running for the data source.
+
+    Returns (job, started). Web crawler syncs are incremental: pages that
+    did not change since the last job are skipped, and removed pages are
+    deleted from the index.
+    """
+    running = active_job(bedrock_agent, knowledge_base_id, data_source_id)
+    if running is not None:
+        print(f"Ingestion job {running['ingestionJobId']} is already {running['status']}, not starting another")
+        return get_job(bedrock_agent, knowledge_base_id, data_source_id, running['ingestionJobId']), False
+    job = bedrock_agent.start_ingestion_job(
+        knowledgeBaseId=knowledge_base_id,
+        dataSourceId=data_source_id,
+        description=description,
+    )['ingestionJob']
+    print(f"Started ingestion job {job['ingestionJobId']}")
+    return job, True
+
+
+def _seconds(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    return None
+
+
+def summarize(job):
+    """Statistics, duration and throughput of an ingestion job as a flat dict."""
+    statistics = job.get('statistics', {})
+    started_at = _seconds(job.get('startedAt'))
+    if job['status'] in FINAL_STATUSES:
+        ended_at = _seconds(job.get('updatedAt'))
+    else:
+        ended_at = datetime.now(timezone.utc).timestamp()
+    duration = ended_at - started_at if started_at and ended_at else None
+    indexed = statistics.get('numberOfNewDocumentsIndexed', 0) + statistics.get('numberOfModifiedDocumentsIndexed', 0)
+    summary = {
+        'ingestionJobId': job['ingestionJobId'],
+        'status': job['status'],
+        'durationSeconds': round(duration) if duration is not None else None,
+        'documentsPerMinute': round(statistics.get('numberOfDocumentsScanned', 0) * 60 / duration, 1) if duration else None,
+        'indexedPerMinute': round(indexed * 60 / duration, 1) if duration else None,
+    }
+    for key, label in STATISTIC_LABELS:
+        summary[label] = statistics.get(key, 0)
+    if job.get('failureReasons'):
+        summary['failureReasons'] = job['failureReasons']
+    return summary
+
+
+def format_summary(summary):
+    counts = ", ".join(f"{summary[label]} {label}" for _, label in STATISTIC_LABELS)
+    line = f"Ingestion job {summary['ingestionJobId']} {summary['status']}: {counts}"
+    if summary['durationSeconds'] is not None:
+        line += f" in {summary['durationSeconds'] // 60}m{summary['durationSeconds'] % 60:02d}s"
+    if summary['documentsPerMinute'] is not None:
+        line += f" ({summary['documentsPerMinute']} scanned/min, {summary['indexedPerMinute']} indexed/min)"
+    for reason in summary.get('failureReasons', []):
+        line += f"\n  {reason}"
+    return line
+
+
+def wait_for_job(bedrock_agent, knowledge_base_id, data_source_id, job_id, timeout_seconds=3600,
+                 initial_delay=5, max_delay=60, on_progress=None):
+    """Poll a job until it finishes or `timeout_seconds` pass, backing off exponentially.
+
+    Returns the last job description. `on_progress(summary)` is called
+    after every poll whose statistics changed.
+    """
+    deadline = time.monotonic() + timeout_seconds
+    delay = initial_delay
+    last_statistics = None
+    while True:
+        job = get_job(bedrock_agent, knowledge_base_id, data_source_id, job_id)
+        if job.get('statistics') != last_statistics:
+            last_statistics = job.get('statistics')
+            if on_progress:
+                on_progress(summarize(job))
+            # Progress resets the backoff so an active crawl is reported often
+            delay = initial_delay
+        if job['status'] in FINAL_STATUSES:
+            return job
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return job
+        time.sleep(min(delay, remaining))
+        delay = min(delay * 2, max_delay)
@@ -0,0 +1,66 @@
+"""HNSW parameter profiles for the Knowledge Base vector index.
+
+Used by the index initialization Lambda and by the local recall/latency
+benchmark in lib/kb-stack/benchmarks.
+"""
+
+# m is the number of graph neighbours per vector, ef_construction the candidate list used
+# while building the graph and ef_search the candidate list per query. Larger values raise
+# recall at the cost of build time, memory (m) and query latency (ef_search).
+HNSW_PROFILES = {
+    # Company web sites index a few thousand chunks, where a short candidate list already
+    # finds nearly all true neighbours
+    'latency': {'m': 16, 'ef_construction': 256, 'ef_search': 64},
+    'recall': {'m': 32, 'ef_construction': 512, 'ef_search': 256},
+    # Fewer graph links per vector; pair with a smaller embedding dimension for real savings
+    'memory': {'m': 8, 'ef_construction': 128, 'ef_search': 64},
+    # What every index was created with before profiles existed
+    'legacy': {'m': 16, 'ef_construction': 512, 'ef_search': 512},
+}
+DEFAULT_PROFILE = 'latency'
+
+# Output dimension of the embedding models a Knowledge Base can use
+EMBEDDING_MODEL_DIMENSIONS = {
+    'amazon.titan-embed-text-v1': 1536,
+    'amazon.titan-embed-text-v2:0': 1024,
+    'cohere.embed-english-v3': 1024,
+    'cohere.embed-multilingual-v3': 1024,
+}
+# Titan Text Embeddings V2 can also return shorter vectors
+CONFIGURABLE_DIMENSIONS = {
+    'amazon.titan-embed-text-v2:0': (256, 512, 1024),
+}
+
+
+def hnsw_parameters(profile):
+    if profile not in HNSW_PROFILES:
+        raise ValueError(f"Unknown index profile {profile}, expected one of {', '.join(HNSW_PROFILES)}")
+    return dict(HNSW_PROFILES[profile])
+
+
+def embedding_dimension(model_id, dimension=None):
+    """Vector dimension for `model_id`, checking an explicit `dimension` against what the model supports."""
+    if model_id not in EMBEDDING_MODEL_DIMENSIONS:
+        if dimension is None:
+            raise ValueError(f"Unknown embedding model {model_id}, set the embedding dimension explicitly")
+        return int(dimension)
+    if dimension is None:
+        return EMBEDDING_MODEL_DIMENSIONS[model_id]
+    dimension = int(dimension)
+    supported = CONFIGURABLE_DIMENSIONS.get(model_id, (EMBEDDING_MODEL_DIMENSIONS[model_id],))
+    if dimension not in supported:
+        raise ValueError(f"{model_id} produces vectors of {', '.join(map(str, supported))} dimensions, not {dimension}")
+    return dimension
+
+
+def vector_field_mapping(profile, dimension):
+    return {
+        "type": "knn_vector",
+        "dimension": dimension,
+        "method": {
+            "name": "hnsw",
+            "engine": "faiss",
+            "space_type": "l2",
+            "parameters": hnsw_parameters(profile),
+        }
+    }
@@ -1,95 +1,176 @@
 import os
 import json
 import boto3
-from opensearchpy import OpenSearch, RequestsHttpConnection
+from opensearchpy import NotFoundError, OpenSearch, RequestsHttpConnection
 from requests_aws4auth import AWS4Auth
 from urllib.parse import urlparse
 import time
 
+from hnsw_profiles import DEFAULT_PROFILE, embedding_dimension, vector_field_mapping
+
+# The collection can take a while to route a new index to every node
+READY_TIMEOUT_SECONDS = int(os.environ.get('INDEX_READY_TIMEOUT_SECONDS', 180))
+READY_CONSECUTIVE_CHECKS = 3
+
+
+def wait_for_index(client, index_name, dimension):
+    # Poll until the index and its vector mapping are visible several times in a row,
+    # instead of sleeping a fixed time before the Knowledge Base is created against it
+    deadline = time.time() + READY_TIMEOUT_SECONDS
+    delay = 2
+    consecutive = 0
+    while True:
+        try:
+            mapping = client.indices.get_mapping(index=index_name)
+            vector_field = mapping[index_name]['mappings']['properties']['vector_field']
+            if vector_field.get('dimension') == dimension:
+                consecutive += 1
+            else:
+                consecutive = 0
+        except Exception as e:
+            print(f"Index not ready yet: {str(e)}")
+            consecutive = 0
+        if consecutive >= READY_CONSECUTIVE_CHECKS:
+            print(f"Index '{index_name}' is ready")
+            return
+        if time.time() + delay > deadline:
+            raise Exception(f"Index '{index_name}' was not ready after {READY_TIMEOUT_SECONDS} seconds")
+        time.sleep(delay)
+        delay = min(delay * 2, 10) if consecutive == 0 else 2
+
+def opensearch_client(endpoint, region):
+    # Parse the endpoint URL
+    parsed_url = urlparse(endpoint)
+    host = parsed_url.netloc
+
+    # Create AWS credentials
+    credentials = boto3.Session().get_credentials()
+    awsauth = AWS4Auth(credentials.access_key, credentials.secret_key,
+                       region, 'aoss', session_token=credentials.token)
+
+    # Create OpenSearch client
+    return OpenSearch(
+        hosts=[{'host': host, 'port': 443}],
+        http_auth=awsauth,
+        use_ssl=True,
+        verify_certs=True,
+        connection_class=RequestsHttpConnection
+    )
+
+def index_mismatches(client, index_name, profile, dimension):
+    # Differences between the live vector field and what the dimension and the profile ask for,
+    # as (dimension mismatches, HNSW parameter mismatches)
+    mapping = client.indices.get_mapping(index=index_name)
+    live = mapping[index_name]['mappings']['properties']['vector_field']
+    wanted = vector_field_mapping(profile, dimension)
+    dimension_mismatches = []
+    if live.get('dimension') != wanted['dimension']:
+        dimension_mismatches.append(f"dimension {live.get('dimension')} != {wanted['dimension']}")
+    parameter_mismatches = []
+    live_parameters = live.get('method', {}).get('parameters', {})
+    for name, value in wanted['method']['parameters'].items():
+        if name in live_parameters and live_parameters[name] != value:
+            parameter_mismatches.append(f"{name} {live_parameters[name]} != {value}")
+    return dimension_mismatches, parameter_mismatches
+
+def check_index(client, index_name, profile, dimension, explicit_profile=True):
+    dimension_mismatches, parameter_mismatches = index_mismatches(client, index_name, profile, dimension)
+    if parameter_mismatches and not explicit_profile:
+        # Without an explicit indexProfile an existing index keeps the HNSW parameters it was
+        # created with; indexes from before profiles existed use the 'legacy' ones
+        print(f"WARNING: index '{index_name}' was created with other HNSW parameters than profile {profile} "
+              f"({', '.join(parameter_mismatches)}), keeping them. Set indexProfile to enforce a profile.")
+        parameter_mismatches = []
+    mismatches = dimension_mismatches + parameter_mismatches
+    if mismatches:
+        raise Exception(f"Index '{index_name}' was created with different settings ({', '.join(mismatches)}). "
+                        "Revert indexProfile/embeddingDimensions, or destroy and redeploy the stack to rebuild the index.")
+    print(f"Index '{index_name}' matches dimension {dimension}")
 
 def lambda_handler(event, context):
-    if event['RequestType'] == 'Create':
-        endpoint = os.environ['COLLECTION_ENDPOINT']
-        # Match the vectorIndexName in the Knowledge Base config
-        index_name = 'my_vector_index'
-        region = os.environ['AWS_REGION']
-
-        print(f"Endpoint: {endpoint}")
-        print(f"Index Name: {index_name}")
-        print(f"Region: {region}")
-
-        # Parse the endpoint URL
-        parsed_url = urlparse(endpoint)
-        host = parsed_url.netloc
-
-        # Create AWS credentials
-        credentials = boto3.Session().get_credentials()
-        awsauth = AWS4Auth(credentials.access_key, credentials.secret_key,
-                           region, 'aoss', session_token=credentials.token)
-
-        # Create OpenSearch client
-        client = OpenSearch(
-            hosts=[{'host': host, 'port': 443}],
-            http_auth=awsauth,
-            use_ssl=True,
-            verify_certs=True,
-            connection_class=RequestsHttpConnection
-        )
-
-        # Create the index mapping
-        index_body = {
-            "settings": {
-                "index.knn": True
-            },
-            "mappings": {
-                "properties": {
-
-                    "AMAZON_BEDROCK_METADATA": {
-                        "type": "text",
-                        "index": False
-                    },
-                    "AMAZON_BEDROCK_TEXT_CHUNK": {
-                        "type": "text"
-                    },
-                    "vector_field": {  # vectorField
-                        "type": "knn_vector",
-                        "dimension": 1536,  # Adjust this to match the embedding model's dimension,
-                        "method": {
-                                "name": "hnsw",
-                                "engine": "faiss",
-                                "parameters": {
-                                    "ef_construction": 512,
-                                    "ef_search": 512,
-                                    "m": 16
-                                }
-                        }
-                    }
-
-                }
+    if event['RequestType'] not in ('Create', 'Update'):
+        return
+    endpoint = os.environ['COLLECTION_ENDPOINT']
+    # Match the vectorIndexName in the Knowledge Base config
+    index_name = 'my_vector_index'
+    region = os.environ['AWS_REGION']
+    props = event.get('ResourceProperties', {})
+    explicit_profile = bool(props.get('IndexProfile'))
+    profile = props.get('IndexProfile') or DEFAULT_PROFILE
+    dimension = embedding_dimension(
+        props.get('EmbeddingModelId', 'amazon.titan-embed-text-v1'), props.get('EmbeddingDimension'))
+
+    print(f"Endpoint: {endpoint}")
+    print(f"Index Name: {index_name}")
+    print(f"Region: {region}")
+    print(f"Profile: {profile}, dimension: {dimension}")
+
+    client = opensearch_client(endpoint, region)
+
+    if event['RequestType'] == 'Update':
+        # HNSW parameters and the dimension are fixed when the index is created, and recreating it
+        # would drop every ingested vector under the Knowledge Base. A changed dimension or an
+        # explicitly set profile the index does not match fails the update instead of leaving the
+        # index silently out of step with the stack's settings.
+        try:
+            check_index(client, index_name, profile, dimension, explicit_profile)
+            return {
+                'statusCode': 200,
+                'body': json.dumps('Index settings unchanged')
+            }
+        except NotFoundError:
+            # A replaced collection has no index yet; create it below
+            print(f"Index '{index_name}' does not exist, creating it")
+
+    # Create the index mapping
+    index_body = {
+        "settings": {
+            "index.knn": True
+        },
+        "mappings": {
+            "properties": {
+
+                "AMAZON_BEDROCK_METADATA": {
+                    "type": "text",
+                    "index": False
+                },
+                "AMAZON_BEDROCK_TEXT_CHUNK": {
+                    "type": "text"
+                },
+                "vector_field": vector_field_mapping(profile, dimension),  # vectorField
+
             }
         }
+    }
+
+    max_retries = 7
+    retry_delay = 1  # Initial delay in seconds
+
+    for attempt in range(max_retries):
+        try:
+            # Create the index
+            response = client.indices.create(index_name, body=index_body)
+            print(f"Index '{index_name}' created successfully: {response}")
+            break
+        except Exception as e:
+            # An earlier attempt may have succeeded even though its response was lost
+            if 'resource_already_exists_exception' in str(e):
+                print(f"Index '{index_name}' already exists")
+                # It may be left over from an earlier deployment with another profile
+                check_index(client, index_name, profile, dimension, explicit_profile)
+                break
+            if attempt < max_retries - 1:
+                error_message = f"Attempt {attempt + 1} failed. Retrying... Error: {str(e)}"
+                print(error_message)
+                time.sleep(retry_delay)
+                retry_delay *= 2  # Exponential backoff
+            else:
+                error_message = f"Failed to create index after {max_retries} attempts. Error: {str(e)}"
+                print(error_message)
+                raise Exception(error_message)
 
-        max_retries = 7
-        retry_delay = 1  # Initial delay in seconds
-
-        for attempt in range(max_retries):
-            try:
-                # Create the index
-                response = client.indices.create(index_name, body=index_body)
-                print(f"Index '{index_name}' created successfully: {response}")
-
-                time.sleep(60)
-                return {
-                    'statusCode': 200,
-                    'body': json.dumps('Index created successfully')
-                }
-            except Exception as e:
-                if attempt < max_retries - 1:
-                    error_message = f"Attempt {attempt + 1} failed. Retrying... Error: {str(e)}"
-                    print(error_message)
-                    time.sleep(retry_delay)
-                    retry_delay *= 2  # Exponential backoff
-                else:
-                    error_message = f"Failed to create index after {max_retries} attempts. Error: {str(e)}"
-                    print(error_message)
-                    raise Exception(error_message)
+    wait_for_index(client, index_name, dimension)
+    return {
+        'statusCode': 200,
+        'body': json.dumps('Index created successfully')
+    }
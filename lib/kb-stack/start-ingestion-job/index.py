@@ -1,18 +1,63 @@
 import boto3
 import json
 import os
+import time
+from botocore.config import Config
+
+# Created once per Lambda container and reused across invocations
+bedrock_agent = boto3.client('bedrock-agent', config=Config(
+    tcp_keepalive=True,
+    retries={'max_attempts': 10, 'mode': 'adaptive'},
+))
+
+ACTIVE_STATUSES = ['STARTING', 'IN_PROGRESS', 'STOPPING']
+
+def stop_active_jobs(knowledge_base_id, data_source_id):
+    # A crawl with the old settings would otherwise block the re-ingestion with a ConflictException
+    for status in ['STARTING', 'IN_PROGRESS']:
+        jobs = bedrock_agent.list_ingestion_jobs(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            filters=[{'attribute': 'STATUS', 'operator': 'EQ', 'values': [status]}],
+        )['ingestionJobSummaries']
+        for job in jobs:
+            print(f"Stopping ingestion job {job['ingestionJobId']} ({status}) before re-ingesting")
+            bedrock_agent.stop_ingestion_job(
+                knowledgeBaseId=knowledge_base_id,
+                dataSourceId=data_source_id,
+                ingestionJobId=job['ingestionJobId'],
+            )
+
+    for attempt in range(30):
+        job = bedrock_agent.list_ingestion_jobs(
+            knowledgeBaseId=knowledge_base_id,
+            dataSourceId=data_source_id,
+            sortBy={'attribute': 'STARTED_AT', 'order': 'DESCENDING'},
+            maxResults=1,
+        )['ingestionJobSummaries']
+        if not job or job[0]['status'] not in ACTIVE_STATUSES:
+            return
+        print(f"Waiting for ingestion job {job[0]['ingestionJobId']} to stop. Attempt {attempt + 1}/30")
+        time.sleep(5)
 
 def lambda_handler(event, context):
-    bedrock_agent = boto3.client('bedrock-agent')
-    
     try:
         if event['RequestType'] in ['Create', 'Update']:
+            props = event['ResourceProperties']
+            if event['RequestType'] == 'Update':
+                # The data source resource changes configHash (or its id, when chunking changed)
+                # whenever its settings change, which is what triggers this re-ingestion
+                old_props = event.get('OldResourceProperties', {})
+                print(f"Re-ingesting data source {props['dataSourceId']} "
+                      f"(config {old_props.get('configHash')} -> {props.get('configHash')})")
+                stop_active_jobs(props['knowledgeBaseId'], props['dataSourceId'])
+
             response = bedrock_agent.start_ingestion_job(
-                knowledgeBaseId=event['ResourceProperties']['knowledgeBaseId'],
-                dataSourceId=event['ResourceProperties']['dataSourceId'],
+                knowledgeBaseId=props['knowledgeBaseId'],
+                dataSourceId=props['dataSourceId'],
                 description='Ingestion job started via CloudFormation custom resource'
             )
-            
+
             return {
                 'PhysicalResourceId': response['ingestionJob']['ingestionJobId'],
                 'Data': {
@@ -27,4 +72,4 @@ def lambda_handler(event, context):
             }
     except Exception as e:
         print(f"Error: {str(e)}")
-        raise e
\ No newline at end of file
+        raise e
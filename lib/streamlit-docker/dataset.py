@@ -0,0 +1,151 @@
+"""Synthetic dataset behind the Data Query tab.
+
+The dataset is six model calls: a schema and a list of rows for products and
+for customers, plus a junction table schema and its rows. Each list depends
+only on its own schema, so the three branches run concurrently. Generation
+runs on a background thread shared by every session of the process, so a
+rerun or a closed tab does not interrupt it, and sessions render its partial
+results while they wait. A finished dataset is saved per customer under
+DATASET_DIR, so later sessions and restarts read it instead of regenerating.
+"""
+import json
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import streamlit as st
+
+from factories import get_chain
+
+DATASET_DIR = os.environ.get("DATASET_DIR", "./datasets")
+
+
+def _schema(chain, **inputs):
+    return chain(inputs=inputs)['text']
+
+
+def _rows(chain, schema):
+    # The prompt opens the JSON array and the chain stops before closing it
+    return json.loads(chain(schema)["text"] + "]")
+
+
+# session state key: (step, chain, dependencies, fixed inputs)
+DATASET_STEPS = {
+    "product_schema": (_schema, "schema", (), {"schema_type": "products"}),
+    "products_table": (_rows, "json", ("product_schema",), {}),
+    "customers_schema": (_schema, "schema", (), {"schema_type": "customers"}),
+    "customers_table": (_rows, "json", ("customers_schema",), {}),
+    "junction_schema": (_schema, "junction_schema", (), {"table1": "products", "table2": "customers"}),
+    "junction_table": (_rows, "junction_item", ("junction_schema",), {}),
+}
+
+
+def dataset_path(customer_name):
+    slug = re.sub(r"[^a-z0-9]+", "-", customer_name.lower()).strip("-") or "default"
+    return os.path.join(DATASET_DIR, f"{slug}.json")
+
+
+def load_dataset(customer_name):
+    try:
+        with open(dataset_path(customer_name)) as fh:
+            dataset = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    return dataset if all(key in dataset for key in DATASET_STEPS) else None
+
+
+def save_dataset(customer_name, dataset):
+    path = dataset_path(customer_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written to a temporary file first so a reader never sees half a dataset
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "w") as fh:
+        json.dump(dataset, fh)
+    os.replace(temporary_path, path)
+
+
+def generate_dataset(chains, max_workers=3):
+    """Yield (key, value) for every dataset step as it completes, running steps once their dependencies are done."""
+    results = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dataset") as executor:
+        def submit_ready():
+            for key, (step, _, dependencies, inputs) in DATASET_STEPS.items():
+                if key in results or key in running.values():
+                    continue
+                if all(dependency in results for dependency in dependencies):
+                    args = [results[dependency] for dependency in dependencies]
+                    running[executor.submit(step, chains[key], *args, **inputs)] = key
+
+        submit_ready()
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    results[key] = future.result()
+                    yield key, results[key]
+                submit_ready()
+        finally:
+            for future in running:
+                future.cancel()
+
+
+class DatasetBootstrap:
+    """Generates one customer's dataset on a background thread that any session can watch."""
+
+    def __init__(self, customer_name):
+        self.customer_name = customer_name
+        self.error = None
+        self._results = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def results(self):
+        with self._lock:
+            return dict(self._results)
+
+    def start(self):
+        """Start generating unless it is already running, finished or failed; see `retry`."""
+        with self._lock:
+            if self.running or self.error is not None or len(self._results) == len(DATASET_STEPS):
+                return
+            # Cached chains are resolved here, on the script thread, before any work leaves it
+            chains = {key: get_chain(chain_name) for key, (_, chain_name, _, _) in DATASET_STEPS.items()}
+            self._results = {}
+            self._thread = threading.Thread(target=self._run, args=(chains,), name="dataset-bootstrap",
+                                            daemon=True)
+            self._thread.start()
+
+    def retry(self):
+        with self._lock:
+            if self.running:
+                return
+            self.error = None
+        self.start()
+
+    def _run(self, chains):
+        try:
+            for key, value in generate_dataset(chains):
+                with self._lock:
+                    self._results[key] = value
+        except Exception as e:
+            print(f"Error generating the dataset for {self.customer_name}: {e}")
+            with self._lock:
+                self.error = e
+            return
+        try:
+            save_dataset(self.customer_name, self.results())
+        except OSError as e:
+            # Sessions of this process still get the dataset from memory
+            print(f"Error saving the dataset for {self.customer_name}: {e}")
+
+
+@st.cache_resource
+def dataset_bootstrap(customer_name):
+    return DatasetBootstrap(customer_name)
@@ -0,0 +1,223 @@
+"""Process-wide clients, prompts and chains for the Streamlit app.
+
+Streamlit re-executes main.py on every interaction, so everything built here
+goes through st.cache_resource and is created once per process and shared by
+all sessions. Nothing in here may depend on a session: per-session values
+such as the prompt modifier are passed as chain inputs at call time.
+"""
+import os
+
+import boto3
+import streamlit as st
+from botocore.config import Config
+from langchain.chains import ConversationalRetrievalChain
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from langchain_aws import ChatBedrock
+from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
+
+aws_region = os.environ["AWS_REGION"]
+customer_name = os.environ["CUSTOMER_NAME"]
+customer_industry = os.environ["CUSTOMER_INDUSTRY"] if "CUSTOMER_INDUSTRY" in os.environ else None
+
+ANSWER_MODEL_ID = "anthropic.claude-3-sonnet-20240229-v1:0"
+
+config = Config(
+    retries = {
+    'max_attempts': 10,
+    'mode': 'adaptive'
+    },
+    # Every Streamlit session shares these clients, so allow more than the default 10 connections
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 50)),
+    tcp_keepalive=True,
+)
+
+### Prompts ###
+
+# Prompt template for internal data bot interface
+QA_PROMPT = PromptTemplate(
+    input_variables=["context", "question", "prompt_modifier"],
+    template="""
+Human: You are a helpful and talkative """ + customer_name + """ assistant that answers questions directly and only using the information provided in the context below.
+Guidance for answers:
+    - Do not include any framing language such as "According to the context" in your responses, but rather act is if the information is coming from your memory banks.
+    - Simply answer the question clearly and with lots of detail using only the relevant details from the information below. If the context does not contain the answer, say "I don't know."
+    - Use the royal "We" in your responses.
+    - Finally, you should use the following guidance to control the tone: {prompt_modifier}
+
+Now read this context and answer the question at the bottom.
+
+Context: {context}"
+
+Question: "Hey """ + customer_name + """ Chatbot! {question}
+
+Assistant:
+According to the context provided,
+""")
+
+CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template("""Human: Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question.
+
+Chat History:
+{chat_history}
+Follow Up Input: {question}
+
+Assistant:
+Standalone question:""")
+
+PRODUCT_PROMPT = PromptTemplate(
+    input_variables=["idea"],
+    template="""Human: Generate an brand new innovative, fun, and creative """ + customer_name + """ product idea description
+based on the below product idea.  Be sure to format it in Markdown. Do not include any framing language, just the product description.
+
+Product Idea: {idea}
+
+Assistant:
+Here is a creative product description in markdown format
+
+""")
+
+PRESS_RELEASE_PROMPT = PromptTemplate(
+    input_variables=["product_description"],
+    template="""Human:
+Generate a 4 paragraph press release for a new product from """ + customer_name + """ based on the below product description and format it in Markdown
+{product_description}
+
+Assistant:
+Press Release: """)
+
+SCHEMA_PROMPT = PromptTemplate(
+    input_variables=["schema_type"],
+    template="""Human: Generate a basic database schema for exactly 1 table called "{schema_type}_table" with exactly 5 columns for a database table containing a list of {schema_type} from """ + customer_name +  """, who is in the """ + str(customer_industry) + """ industry.
+    Only generate the schema, no explanatory language please.
+
+    Assistant:""")
+
+JSON_PROMPT = PromptTemplate(
+    input_variables=["schema"],
+    template="""Human:
+Generate a JSON array of exactly 10 items that match the below schema. The items should resemble something that would belong to """ + customer_name +  """, who is in the """ + str(customer_industry) + """ industry,
+Print it in JSON format The ids should number 0-9. No explanatory language please.
+{schema}
+
+Assistant:
+[
+""")
+
+JUNCTION_SCHEMA_PROMPT = PromptTemplate(
+    input_variables=["table1", "table2"],
+    template="""Human:
+Generate a database schema for a junction table called "junction_table" containg the ids for the below tables. Assume the ids for both tables are integers 0-9
+{table1}
+{table2}
+
+Assistant:
+""")
+
+JUNCTION_ITEM_PROMPT = PromptTemplate(
+    input_variables=["schema"],
+    template="""Human: {schema}
+Generate a JSON array of from a junction table with exactly 20 items from """ + customer_name +  """, who is in the """ + str(customer_industry) + """ industry,
+in the above table, in JSON format. The ids will be numbered 0-9, Be sure to use a combination of ids from both tables. No explanatory language, just the JSON.
+
+Assistant:
+[
+""")
+
+SQL_PROMPT = PromptTemplate(
+    input_variables=["table1", "table2", "table3", "sql_request"],
+    template="""Human:
+    Generate a SQLite compatible SELECT statement that queries the below tables and achieves the following result.
+
+    tables:
+    {table1}
+    {table2}
+    {table3}
+
+    request {sql_request}
+    No explanatory language please, just the SELECT query. DO NOT include any additional SQL statements, just the SELECT statement.
+
+    Assistant:
+
+    """)
+
+EXPLANATION_PROMPT = PromptTemplate(
+    input_variables=["question", "query_result"],
+    template="""Human: Answer the below question directly with the results from the SQL query below in plain English. Do not include any SQL tables or queries in your answer. Just plain english.
+    Question: {question}
+    Query Result: {query_result}
+
+    Assistant:""")
+
+DOC_CHAT_PROMPT = PromptTemplate(
+    input_variables=["context", "question"],
+    template="""
+Human: below is the contents of a document. I have a question to ask about it.
+---
+Document: {context}
+
+{question}
+Assistant:
+""")
+
+# name: (prompt, stop sequences)
+LLM_CHAINS = {
+    "product": (PRODUCT_PROMPT, None),
+    "schema": (SCHEMA_PROMPT, ["Generate"]),
+    "json": (JSON_PROMPT, [']']),
+    "junction_schema": (JUNCTION_SCHEMA_PROMPT, ["Generate"]),
+    "junction_item": (JUNCTION_ITEM_PROMPT, ["]", "Generate"]),
+    "sql": (SQL_PROMPT, [';', "Generate"]),
+    "explanation": (EXPLANATION_PROMPT, ["Generate"]),
+    "doc_chat": (DOC_CHAT_PROMPT, ["Question:"]),
+}
+
+### Clients and chains ###
+
+@st.cache_resource
+def get_bedrock_client():
+    return boto3.client("bedrock-runtime", 'us-east-1', config=config)
+
+
+@st.cache_resource
+def get_retriever():
+    return AmazonKnowledgeBasesRetriever(
+        knowledge_base_id=os.environ["KNOWLEDGE_BASE_ID"],
+        client=boto3.client("bedrock-agent-runtime", aws_region, config=config),
+        retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 4}},
+    )
+
+
+@st.cache_resource
+def get_llm():
+    return ChatBedrock(
+        client=get_bedrock_client(),
+        model_id=ANSWER_MODEL_ID,
+        model_kwargs={"temperature": 0},
+        verbose=True,
+    )
+
+
+@st.cache_resource
+def get_qa_chain():
+    """Knowledge Base chat chain; call it with `prompt_modifier` alongside the question and chat history."""
+    return ConversationalRetrievalChain.from_llm(
+        llm=get_llm(),
+        retriever=get_retriever(),  # ☜ DOCSEARCH
+        return_source_documents=True,        # ☜ CITATIONS
+        return_generated_question=True,          # ☜ ANSWER
+        condense_question_prompt=CONDENSE_QUESTION_PROMPT,
+        combine_docs_chain_kwargs={"prompt": QA_PROMPT},
+        verbose=True,
+    )
+
+
+@st.cache_resource
+def get_chain(name):
+    """One of the LLM_CHAINS, built on the shared model."""
+    prompt, stop_sequences = LLM_CHAINS[name]
+    return LLMChain(
+        llm=get_llm(),
+        verbose=True,
+        prompt=prompt,
+        llm_kwargs={"stop_sequences": stop_sequences} if stop_sequences else {},
+    )
@@ -0,0 +1,129 @@
+"""Memoized generation for the Product Ideator tab.
+
+A submitted idea's description and image are generated concurrently. Images
+stay in memory, cached process-wide by a hash of the request that produced
+them, so the same prompt, seed and steps never call the image model twice.
+
+Press releases are generated only when asked for, streamed into the page,
+and then kept both in the session and in a process-wide cache keyed on the
+product description, so reruns and other sessions with the same description
+never call the model again.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import streamlit as st
+
+from factories import PRESS_RELEASE_PROMPT, get_bedrock_client, get_chain, get_llm
+
+IMAGE_MODEL_ID = "stability.stable-diffusion-xl-v1"
+
+PRESS_RELEASE_CACHE_SIZE = int(os.environ.get("PRESS_RELEASE_CACHE_SIZE", 256))
+# A 1024x1024 PNG is around 1.5 MB
+IMAGE_CACHE_SIZE = int(os.environ.get("IMAGE_CACHE_SIZE", 64))
+
+
+class _LRU:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+@st.cache_resource
+def _press_releases():
+    return _LRU(PRESS_RELEASE_CACHE_SIZE)
+
+
+@st.cache_resource
+def _images():
+    return _LRU(IMAGE_CACHE_SIZE)
+
+
+@st.cache_resource
+def _executor():
+    return ThreadPoolExecutor(max_workers=int(os.environ.get("IDEATOR_WORKERS", 8)), thread_name_prefix="ideator")
+
+
+def image_request(prompt, seed=0, steps=40, cfg_scale=10):
+    return {"text_prompts": [{"text": prompt}], "cfg_scale": cfg_scale, "seed": seed, "steps": steps}
+
+
+def image_key(request):
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def _invoke_image_model(client, request):
+    response = client.invoke_model(
+        modelId=IMAGE_MODEL_ID,
+        contentType="application/json",
+        accept="application/json",
+        body=json.dumps(request),
+    )
+    response_body = json.loads(response.get('body').read())
+    return base64.b64decode(response_body['artifacts'][0]["base64"])
+
+
+def generate_product(idea):
+    """Description and PNG bytes for a product idea, with both model calls running at the same time."""
+    # Cached resources are resolved here, on the script thread, before handing work to the pool
+    product_chain = get_chain("product")
+    client = get_bedrock_client()
+    images = _images()
+
+    request = image_request(idea)
+    key = image_key(request)
+    image = images.get(key)
+    image_future = None if image is not None else _executor().submit(_invoke_image_model, client, request)
+    description = product_chain(idea)["text"]
+    if image_future is not None:
+        image = image_future.result()
+        images.set(key, image)
+    return description, image
+
+
+def description_key(product_description):
+    return hashlib.sha256(product_description.encode()).hexdigest()
+
+
+def cached_press_release(product_description):
+    """The press release for this description if this session or any other already generated it."""
+    key = description_key(product_description)
+    session_cache = st.session_state.setdefault("press_releases", {})
+    if key in session_cache:
+        return session_cache[key]
+    press_release = _press_releases().get(key)
+    if press_release is not None:
+        session_cache[key] = press_release
+    return press_release
+
+
+def stream_press_release(product_description):
+    """Yield the press release as it is generated, caching it once complete."""
+    chunks = []
+    for chunk in get_llm().stream(PRESS_RELEASE_PROMPT.format(product_description=product_description)):
+        chunks.append(chunk.content)
+        yield chunk.content
+    press_release = "".join(chunks)
+    key = description_key(product_description)
+    _press_releases().set(key, press_release)
+    st.session_state.setdefault("press_releases", {})[key] = press_release
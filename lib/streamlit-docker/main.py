@@ -2,55 +2,28 @@
 import streamlit as st
 from streamlit_chat import message
 import os
-import boto3
 import json
-import base64
-from langchain.prompts import PromptTemplate
-from langchain.chains import ConversationalRetrievalChain
-from langchain.chains import LLMChain
-from langchain_aws import ChatBedrock
-from langchain_community.retrievers import AmazonKnowledgeBasesRetriever
-
+import sqlite3
+import time
 from streamlit.logger import get_logger
 import pandas as pd
-from pandasql import sqldf
-from botocore.config import Config
 from io import StringIO
 from pypdf import PdfReader
 import textract
 
+from dataset import DATASET_STEPS, dataset_bootstrap, load_dataset
+from factories import customer_name, get_chain, get_qa_chain
+from ideator import cached_press_release, generate_product, stream_press_release
+from query_engine import QueryEngine
+
 logger = get_logger(__name__)
 
 aws_region = os.environ["AWS_REGION"]
-customer_name = os.environ["CUSTOMER_NAME"]
 favicon_url = os.environ["FAVICON_URL"] if "FAVICON_URL" in os.environ else None
 chatbot_logo = os.environ["LOGO_URL"] if "LOGO_URL" in os.environ else None
-customer_industry = os.environ["CUSTOMER_INDUSTRY"] if "CUSTOMER_INDUSTRY" in os.environ else None
 
 logger.info("AWS region: " + aws_region)
 
-code_whisperer = boto3
-
-retriever = AmazonKnowledgeBasesRetriever(
-    knowledge_base_id=os.environ["KNOWLEDGE_BASE_ID"],
-    retrieval_config={"vectorSearchConfiguration": {"numberOfResults": 4}},
-)
-
-config = Config(
-    retries = {
-    'max_attempts': 10,
-    'mode': 'adaptive'
-    }
-)
-
-BEDROCK_CLIENT = boto3.client("bedrock-runtime", 'us-east-1', config=config)
-llm = ChatBedrock(
-    client=BEDROCK_CLIENT,
-    model_id="anthropic.claude-3-sonnet-20240229-v1:0",
-    model_kwargs={"temperature": 0},
-    verbose=True,
-)
-
 st.set_page_config(
     page_title=customer_name+ " GenAI Demo", 
     page_icon=favicon_url if favicon_url else ":robot:",
@@ -83,52 +56,7 @@ with assistant_tab:
         st.caption("The Prompt Modifier describes the tone of the assistant, i.e. 'Informative, empathetic, and friendly'")
 
 
-    # Prompt template for internal data bot interface
-    template = """
-Human: You are a helpful and talkative """ + customer_name + """ assistant that answers questions directly and only using the information provided in the context below. 
-Guidance for answers:
-    - Do not include any framing language such as "According to the context" in your responses, but rather act is if the information is coming from your memory banks. 
-    - Simply answer the question clearly and with lots of detail using only the relevant details from the information below. If the context does not contain the answer, say "I don't know."
-    - Use the royal "We" in your responses. 
-    - Finally, you should use the following guidance to control the tone: """ + st.session_state["prompt_modifier"] + """
-
-Now read this context and answer the question at the bottom. 
-
-Context: {context}"
-
-Question: "Hey """ + customer_name + """ Chatbot! {question}
-
-Assistant:
-According to the context provided,
-"""
-
-    condensed_question_template = """Human: Given the following conversation and a follow up question, rephrase the follow up question to be a standalone question.
-
-Chat History:
-{chat_history}
-Follow Up Input: {question}
-
-Assistant:
-Standalone question:"""
-    CONDENSE_QUESTION_PROMPT = PromptTemplate.from_template(condensed_question_template)
-
-    PROMPT = PromptTemplate(
-        template=template, input_variables=["context", "question"]
-    )
-  
-
-
-    chain_type_kwargs = {"prompt": PROMPT}
-    qa = ConversationalRetrievalChain.from_llm(
-        llm=llm, 
-        retriever=retriever,  # ☜ DOCSEARCH
-        return_source_documents=True,        # ☜ CITATIONS
-        return_generated_question=True,          # ☜ ANSWER
-        condense_question_prompt=CONDENSE_QUESTION_PROMPT,
-        verbose=True,
-    )
-
-    qa.combine_docs_chain.llm_chain.prompt = PROMPT
+    qa = get_qa_chain()
 
     # From here down is all the StreamLit UI.
     # if favicon_url is defined, use it
@@ -140,7 +68,8 @@ Standalone question:"""
         if user_input:
             st.session_state.past.append(user_input)
             # output = chain.run(input=user_input)
-            result = qa({"question":user_input, "chat_history": st.session_state["chat_history"]})
+            result = qa({"question":user_input, "chat_history": st.session_state["chat_history"],
+                         "prompt_modifier": st.session_state["prompt_modifier"]})
             logger.info(result)
             if("I apologize" not in result ["answer"] and "I don't know" not in result["answer"] and len(result['source_documents']) > 0):
                 print(result['source_documents'])
@@ -199,75 +128,15 @@ with product_tab:
     def submit_product():
         st.session_state['product_idea_input'] = st.session_state['product_text_input']
         st.session_state['product_text_input'] = ""
-        product_description = product_chain(st.session_state["product_idea_input"])["text"]
-
+        # The image bytes stay in this session; nothing is written to disk
+        product_description, product_image = generate_product(st.session_state["product_idea_input"])
         st.session_state["product_description"] = product_description
-        image_response = BEDROCK_CLIENT.invoke_model(
-                modelId="stability.stable-diffusion-xl-v1",
-                contentType="application/json",
-                accept="application/json",
-                body=json.dumps({
-                    "text_prompts": [
-                        {
-                            "text": st.session_state["product_idea_input"]
-                        }
-                    ],
-                    "cfg_scale": 10,
-                    "seed": 0,
-                    "steps": 40
-                })
-            )
-
-        response_body = json.loads(image_response.get('body').read())
-
-        image_bytes = response_body['artifacts'][0]["base64"]
-        #save image locally
-        with open("./image.png", "wb") as fh:
-            fh.write(base64.decodebytes(image_bytes.encode()))
-            fh.close()
-
-    product_template = """Human: Generate an brand new innovative, fun, and creative """ + customer_name + """ product idea description 
-based on the below product idea.  Be sure to format it in Markdown. Do not include any framing language, just the product description.
-
-Product Idea: {idea}
-
-Assistant:
-Here is a creative product description in markdown format
-
-"""
-
-    PRODUCT_PROMPT = PromptTemplate(
-        template=product_template, input_variables=["idea"]
-    )
-    chain_type_kwargs = {"prompt": PRODUCT_PROMPT, "stop_sequences": "You are a"}
-
-    product_chain = LLMChain(
-        llm=llm, 
-        verbose=True, 
-        prompt=PRODUCT_PROMPT,
-    )
-
-    press_release_template = """Human:
-Generate a 4 paragraph press release for a new product from """ + customer_name + """ based on the below product description and format it in Markdown
-{product_description}
-
-Assistant:
-Press Release: """
-
-
-    PRESS_RELEASE_PROMPT = PromptTemplate(
-        template=press_release_template, input_variables=["product_description"]
-    )
-
-    press_release_chain = LLMChain(llm=llm, verbose=True, prompt=PRESS_RELEASE_PROMPT)
-
+        st.session_state["product_image"] = product_image
 
     if "product_idea_input" not in st.session_state:
         st.session_state["product_idea_input"] = ""
     if "product_description" not in st.session_state:
         st.session_state["product_description"] = ""
-    if "press_release" not in st.session_state:
-        st.session_state["press_release"] = ""
 
     st.text_input("What is your product idea?", key="product_text_input", value="", on_change=submit_product, placeholder="Enter your product here")
 
@@ -276,14 +145,18 @@ Press Release: """
         with prod_desc_tab:
             st.write("")
             
-            st.image("./image.png", width=200)
+            if st.session_state.get("product_image"):
+                st.image(st.session_state["product_image"], width=200)
                     
             st.write(st.session_state["product_description"])
         with press_release_tab:
             st.write("")
-            press_release = press_release_chain(st.session_state["product_description"])
-            st.session_state["press_release"] = press_release["text"]
-            st.write (st.session_state["press_release"])
+            # Tabs all render on every rerun, so the press release is only written on request
+            press_release = cached_press_release(st.session_state["product_description"])
+            if press_release is not None:
+                st.write(press_release)
+            elif st.button("Write a press release", key="press_release_button"):
+                st.write_stream(stream_press_release(st.session_state["product_description"]))
 
 ### Database Query Tab ###
 
@@ -291,234 +164,133 @@ Press Release: """
 with query_tab:
     if "sql_query" not in st.session_state:
         st.session_state["sql_query"] = ""
-    junction_schema_template = """Human: 
-Generate a database schema for a junction table called "junction_table" containg the ids for the below tables. Assume the ids for both tables are integers 0-9
-{table1}
-{table2}
-
-Assistant:
-"""
-
-    products_schema_template = """Human: Generate a basic database schema for exactly 1 table called "{schema_type}_table" with exactly 5 columns for a database table containing a list of {schema_type} from """ + customer_name +  """, who is in the """ + customer_industry + """ industry.
-    Only generate the schema, no explanatory language please.
-
-    Assistant:"""
-
-    json_template = """Human:
-Generate a JSON array of exactly 10 items that match the below schema. The items should resemble something that would belong to """ + customer_name +  """, who is in the """ + customer_industry + """ industry, 
-Print it in JSON format The ids should number 0-9. No explanatory language please.
-{schema}
-
-Assistant:
-[
-""" 
-
-    junction_item_template = """Human: {schema}
-Generate a JSON array of from a junction table with exactly 20 items from """ + customer_name +  """, who is in the """ + customer_industry + """ industry,
-in the above table, in JSON format. The ids will be numbered 0-9, Be sure to use a combination of ids from both tables. No explanatory language, just the JSON.
-
-Assistant:
-[
-"""
-
-
-    sql_template = """Human:
-    Generate a SQLite compatible SELECT statement that queries the below tables and achieves the following result. 
-    
-    tables: 
-    {table1}
-    {table2}
-    {table3}
-    
-    request {sql_request}
-    No explanatory language please, just the SELECT query. DO NOT include any additional SQL statements, just the SELECT statement.
-
-    Assistant:
-
-    """
-
-    explanation_template = """Human: Answer the below question directly with the results from the SQL query below in plain English. Do not include any SQL tables or queries in your answer. Just plain english. 
-    Question: {question}
-    Query Result: {query_result}
-
-    Assistant:"""
-
-    schema_prompt = PromptTemplate(
-        template=products_schema_template, input_variables=["schema_type"]
-    )
-
-    json_prompt = PromptTemplate(
-        template=json_template, input_variables=["schema"], stop_sequences=["]"]
-    )
-
-    sql_prompt = PromptTemplate(
-        template=sql_template, input_variables=["table1", "table2", "table3", "sql_request"]
-    )
-    junction_schema_prompt = PromptTemplate(
-        template=junction_schema_template, input_variables=["table1", "table2"]
-    )
-    junction_item_prompt = PromptTemplate(
-        template=junction_item_template, input_variables=["schema"]
-    )
-    explanation_prompt = PromptTemplate(
-        template=explanation_template, input_variables=["question", "query_result"]
-    )
-
-    schema_chain = LLMChain(
-        llm=llm,
-        verbose=True,
-        prompt=schema_prompt,
-        llm_kwargs={"stop_sequences": ["Generate"]},
-    )
-
-    sql_chain = LLMChain(
-        llm=llm, 
-        verbose=True, 
-        prompt=sql_prompt,
-        llm_kwargs={'stop_sequences': [';', "Generate"]})
-    json_chain = LLMChain(
-        llm=llm, 
-        verbose=True, 
-        prompt=json_prompt,
-        llm_kwargs={'stop_sequences': [']']})
-    
-    junction_schema_chain = LLMChain(
-        llm=llm,
-        verbose=True,
-        prompt=junction_schema_prompt,
-        llm_kwargs={"stop_sequences": ["Generate"]})
-    junction_item_chain = LLMChain(
-        llm=llm,
-        verbose=True,
-        prompt=junction_item_prompt,
-        llm_kwargs={"stop_sequences": ["]", "Generate"]})
-    explanation_chain = LLMChain(
-        llm=llm,
-        verbose=True,
-        prompt=explanation_prompt,
-        llm_kwargs={"stop_sequences": ["Generate"]})
-
-    
-    @st.cache_data
-    def load_product_schema():
-        print("loading schema")
-        schema = schema_chain(inputs={"schema_type":"products"})
-        print("schema loaded")
-        print(schema)
-        return schema['text']
-    
-    if "product_schema" not in st.session_state:
-        st.session_state["product_schema"] = load_product_schema()
-
-    @st.cache_data
-    def load_product_list():
-        products= json_chain(st.session_state['product_schema'])["text"]
-        print(products)
-        products_table = json.loads(products + "]")
-        return products_table
-    @st.cache_data
-    def load_customers_schema():
-        print("loading schema")
-        schema = schema_chain(inputs={"schema_type":"customers"})
-        print("schema loaded")
-        print(schema)
-        return schema['text']
-    @st.cache_data
-    def load_customers_list():
-        customers= json_chain(st.session_state['customers_schema'])["text"]
-        print(customers)
-        customers_table = json.loads(customers + "]")
-        return customers_table
-    @st.cache_data
-    def load_junction_schema():
-        print("loading schema")
-        schema = junction_schema_chain(inputs={"table1":"products", "table2":"customers"})
-        print("schema loaded")
-        print(schema)
-        return schema['text']
-    @st.cache_data
-    def load_junction_table():
-        junction_table= junction_item_chain(st.session_state['junction_schema'])["text"]
-        print(junction_table)
-        junction_table = json.loads(junction_table + "]")
-        return junction_table
-
-    if "products_table" not in st.session_state:
-        st.session_state["products_table"] = load_product_list()
-    if "customers_schema" not in st.session_state:
-        st.session_state["customers_schema"] = load_customers_schema()
-    if "customers_table" not in st.session_state:
-        st.session_state["customers_table"] = load_customers_list()
-    if "junction_schema" not in st.session_state:
-        st.session_state["junction_schema"] = load_junction_schema()
-    if "junction_table" not in st.session_state:
-        st.session_state["junction_table"] = load_junction_table()
-    if "question" not in st.session_state:
-        st.session_state["question"] = ""
-
-    products_table = pd.DataFrame(st.session_state["products_table"])
-    customers_table = pd.DataFrame(st.session_state["customers_table"])
-    junction_table = pd.DataFrame(st.session_state["junction_table"])
-
-    st.code(st.session_state["customers_schema"])
-    st.code(st.session_state["product_schema"])
-
-    with st.expander("Data", expanded=False):
-        st.table(products_table)
-        st.table(customers_table)
-        st.table(junction_table)
+    if any(key not in st.session_state for key in DATASET_STEPS):
+        dataset = load_dataset(customer_name)
+        if dataset is None:
+            # Generation runs on a shared background thread, so a rerun or a closed tab while it
+            # runs does not cancel it; this session only watches it and shows what has arrived
+            bootstrap = dataset_bootstrap(customer_name)
+            bootstrap.start()
+            with st.status("Generating the sample dataset...", expanded=True) as bootstrap_status:
+                placeholders = {key: st.empty() for key in DATASET_STEPS}
+                shown = set()
+                while True:
+                    running = bootstrap.running
+                    for key, value in bootstrap.results().items():
+                        if key in shown:
+                            continue
+                        shown.add(key)
+                        if key.endswith("_schema"):
+                            placeholders[key].code(value)
+                        else:
+                            placeholders[key].table(pd.DataFrame(value))
+                    if not running:
+                        break
+                    time.sleep(0.5)
+                if bootstrap.error is None and len(shown) == len(DATASET_STEPS):
+                    bootstrap_status.update(label="Sample dataset ready", state="complete", expanded=False)
+                    dataset = bootstrap.results()
+                else:
+                    bootstrap_status.update(label="Generating the sample dataset failed", state="error")
+            if dataset is None:
+                st.error(f"The sample dataset could not be generated: {bootstrap.error}")
+                st.button("Try again", key="dataset_retry_button", on_click=bootstrap.retry)
+        if dataset is not None:
+            st.session_state.update(dataset)
+    # Everything below needs the dataset
+    if all(key in st.session_state for key in DATASET_STEPS):
+        if "question" not in st.session_state:
+            st.session_state["question"] = ""
+
+        products_table = pd.DataFrame(st.session_state["products_table"])
+        customers_table = pd.DataFrame(st.session_state["customers_table"])
+        junction_table = pd.DataFrame(st.session_state["junction_table"])
+
+        if "query_engine" not in st.session_state:
+            st.session_state["query_engine"] = QueryEngine(
+                timeout_seconds=float(os.environ.get("SQL_TIMEOUT_SECONDS", 5)),
+                max_rows=int(os.environ.get("SQL_MAX_ROWS", 1000)),
+            )
+        query_engine = st.session_state["query_engine"]
+        # Tables are only reloaded when their rows change, e.g. after editing them under Debug
+        try:
+            query_engine.register("products_table", st.session_state["products_table"])
+            query_engine.register("customers_table", st.session_state["customers_table"])
+            query_engine.register("junction_table", st.session_state["junction_table"])
+        except (ValueError, TypeError, AttributeError, sqlite3.Error) as e:
+            st.error(f"The tables could not be loaded for querying: {e}")
+
+        st.code(st.session_state["customers_schema"])
+        st.code(st.session_state["product_schema"])
+
+        with st.expander("Data", expanded=False):
+            st.table(products_table)
+            st.table(customers_table)
+            st.table(junction_table)
     
-    def products_text_onchange():
-        st.session_state["products_table"] = json.loads(st.session_state["products_text_input"])
-    def customers_text_onchange():
-        st.session_state["customers_table"] = json.loads(st.session_state["customers_text_input"])
-    def junction_text_onchange():
-        st.session_state["junction_table"] = json.loads(st.session_state["junction_text_input"])
-
-    def submit_sql():
-        sql_request = st.session_state["sql_request_input"]
-        st.session_state["question"] = sql_request
-        #clear the text input so that subsequent actions don't retrigger the onchange
-        st.session_state["sql_request_input"] = ""
-        sql_query = sql_chain.predict(table1=st.session_state["product_schema"], 
-                                      table2=st.session_state["customers_schema"], 
-                                      table3=st.session_state["junction_schema"], 
-                                      sql_request=sql_request)
-        # use a regex to replace the table name with 'df'
-        # sql_query = re.sub(r'(?<=FROM )\w+', 'df', sql_query, flags=re.IGNORECASE)
-        logger.info(sql_query)
-        st.session_state["sql_query"] = sql_query
-
-    sql_request = st.text_input("Enter a question about the above data:", value="", on_change=submit_sql, key="sql_request_input", placeholder="Enter your query here")
-    if st.session_state["sql_query"]:
-        st.subheader("Question")
-        st.write(st.session_state["question"])
-        with st.expander("SQL Query", expanded=False):
-            st.subheader("SQL Query")
-            st.write(st.session_state["sql_query"])
-            st.write("")
-        with st.expander("SQL Results", expanded=False):
-            st.subheader("SQL Results")
-            query_result = sqldf(st.session_state["sql_query"], globals())
-            st.write(query_result)    
-        st.subheader("Answer")
-        answer = explanation_chain(inputs={"question":st.session_state["question"], "query_result":query_result.to_dict(orient="records")})
-        st.text(answer["text"])
-    with st.expander("Debug", expanded=False):
-        st.subheader("Schema")
-        st.write(st.session_state["product_schema"])
-        st.subheader("Products")
-        #format json for products table
-        products = json.dumps(st.session_state["products_table"], indent=4)
-        st.text_area(value=products, key="products_text_input", on_change=products_text_onchange, label="Products")
-        st.subheader("Customers")
-        customers = json.dumps(st.session_state["customers_table"], indent=4)
-        st.text_area(value=customers, key="customers_text_input", on_change=customers_text_onchange, label="Customers")
-        st.subheader("Junction")
-        junction = json.dumps(st.session_state["junction_table"], indent=4)
-        st.text_area(value=junction, key="junction_text_input", on_change=junction_text_onchange, label="Junction")
-        st.subheader("Session State")
-        st.write(st.session_state)
+        def products_text_onchange():
+            st.session_state["products_table"] = json.loads(st.session_state["products_text_input"])
+        def customers_text_onchange():
+            st.session_state["customers_table"] = json.loads(st.session_state["customers_text_input"])
+        def junction_text_onchange():
+            st.session_state["junction_table"] = json.loads(st.session_state["junction_text_input"])
+
+        def submit_sql():
+            sql_request = st.session_state["sql_request_input"]
+            st.session_state["question"] = sql_request
+            #clear the text input so that subsequent actions don't retrigger the onchange
+            st.session_state["sql_request_input"] = ""
+            sql_query = get_chain("sql").predict(table1=st.session_state["product_schema"], 
+                                          table2=st.session_state["customers_schema"], 
+                                          table3=st.session_state["junction_schema"], 
+                                          sql_request=sql_request)
+            # use a regex to replace the table name with 'df'
+            # sql_query = re.sub(r'(?<=FROM )\w+', 'df', sql_query, flags=re.IGNORECASE)
+            logger.info(sql_query)
+            st.session_state["sql_query"] = sql_query
+
+        sql_request = st.text_input("Enter a question about the above data:", value="", on_change=submit_sql, key="sql_request_input", placeholder="Enter your query here")
+        if st.session_state["sql_query"]:
+            st.subheader("Question")
+            st.write(st.session_state["question"])
+            with st.expander("SQL Query", expanded=False):
+                st.subheader("SQL Query")
+                st.write(st.session_state["sql_query"])
+                st.write("")
+            with st.expander("SQL Results", expanded=False):
+                st.subheader("SQL Results")
+                try:
+                    query_result = query_engine.execute(st.session_state["sql_query"])
+                except (ValueError, TimeoutError, sqlite3.Error) as e:
+                    query_result = None
+                    st.error(f"The query could not be run: {e}")
+                else:
+                    if query_result.truncated:
+                        st.caption(f"Showing the first {query_engine.max_rows} rows")
+                    st.write(query_result.frame)
+            if query_result is not None:
+                st.subheader("Answer")
+                # The explanation is kept until the question or query changes instead of regenerated every rerun
+                answer_key = (st.session_state["question"], st.session_state["sql_query"])
+                if st.session_state.get("sql_answer", (None, None))[0] != answer_key:
+                    answer = get_chain("explanation")(inputs={"question":st.session_state["question"], "query_result":query_result.frame.to_dict(orient="records")})
+                    st.session_state["sql_answer"] = (answer_key, answer["text"])
+                st.text(st.session_state["sql_answer"][1])
+        with st.expander("Debug", expanded=False):
+            st.subheader("Schema")
+            st.write(st.session_state["product_schema"])
+            st.subheader("Products")
+            #format json for products table
+            products = json.dumps(st.session_state["products_table"], indent=4)
+            st.text_area(value=products, key="products_text_input", on_change=products_text_onchange, label="Products")
+            st.subheader("Customers")
+            customers = json.dumps(st.session_state["customers_table"], indent=4)
+            st.text_area(value=customers, key="customers_text_input", on_change=customers_text_onchange, label="Customers")
+            st.subheader("Junction")
+            junction = json.dumps(st.session_state["junction_table"], indent=4)
+            st.text_area(value=junction, key="junction_text_input", on_change=junction_text_onchange, label="Junction")
+            st.subheader("Session State")
+            st.write(st.session_state)
 
 ### File Upload Tab ###
 with file_upload_tab:
@@ -535,25 +307,6 @@ with file_upload_tab:
     if "document_text" not in upload_session_state:
         upload_session_state["document_text"] = ""
 
-    doc_chat_template = PromptTemplate(
-        input_variables=["context", "question"],
-        template="""
-Human: below is the contents of a document. I have a question to ask about it.
----
-Document: {context}
-
-{question}
-Assistant:
-"""
-
-    )
-
-    doc_chat_chain = LLMChain(
-        llm=llm,
-        verbose=True,
-        prompt=doc_chat_template,
-        llm_kwargs={"stop_sequences": ["Question:"]},
-    )
     st.caption("Upload a text or pdf file(s) and chat with them")
     uploaded_files = st.file_uploader("Choose a file", accept_multiple_files=True)
     if uploaded_files is not None:
@@ -581,7 +334,7 @@ Assistant:
 
         if user_input:
             upload_session_state['past'].append(user_input)
-            result = doc_chat_chain({"question":user_input, "context": upload_session_state['document_text']})
+            result = get_chain("doc_chat")({"question":user_input, "context": upload_session_state['document_text']})
             upload_session_state['generated'].append(result["text"])
 
     if upload_session_state["generated"]:
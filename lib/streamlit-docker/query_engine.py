@@ -0,0 +1,133 @@
+"""Per-session SQL engine for the Data Query tab.
+
+Each session keeps one in-memory SQLite database. Tables are loaded once and
+only reloaded when their rows change. Queries must be a single SELECT; they
+run read-only under a time limit and a row limit, and results are cached by
+SQL text until a table changes.
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict, namedtuple
+
+import pandas as pd
+
+QueryResult = namedtuple("QueryResult", ["frame", "truncated", "seconds", "cached"])
+
+
+def _strip_comments(sql):
+    """`sql` without comments, raising if it holds more than one statement."""
+    out = []
+    i = 0
+    quote = None
+    while i < len(sql):
+        char = sql[i]
+        if quote:
+            out.append(char)
+            if char == quote:
+                quote = None
+            i += 1
+        elif char in ("'", '"', '`'):
+            quote = char
+            out.append(char)
+            i += 1
+        elif sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = len(sql) if end == -1 else end
+        elif sql.startswith("/*", i):
+            end = sql.find("*/", i + 2)
+            i = len(sql) if end == -1 else end + 2
+            out.append(" ")
+        elif char == ";":
+            if sql[i + 1:].strip(" \t\r\n;"):
+                raise ValueError("Only a single SQL statement can be run")
+            break
+        else:
+            out.append(char)
+            i += 1
+    if quote:
+        raise ValueError("The query has an unterminated quoted string")
+    return "".join(out).strip()
+
+
+def validate_select(sql):
+    """The statement to run for `sql`, which must be exactly one SELECT (optionally with a WITH clause)."""
+    statement = _strip_comments(sql)
+    words = statement.split(None, 1)
+    if not words or words[0].upper() not in ("SELECT", "WITH"):
+        raise ValueError("Only SELECT queries can be run")
+    return statement
+
+
+def _sql_value(value):
+    # Generated rows sometimes hold nested lists or objects, which SQLite cannot store
+    return json.dumps(value) if isinstance(value, (dict, list)) else value
+
+
+class QueryEngine:
+    def __init__(self, timeout_seconds=5, max_rows=1000, max_cached_results=32):
+        self.timeout_seconds = timeout_seconds
+        self.max_rows = max_rows
+        self.max_cached_results = max_cached_results
+        # Streamlit may run a session's reruns on different threads, never two at once
+        self.connection = sqlite3.connect(":memory:", check_same_thread=False)
+        self.connection.execute("PRAGMA query_only = ON")
+        self._fingerprints = {}
+        self._version = 0
+        self._results = OrderedDict()
+
+    def register(self, name, rows):
+        """Load `rows` (a list of dicts) as table `name`, unless the same rows are already loaded."""
+        fingerprint = hashlib.sha256(json.dumps(rows, sort_keys=True, default=str).encode()).hexdigest()
+        if self._fingerprints.get(name) == fingerprint:
+            return False
+        frame = pd.DataFrame([{key: _sql_value(value) for key, value in row.items()} for row in rows])
+        self.connection.execute("PRAGMA query_only = OFF")
+        try:
+            if len(frame.columns):
+                frame.to_sql(name, self.connection, if_exists="replace", index=False)
+            else:
+                # No rows means no columns to create a table from; keep the columns of the table
+                # already loaded, if any, so queries against it return no rows instead of failing
+                exists = self.connection.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+                if exists:
+                    self.connection.execute(f'DELETE FROM "{name}"')
+                    self.connection.commit()
+        finally:
+            self.connection.execute("PRAGMA query_only = ON")
+        self._fingerprints[name] = fingerprint
+        self._version += 1
+        self._results.clear()
+        return True
+
+    def execute(self, sql):
+        statement = validate_select(sql)
+        key = (self._version, statement)
+        if key in self._results:
+            self._results.move_to_end(key)
+            return self._results[key]._replace(cached=True)
+
+        deadline = time.monotonic() + self.timeout_seconds
+        # A non-zero return from the progress handler interrupts the running query
+        self.connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        start = time.perf_counter()
+        try:
+            cursor = self.connection.execute(statement)
+            rows = cursor.fetchmany(self.max_rows + 1)
+            columns = [column[0] for column in cursor.description or []]
+        except sqlite3.OperationalError as e:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"The query took longer than {self.timeout_seconds} seconds") from e
+            raise
+        finally:
+            self.connection.set_progress_handler(None, 0)
+
+        truncated = len(rows) > self.max_rows
+        result = QueryResult(pd.DataFrame(rows[:self.max_rows], columns=columns), truncated,
+                             time.perf_counter() - start, False)
+        self._results[key] = result
+        while len(self._results) > self.max_cached_results:
+            self._results.popitem(last=False)
+        return result
@@ -5,6 +5,7 @@ import sys
 import json
 import os
 import shutil
+import re
 
 def check_cdk_cli():
     if shutil.which('cdk') is None:
@@ -64,6 +65,7 @@ def deploy(stack=None):
     run_command(command)
     print("*** ✅ Stack deployed successfully ***")
     print("If this is the first time you've deployed this stack, you will need to wait for the Knowledge Base to finish crawling the web. This can take a while.")
+    print(f"Run ./start.py ingest --customer \"{context['customerName']}\" --status to follow the crawl.")
     print("You can check the status of the Knowledge Base in the AWS console at https://us-east-1.console.aws.amazon.com/bedrock/home?region=us-east-1#/knowledge-bases")
 
 def destroy(stack=None):
@@ -83,6 +85,54 @@ def destroy(stack=None):
     print(f"*** 🚀 Destroying {'all stacks' if not stack else stack} ***")
     run_command(command)
 
+def stack_outputs(stack_name):
+    import boto3
+    cloudformation = boto3.client('cloudformation')
+    stack = cloudformation.describe_stacks(StackName=stack_name)['Stacks'][0]
+    return {output['OutputKey']: output['OutputValue'] for output in stack.get('Outputs', [])}
+
+def ingest(status_only=False, wait=True, timeout=3600):
+    import boto3
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lib', 'kb-stack', 'ingestion-monitor'))
+    from ingestion import format_summary, latest_job, start_if_idle, summarize, wait_for_job
+
+    context = load_context()
+    # Same stack name as bin/kb-demo.ts
+    stack_name = "KB-" + re.sub(r'[^\w]', '', context['customerName']) + "-KBStack"
+    outputs = stack_outputs(stack_name)
+    if 'KnowledgeBaseId' not in outputs or 'DataSourceId' not in outputs:
+        print(f"*** ⛔️ {stack_name} has no KnowledgeBaseId/DataSourceId outputs, deploy the kb stack first ***")
+        sys.exit(1)
+    knowledge_base_id = outputs['KnowledgeBaseId']
+    data_source_id = outputs['DataSourceId']
+    bedrock_agent = boto3.client('bedrock-agent')
+
+    if status_only:
+        job = latest_job(bedrock_agent, knowledge_base_id, data_source_id)
+        if job is None:
+            print("No ingestion jobs found for this data source.")
+            return
+        if not wait:
+            print(format_summary(summarize(job)))
+            return
+    else:
+        print(f"*** 🕷️ Starting re-crawl of data source {data_source_id} ***")
+        job, started = start_if_idle(bedrock_agent, knowledge_base_id, data_source_id, 'Re-crawl started with start.py ingest')
+        if not wait:
+            print(format_summary(summarize(job)))
+            return
+
+    job = wait_for_job(bedrock_agent, knowledge_base_id, data_source_id, job['ingestionJobId'],
+                       timeout_seconds=timeout, on_progress=lambda summary: print(format_summary(summary)))
+    summary = summarize(job)
+    if summary['status'] == 'COMPLETE':
+        print("*** ✅ Ingestion complete ***")
+    elif summary['status'] in ('FAILED', 'STOPPED'):
+        print(f"*** ⛔️ Ingestion {summary['status'].lower()} ***")
+        sys.exit(1)
+    else:
+        print(f"*** Still {summary['status']} after {timeout}s, run ./start.py ingest --status again to keep following it ***")
+
 def synth(stack=None):
     command = "cdk synth"
     if stack:
@@ -171,16 +221,21 @@ def load_context():
         return json.load(f)
 
 def main():
-    check_cdk_cli()
-    check_docker()
-
     parser = argparse.ArgumentParser(description="CDK Deployment Script")
-    parser.add_argument("command", choices=["deploy", "destroy", "synth", "list", "create"], help="Command to execute")
+    parser.add_argument("command", choices=["deploy", "destroy", "synth", "list", "create", "ingest"], help="Command to execute")
     parser.add_argument("stack", nargs="?", choices=["app", "kb"], help="Stack to operate on (optional)")
     parser.add_argument("--customer", help="Customer name")
+    parser.add_argument("--status", action="store_true", help="ingest: follow the latest ingestion job instead of starting a re-crawl")
+    parser.add_argument("--no-wait", action="store_true", help="ingest: return without polling until the job finishes")
+    parser.add_argument("--timeout", type=int, default=3600, help="ingest: seconds to poll before giving up")
 
     args = parser.parse_args()
 
+    # Ingestion only talks to the AWS APIs
+    if args.command != "ingest":
+        check_cdk_cli()
+        check_docker()
+
     if args.command == "list":
         list_customers()
         return
@@ -201,6 +256,8 @@ def main():
         destroy(args.stack)
     elif args.command == "synth":
         synth(args.stack)
+    elif args.command == "ingest":
+        ingest(status_only=args.status, wait=not args.no_wait, timeout=args.timeout)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file